@@ -0,0 +1,79 @@
+"""Timing helpers shared by the benchmark suites."""
+
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The suites run as scripts from any directory, without the package being installed
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def measure(name: str, func, repeat: int = 10, rows: int = 0, setup=None) -> dict:
+    """Times ``func`` and measures the peak memory it allocates.
+
+    ``func`` is timed ``repeat`` times, then run once more under ``tracemalloc`` for the peak
+    memory, so that tracing does not slow down the timed runs.
+
+    :param name: The name of the benchmark in the results.
+    :type name: str
+    :param func: Called without arguments.
+    :type func: Callable[[], Any]
+    :param repeat: How many timed runs.
+    :type repeat: int
+    :param rows: Rows processed by each run, to report the throughput.
+    :type rows: int
+    :param setup: Called without arguments before every run, not timed.
+    :type setup: Callable[[], Any] | None
+    :return: The ``name``, ``repeat``, ``p50_ms``, ``p99_ms``, ``rows_per_s`` and
+             ``peak_mb`` of the benchmark.
+    :rtype: dict
+    """
+    samples = list()
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarize(name, samples, rows, peak)
+
+
+def summarize(name: str, samples: list, rows: int = 0, peak_bytes: int = 0) -> dict:
+    """Reduces the durations of the runs of a benchmark, in seconds, to its statistics."""
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    # Nearest rank, the slowest run when there are less than 100
+    p99 = samples[min(len(samples) - 1, round(0.99 * (len(samples) - 1)))]
+    return {
+        "name": name,
+        "repeat": len(samples),
+        "p50_ms": round(p50 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+        "rows_per_s": round(rows / p50) if rows and p50 else None,
+        "peak_mb": round(peak_bytes / 2**20, 2),
+    }
+
+
+def max_rss_mb() -> float:
+    """Returns the peak resident memory of this process."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def write_results(path: str, results: list):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,95 @@
+"""Benchmark of the stages of the ingestion pipeline on a synthetic workbook.
+
+Stages:
+
+* ``parse_xls``: :func:`dollar_data.utils.read_xls`, the row by row reader.
+* ``clean``: building the DataFrame of ``read_xls`` and :func:`clean_dataframe`.
+* ``filter_dates``: :func:`dollar_to_bs_rate`, the USD filter and the date conversion.
+* ``parse_rates``: :func:`dollar_data.utils.read_rates`, the columnar reader.
+* ``write_insert``: :func:`insert_into_database` of every rate into an empty table.
+* ``write_skip``: the same write again, where every row is already stored.
+
+The database is a temporary SQLite file, nothing is read from or written to the network::
+
+    python benchmarks/ingest.py --days 250 --repeat 10 --output ingest.json
+"""
+
+import argparse
+import os
+import tempfile
+
+from common import max_rss_mb, measure, write_results
+from workbooks import make_workbook
+
+
+def run(days: int, repeat: int, directory: str) -> list:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'ingest.db')}"
+    # Imported once the database is configured, it is created on import
+    import pandas as pd
+    from sqlalchemy import text
+
+    from dollar_data.database import engine, init_db
+    from dollar_data.utils import (
+        clean_dataframe,
+        dollar_to_bs_rate,
+        insert_into_database,
+        read_rates,
+        read_xls,
+    )
+
+    init_db()
+    path = os.path.join(directory, "synthetic.xls")
+    rows = make_workbook(path, days)
+    prefix = f"ingest.{days}d"
+
+    def clean():
+        df = pd.DataFrame(read_xls_rows)
+        clean_dataframe(df)
+        return df
+
+    def empty_table():
+        with engine.begin() as connection:
+            connection.execute(text('DELETE FROM "HistoricalDollar"'))
+
+    read_xls_rows = read_xls(path)
+    cleaned = clean()
+    rates = read_rates(path)
+    return [
+        measure(f"{prefix}.parse_xls", lambda: read_xls(path), repeat, rows),
+        measure(f"{prefix}.clean", clean, repeat, rows),
+        measure(
+            f"{prefix}.filter_dates", lambda: dollar_to_bs_rate(cleaned), repeat, rows
+        ),
+        measure(f"{prefix}.parse_rates", lambda: read_rates(path), repeat, rows),
+        measure(
+            f"{prefix}.write_insert",
+            lambda: insert_into_database(rates),
+            repeat,
+            rows,
+            setup=empty_table,
+        ),
+        measure(
+            f"{prefix}.write_skip", lambda: insert_into_database(rates), repeat, rows
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=250, help="sheets of the workbook")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per stage")
+    parser.add_argument("--output", help="where to write the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(args.days, args.repeat, directory)
+    for result in results:
+        result["max_rss_mb"] = max_rss_mb()
+    if args.output:
+        write_results(args.output, results)
+    for result in results:
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark of the read endpoints against a seeded SQLite database.
+
+The database gets ``--rows`` rates, spread over 20 currencies with one rate per currency and
+day, inserted by a single SQL statement. Every endpoint is requested through the Flask test
+client, both ``cold``, with the response caches emptied before every request, and ``warm``::
+
+    python benchmarks/reads.py --rows 100000 --repeat 50 --output reads.json
+
+A database that already holds the rows, e.g. a 10M rows one kept between runs with
+``--database``, is not seeded again.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from common import max_rss_mb, measure, write_results
+
+CURRENCIES = [
+    "USD",
+    "EUR",
+    "CNY",
+    "TRY",
+    "RUB",
+    "CAD",
+    "GBP",
+    "JPY",
+    "CHF",
+    "BRL",
+    "COP",
+    "MXN",
+    "ARS",
+    "CLP",
+    "PEN",
+    "INR",
+    "KRW",
+    "SEK",
+    "NOK",
+    "AUD",
+]
+SEED_STATEMENT = """
+WITH RECURSIVE days(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM days WHERE i < :days - 1),
+currencies(code) AS ({currencies})
+INSERT INTO "HistoricalDollar" (date, currency, buybid, sellask, usd_buybid, usd_sellask, day, period)
+SELECT date('1990-01-01', '+' || i || ' days'), code, 1 + i * 0.01, 1 + i * 0.0101, 1.0, 1.001,
+       CAST(strftime('%d', date('1990-01-01', '+' || i || ' days')) AS INTEGER),
+       strftime('%Y-%m', date('1990-01-01', '+' || i || ' days'))
+FROM days, currencies
+"""
+# name: (path, emptying the caches before every request)
+ENDPOINTS = {
+    "rates_daily_cold": ("/api/v1/rates?currency=USD", True),
+    "rates_daily_warm": ("/api/v1/rates?currency=USD", False),
+    "rates_monthly_cold": ("/api/v1/rates?currency=USD&resolution=monthly", True),
+    "rates_year_raw_cold": (
+        "/api/v1/rates?currency=EUR&resolution=raw&from=2000-01-01&to=2000-12-31",
+        True,
+    ),
+    "export_csv_year": (
+        "/api/v1/rates/export?currency=EUR&from=2000-01-01&to=2000-12-31",
+        False,
+    ),
+    "index_warm": ("/", False),
+}
+
+
+def seed(engine, rows: int):
+    from sqlalchemy import text
+
+    with engine.begin() as connection:
+        stored = connection.execute(text('SELECT count(*) FROM "HistoricalDollar"'))
+        if stored.scalar():
+            return
+        currencies = " UNION ALL ".join(f"SELECT '{code}'" for code in CURRENCIES)
+        statement = SEED_STATEMENT.format(currencies=currencies)
+        connection.execute(text(statement), {"days": -(-rows // len(CURRENCIES))})
+
+
+def run(rows: int, repeat: int, database: str) -> list:
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    # Imported once the database is configured, the app creates it on import
+    from dollar_data.database import engine, init_db
+
+    init_db()
+    seed(engine, rows)
+
+    from dollar_data.web import api
+    from dollar_data.web.app import app, pages
+
+    caches = [api.rates_responses, api.analytics_responses, api.chart_responses, pages]
+    client = app.test_client()
+
+    def request(path):
+        response = client.get(path)
+        response.get_data()
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}")
+
+    def empty_caches():
+        for responses in caches:
+            responses.cache.clear()
+
+    results = list()
+    for name, (path, cold) in ENDPOINTS.items():
+        results.append(
+            measure(
+                f"reads.{rows}.{name}",
+                lambda: request(path),
+                repeat,
+                setup=empty_caches if cold else None,
+            )
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, default=100_000, help="rates of the database"
+    )
+    parser.add_argument("--repeat", type=int, default=50, help="requests per endpoint")
+    parser.add_argument(
+        "--database", help="SQLite file to use, a temporary one by default"
+    )
+    parser.add_argument("--output", help="where to write the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = args.database or os.path.join(directory, "reads.db")
+        results = run(args.rows, args.repeat, database)
+    for result in results:
+        result["max_rss_mb"] = max_rss_mb()
+    if args.output:
+        write_results(args.output, results)
+    for result in results:
+        print(result)
+    sys.stdout.flush()
+    # The telemetry exporters configured by the app retry their endpoint on exit
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Runs the benchmark suites and compares the results with the regression thresholds.
+
+Every suite runs in its own interpreter, on synthetic data and temporary SQLite databases, so
+the benchmarks need neither the network nor a configured database and can run in CI::
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --rows 10000 100000 10000000
+
+The thresholds in ``thresholds.json`` are keyed by benchmark name and give a maximum
+``p99_ms`` and ``peak_mb`` and a minimum ``rows_per_s``, with a wide margin over the times of a
+laptop so that slower CI runners pass. The script exits with 1 when a threshold is crossed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import startup
+from common import ROOT, write_results
+
+BENCHMARKS_DIR = os.path.join(ROOT, "benchmarks")
+THRESHOLDS_FILE = os.path.join(BENCHMARKS_DIR, "thresholds.json")
+# metric: (how it is compared, how it is shown)
+LIMITS = {
+    "p99_ms": (lambda value, limit: value <= limit, "<="),
+    "peak_mb": (lambda value, limit: value <= limit, "<="),
+    "rows_per_s": (lambda value, limit: value >= limit, ">="),
+}
+
+
+def run_suite(script: str, *args, timeout: float = 3600.0) -> list:
+    """Runs a suite in a new interpreter and returns its results."""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "results.json")
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(BENCHMARKS_DIR, script),
+                *args,
+                "--output",
+                output,
+            ],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            timeout=timeout,
+            check=True,
+        )
+        with open(output) as f:
+            return json.load(f)
+
+
+def run_startup() -> list:
+    result = startup.measure()
+    loaded = [name for name in startup.FORBIDDEN_MODULES if name in result["modules"]]
+    return [
+        {
+            "name": "startup.import",
+            "repeat": 1,
+            "p50_ms": result["total_ms"],
+            "p99_ms": result["total_ms"],
+            "rows_per_s": None,
+            "peak_mb": round(result["rss_mb"], 1),
+            "forbidden_modules": loaded,
+        }
+    ]
+
+
+def check(results: list, thresholds: dict) -> list:
+    """Returns a message for every threshold crossed by the results."""
+    failures = list()
+    for result in results:
+        if result.get("forbidden_modules"):
+            failures.append(
+                f"{result['name']}: loaded {', '.join(result['forbidden_modules'])}"
+            )
+        for metric, limit in thresholds.get(result["name"], dict()).items():
+            within, sign = LIMITS[metric]
+            value = result.get(metric)
+            if value is not None and not within(value, limit):
+                failures.append(
+                    f"{result['name']}: {metric} {value} not {sign} {limit}"
+                )
+    return failures
+
+
+def print_table(results: list):
+    print(
+        f"{'benchmark':<42} {'p50 ms':>9} {'p99 ms':>9} {'rows/s':>11} {'peak MB':>8}"
+    )
+    for result in results:
+        rows_per_s = result["rows_per_s"]
+        print(
+            f"{result['name']:<42} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{rows_per_s if rows_per_s is not None else '-':>11} {result['peak_mb']:>8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="sizes of the databases of the read benchmarks",
+    )
+    parser.add_argument("--days", type=int, default=250, help="sheets of the workbook")
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="timed runs per benchmark"
+    )
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument("--output", help="where to write the results as JSON")
+    args = parser.parse_args()
+
+    repeat = ["--repeat", str(args.repeat)]
+    results = run_suite("ingest.py", "--days", str(args.days), *repeat)
+    for rows in args.rows:
+        results.extend(run_suite("reads.py", "--rows", str(rows), *repeat))
+    results.extend(run_startup())
+    if args.output:
+        write_results(args.output, results)
+    print_table(results)
+
+    with open(args.thresholds) as f:
+        failures = check(results, json.load(f))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Startup benchmark of the web workers.
+
+Imports the WSGI application in a fresh interpreter with ``python -X importtime``, reports the
+slowest imports, the total import time and the peak memory, and fails when a module of the
+ingestion or plotting stacks gets imported or when the import takes longer than a threshold::
+
+    python benchmarks/startup.py --max-ms 1500
+
+The application is imported from a temporary directory, so the database it creates there is
+thrown away.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Only the job runner and the chart renderer processes may load these
+FORBIDDEN_MODULES = (
+    "pandas",
+    "numpy",
+    "matplotlib",
+    "xlrd",
+    "bs4",
+    "requests",
+    "apscheduler",
+    "pyarrow",
+    "dollar_data.utils",
+    "dollar_data.jobs",
+)
+# The exporters keep the interpreter alive on exit, hence os._exit
+PROBE = """
+import os, resource, sys
+import {module}
+print(",".join(sorted(sys.modules)))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+sys.stdout.flush()
+os._exit(0)
+"""
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str) -> list:
+    """Returns the ``(cumulative_us, self_us, module)`` of every import, slowest first."""
+    imports = list()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        imports.append((int(cumulative_us), int(self_us), module.strip()))
+    return sorted(imports, reverse=True)
+
+
+def measure(module: str = "dollar_data.wsgi", timeout: float = 120.0) -> dict:
+    """Imports ``module`` in a new interpreter.
+
+    :param module: The module to import.
+    :type module: str
+    :param timeout: Seconds to wait for the import.
+    :type timeout: float
+    :return: The ``imports`` as returned by :func:`parse_importtime`, the ``total_ms`` import
+             time, the ``modules`` that were loaded and the peak ``rss_mb``.
+    :rtype: dict
+    """
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            check=True,
+        )
+    modules, rss_kb = result.stdout.strip().splitlines()[-2:]
+    imports = parse_importtime(result.stderr)
+    top_level = [entry for entry in imports if entry[2] == module]
+    return {
+        "imports": imports,
+        "total_ms": top_level[0][0] / 1000 if top_level else 0.0,
+        "modules": set(modules.split(",")),
+        "rss_mb": int(rss_kb) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="dollar_data.wsgi", help="module to import")
+    parser.add_argument(
+        "--max-ms", type=float, default=1500.0, help="fail above this import time"
+    )
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to show")
+    args = parser.parse_args()
+
+    result = measure(args.module)
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative_us, self_us, module in result["imports"][: args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {module}")
+    print(
+        f"\nImport of {args.module}: {result['total_ms']:.0f} ms, peak RSS {result['rss_mb']:.0f} MB"
+    )
+
+    failures = list()
+    loaded = [name for name in FORBIDDEN_MODULES if name in result["modules"]]
+    if loaded:
+        failures.append(
+            f"modules that the web workers should not load: {', '.join(loaded)}"
+        )
+    if result["total_ms"] > args.max_ms:
+        failures.append(f"import took more than {args.max_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Synthetic workbooks in the format of the BCV statistics page.
+
+Every business day gets a sheet named after its date (``ddmmyyyy``) with the header of the
+real workbooks and one row per currency from row 10 on: code, country, USD bid and ask and
+bolívar bid and ask. The rates follow a seeded random walk, so the same arguments always give
+the same workbook::
+
+    python benchmarks/workbooks.py synthetic.xls --days 250 --currencies 21
+"""
+
+import argparse
+import datetime
+import random
+
+import xlwt
+
+# Rows of the rates in every sheet, as read by dollar_data.utils.read_xls
+FIRST_ROW = 10
+CURRENCIES = [
+    ("EUR", "U.M.E."),
+    ("CNY", "China"),
+    ("TRY", "Turquía"),
+    ("RUB", "Rusia"),
+    ("USD", "E.E.U.U."),
+    ("CAD", "Canadá"),
+    ("GBP", "Reino Unido"),
+    ("JPY", "Japón"),
+    ("CHF", "Suiza"),
+    ("BRL", "Brasil"),
+    ("COP", "Colombia"),
+    ("MXN", "México"),
+    ("ARS", "Argentina"),
+    ("CLP", "Chile"),
+    ("PEN", "Perú"),
+    ("INR", "India"),
+    ("KRW", "Corea del Sur"),
+    ("SEK", "Suecia"),
+    ("NOK", "Noruega"),
+    ("DKK", "Dinamarca"),
+    ("AUD", "Australia"),
+]
+
+
+def make_workbook(
+    path: str,
+    days: int = 250,
+    currencies: int = len(CURRENCIES),
+    start: datetime.date = datetime.date(2024, 1, 2),
+    seed: int = 0,
+) -> int:
+    """Writes a workbook with a sheet per business day from ``start``.
+
+    :param path: Where the workbook is written.
+    :type path: str
+    :param days: How many sheets.
+    :type days: int
+    :param currencies: How many currencies per sheet, at most ``len(CURRENCIES)``.
+    :type currencies: int
+    :param start: The date of the first sheet.
+    :type start: datetime.date
+    :param seed: Seed of the random walk of the rates.
+    :type seed: int
+    :return: How many rates were written.
+    :rtype: int
+    """
+    generator = random.Random(seed)
+    usd_rates = [
+        1.0 if code == "USD" else generator.uniform(0.001, 2.0)
+        for code, _ in CURRENCIES
+    ]
+    bolivar = 36.0
+    wb = xlwt.Workbook()
+    date = start
+    for _ in range(days):
+        while date.weekday() >= 5:
+            date += datetime.timedelta(days=1)
+        sheet = wb.add_sheet(date.strftime("%d%m%Y"))
+        sheet.write(1, 1, "BANCO CENTRAL DE VENEZUELA")
+        sheet.write(4, 1, f"Fecha Valor: {date.strftime('%d/%m/%Y')}")
+        sheet.write(8, 1, "Moneda")
+        sheet.write(8, 3, "Compra (BID) ME/USD")
+        sheet.write(8, 5, "Compra (BID) Bs./ME")
+        bolivar *= 1 + generator.gauss(0.001, 0.005)
+        for i, (code, country) in enumerate(CURRENCIES[:currencies]):
+            if code != "USD":
+                usd_rates[i] *= 1 + generator.gauss(0, 0.003)
+            row = FIRST_ROW + i
+            sheet.write(row, 1, code)
+            sheet.write(row, 2, country)
+            sheet.write(row, 3, usd_rates[i])
+            sheet.write(row, 4, usd_rates[i] * 1.001)
+            sheet.write(row, 5, bolivar / usd_rates[i])
+            sheet.write(row, 6, bolivar / usd_rates[i] * 1.001)
+        sheet.write(FIRST_ROW + len(CURRENCIES) + 1, 1, "Fuente: BCV")
+        date += datetime.timedelta(days=1)
+    wb.save(path)
+    return days * currencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--currencies", type=int, default=len(CURRENCIES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rates = make_workbook(args.path, args.days, args.currencies, seed=args.seed)
+    print(f"{rates} rates written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""Alerts on the rates, evaluated in batch after every ingestion and sent in the background.
+
+:func:`evaluate_alerts` checks every ``AlertSubscription`` of the currencies that changed against
+their new rows at once. The subscriptions of a currency that share a kind, window and direction
+form a group whose thresholds are sorted, so the thresholds crossed between two consecutive
+rates are a slice of the sorted array found with two binary searches: the cost of a new row
+does not grow with the number of subscriptions.
+
+:class:`AlertSender` delivers the notifications from a bounded queue in worker threads, so the
+ingestion job never waits on a webhook, and retries failed deliveries with an exponential
+backoff. Notifications that do not fit in the queue are dropped and counted.
+
+A stand-in webhook that prints what it receives helps to try subscriptions locally::
+
+    python -m dollar_data.alerts receive --bind 127.0.0.1:9000
+    python -m dollar_data.alerts evaluate --since 2024-05-01
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+from opentelemetry import metrics
+from sqlalchemy import String, func, select, type_coerce, update
+
+from dollar_data.arrays import fetch_array
+from dollar_data.database import engine
+from dollar_data.models import AlertSubscription, Dollar
+
+# Deliveries running at the same time and notifications waiting for one
+ALERT_WORKERS = int(os.environ.get("ALERT_WORKERS", 4))
+ALERT_QUEUE_SIZE = int(os.environ.get("ALERT_QUEUE_SIZE", 10_000))
+# Attempts after the first one, waiting ALERT_BACKOFF * 2 ** attempt seconds before each
+ALERT_RETRIES = int(os.environ.get("ALERT_RETRIES", 3))
+ALERT_BACKOFF = float(os.environ.get("ALERT_BACKOFF", 1.0))
+# Seconds a webhook or the SMTP server may take to answer
+ALERT_TIMEOUT = 10
+# Server of the mailto: targets, they fail without one
+SMTP_HOST = os.environ.get("SMTP_HOST")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 25))
+ALERT_FROM = os.environ.get("ALERT_FROM", "dollar-data@localhost")
+# Subscriptions updated by a single statement, below the parameter limit of every database
+UPDATE_BATCH_SIZE = 500
+
+SUBSCRIPTION_DTYPE = [
+    ("id", "int64"),
+    ("currency", "U3"),
+    ("kind", "U6"),
+    ("direction", "U5"),
+    ("threshold", "float64"),
+    ("window", "int64"),
+]
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+notifications_counter = meter.create_counter(
+    "dollar_data.alerts.notifications",
+    description="Alert notifications by result: delivered, failed or dropped",
+)
+
+
+@dataclass(frozen=True)
+class Notification:
+    """A crossing of the threshold of a subscription, to be sent to its target."""
+
+    subscription: int
+    target: str
+    payload: dict
+
+
+def evaluate_alerts(since: dict) -> list:
+    """Finds the subscriptions whose threshold was crossed by the rows written from ``since``.
+
+    A subscription fires once per crossing: for ``above``, when the value goes from below the
+    threshold to the threshold or more, for ``below`` the other way around. The value before
+    the first new row is the one of the last row before it, so the first new row can fire too.
+    The subscriptions that fired get their ``triggered_at`` set.
+
+    :param since: The oldest date written of every currency, as returned by the ingestion.
+    :type since: dict[str, datetime.date | pandas.Timestamp]
+    :return: The notifications to send, in the order of the rows that fired them.
+    :rtype: list[Notification]
+    """
+    with engine.connect() as connection:
+        subscriptions = fetch_array(
+            select(
+                AlertSubscription.id,
+                AlertSubscription.currency,
+                AlertSubscription.kind,
+                AlertSubscription.direction,
+                AlertSubscription.threshold,
+                func.coalesce(AlertSubscription.window, 0),
+            ).where(AlertSubscription.currency.in_(list(since))),
+            SUBSCRIPTION_DTYPE,
+            connection,
+        )
+        fired = list()
+        for currency in np.unique(subscriptions["currency"]):
+            of_currency = subscriptions[subscriptions["currency"] == currency]
+            start = np.datetime64(since[str(currency)], "D")
+            dates, rates = _series(
+                connection, str(currency), start, of_currency["window"].max()
+            )
+            fired.extend(_evaluate_currency(of_currency, dates, rates, start))
+    if not fired:
+        return list()
+    fired.sort(key=lambda notification: notification["date"])
+    return _mark_triggered(fired)
+
+
+def _series(connection, currency: str, start, window: int) -> tuple:
+    # The rows from the start of the longest window before the new ones, and a week more to
+    # get past weekends and holidays
+    first = start - np.timedelta64(int(window) + 7, "D")
+    rows = fetch_array(
+        select(type_coerce(Dollar.date, String), Dollar.buybid)
+        .where(
+            Dollar.currency == currency,
+            Dollar.date >= first.item(),
+            Dollar.buybid.is_not(None),
+        )
+        .order_by(Dollar.date),
+        [("date", "datetime64[D]"), ("rate", "float64")],
+        connection,
+    )
+    return rows["date"], rows["rate"]
+
+
+def _evaluate_currency(subscriptions, dates, rates, start) -> list:
+    # Index of the first new row, the rows before it only give the value the path starts from
+    first_new = int(np.searchsorted(dates, start))
+    if first_new == len(dates):
+        return list()
+    groups, inverse = np.unique(
+        subscriptions[["kind", "window", "direction"]], return_inverse=True
+    )
+    fired = list()
+    for g, group in enumerate(groups):
+        members = subscriptions[inverse.ravel() == g]
+        members = members[np.argsort(members["threshold"], kind="stable")]
+        values = _values(dates, rates, str(group["kind"]), int(group["window"]))
+        offset = max(first_new - 1, 0)
+        steps = crossings(
+            values[offset:], members["threshold"], str(group["direction"])
+        )
+        crossed = steps >= 0
+        for subscription, row in zip(members[crossed], steps[crossed] + offset + 1):
+            fired.append(_payload(subscription, dates[row], values[row], rates[row]))
+    return fired
+
+
+def _values(dates, rates, kind: str, window: int):
+    if kind == "level":
+        return rates
+    # Change in percent from the rate in effect ``window`` days before every row
+    base = np.searchsorted(dates, dates - np.timedelta64(window, "D"), side="right") - 1
+    found = base >= 0
+    return np.where(found, rates / rates[np.maximum(base, 0)] * 100 - 100, np.nan)
+
+
+def crossings(path, thresholds, direction: str):
+    """Returns the first step of ``path`` that crosses every threshold.
+
+    :param path: The values in order, the first one is only a starting point.
+    :type path: numpy.ndarray
+    :param thresholds: The thresholds, sorted.
+    :type thresholds: numpy.ndarray
+    :param direction: ``above`` for upward crossings, ``below`` for downward ones.
+    :type direction: str
+    :return: For every threshold, the index in ``path[1:]`` of the first value that crossed it,
+             -1 if none did.
+    :rtype: numpy.ndarray
+
+    :Example:
+
+    .. code-block:: python
+
+        crossings(np.array([36.0, 36.5, 37.2]), np.array([36.2, 37.0, 38.0]), "above")
+        # array([ 0,  1, -1])
+    """
+    before, after = path[:-1], path[1:]
+    if direction == "above":
+        # Thresholds in (before, after]
+        low = np.searchsorted(thresholds, before, side="right")
+        high = np.searchsorted(thresholds, after, side="right")
+    else:
+        # Thresholds in [after, before)
+        low = np.searchsorted(thresholds, after, side="left")
+        high = np.searchsorted(thresholds, before, side="left")
+    high = np.where(np.isnan(before) | np.isnan(after), low, high)
+    first = np.full(len(thresholds), -1)
+    # From the last step to the first, so that the first crossing of a threshold is kept
+    for step in np.flatnonzero(high > low)[::-1].tolist():
+        first[low[step] : high[step]] = step
+    return first
+
+
+def _payload(subscription, date, value, rate) -> dict:
+    return {
+        "subscription": int(subscription["id"]),
+        "currency": str(subscription["currency"]),
+        "kind": str(subscription["kind"]),
+        "direction": str(subscription["direction"]),
+        "threshold": float(subscription["threshold"]),
+        "window": int(subscription["window"]) or None,
+        "date": str(date),
+        "value": float(value),
+        "rate": float(rate),
+    }
+
+
+def _mark_triggered(fired: list) -> list:
+    ids = sorted({payload["subscription"] for payload in fired})
+    targets = dict()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with engine.begin() as connection:
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            batch = ids[start : start + UPDATE_BATCH_SIZE]
+            targets.update(
+                connection.execute(
+                    select(AlertSubscription.id, AlertSubscription.target).where(
+                        AlertSubscription.id.in_(batch)
+                    )
+                ).all()
+            )
+            connection.execute(
+                update(AlertSubscription)
+                .where(AlertSubscription.id.in_(batch))
+                .values(triggered_at=now)
+            )
+    # Subscriptions deleted since they were read are not notified
+    return [
+        Notification(payload["subscription"], targets[payload["subscription"]], payload)
+        for payload in fired
+        if payload["subscription"] in targets
+    ]
+
+
+class AlertSender:
+    """Delivers notifications from a bounded queue in background threads.
+
+    :param workers: How many deliveries run at the same time.
+    :type workers: int
+    :param queue_size: How many notifications can wait for a delivery.
+    :type queue_size: int
+    :param retries: How many times a failed delivery is retried.
+    :type retries: int
+    :param backoff: Seconds before the first retry, doubled before every other one.
+    :type backoff: float
+    :param session: The session of the webhook requests, a new one by default.
+    :type session: requests.Session | None
+    """
+
+    def __init__(
+        self,
+        workers: int = ALERT_WORKERS,
+        queue_size: int = ALERT_QUEUE_SIZE,
+        retries: int = ALERT_RETRIES,
+        backoff: float = ALERT_BACKOFF,
+        session=None,
+    ):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session if session is not None else requests.Session()
+        self.queue = queue.Queue(queue_size)
+        self._threads = list()
+        self._lock = threading.Lock()
+
+    def submit(self, notification: Notification) -> bool:
+        """Queues a notification without waiting.
+
+        :param notification: The notification to deliver.
+        :type notification: Notification
+        :return: False if the queue is full and the notification was dropped.
+        :rtype: bool
+        """
+        self._start()
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            notifications_counter.add(1, {"result": "dropped"})
+            logger.warning(
+                "Alert queue full, dropping the notification of subscription %s.",
+                notification.subscription,
+            )
+            return False
+        return True
+
+    def join(self):
+        """Waits until every queued notification was delivered or given up on."""
+        self.queue.join()
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            notification = self.queue.get()
+            try:
+                self._deliver(notification)
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, notification: Notification):
+        for attempt in range(self.retries + 1):
+            try:
+                deliver(notification, self.session)
+            except Exception as e:
+                if attempt == self.retries or not _retryable(e):
+                    notifications_counter.add(1, {"result": "failed"})
+                    logger.warning(
+                        "Could not notify %s of subscription %s: %r",
+                        notification.target,
+                        notification.subscription,
+                        e,
+                    )
+                    return
+                time.sleep(self.backoff * 2**attempt)
+            else:
+                notifications_counter.add(1, {"result": "delivered"})
+                return
+
+
+def _retryable(error: Exception) -> bool:
+    # Timeouts, refused connections, 5xx and 429 responses may work later, other errors not
+    if isinstance(error, requests.HTTPError):
+        return error.response.status_code >= 500 or error.response.status_code in (
+            408,
+            429,
+        )
+    return isinstance(
+        error, (requests.RequestException, smtplib.SMTPException, OSError)
+    )
+
+
+def deliver(notification: Notification, session=requests):
+    """Sends a notification to its target, a webhook or a ``mailto:`` address.
+
+    Webhooks receive the payload as a JSON body, email addresses as the body of the message.
+
+    :param notification: The notification to send.
+    :type notification: Notification
+    :param session: The session of the webhook request.
+    :type session: requests.Session
+    :raises requests.exceptions.RequestException: If the webhook does not answer with a 2xx.
+    :raises smtplib.SMTPException: If the SMTP server rejects the message.
+    :raises ValueError: If the target is neither a webhook nor an email address, or
+                        ``SMTP_HOST`` is not set for an email address.
+    """
+    target, payload = notification.target, notification.payload
+    if target.startswith(("http://", "https://")):
+        response = session.post(target, json=payload, timeout=ALERT_TIMEOUT)
+        response.raise_for_status()
+    elif target.startswith("mailto:"):
+        if SMTP_HOST is None:
+            raise ValueError("SMTP_HOST is not set")
+        message = EmailMessage()
+        message["From"] = ALERT_FROM
+        message["To"] = target.removeprefix("mailto:")
+        message["Subject"] = (
+            f"{payload['currency']} {payload['kind']} {payload['direction']} "
+            f"{payload['threshold']:g} on {payload['date']}"
+        )
+        message.set_content(json.dumps(payload, indent=2))
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=ALERT_TIMEOUT) as smtp:
+            smtp.send_message(message)
+    else:
+        raise ValueError(f"Unsupported target {target!r}")
+
+
+@functools.cache
+def default_sender() -> AlertSender:
+    """Returns the sender shared by the jobs of this process."""
+    return AlertSender()
+
+
+def notify_subscribers(since: dict, sender: AlertSender | None = None) -> int:
+    """Evaluates the subscriptions against the rows written from ``since`` and queues the
+    notifications, see :func:`evaluate_alerts`.
+
+    :param since: The oldest date written of every currency.
+    :type since: dict
+    :param sender: The sender, :func:`default_sender` by default.
+    :type sender: AlertSender | None
+    :return: How many notifications were queued.
+    :rtype: int
+    """
+    sender = sender if sender is not None else default_sender()
+    return sum(sender.submit(notification) for notification in evaluate_alerts(since))
+
+
+class WebhookStandIn(BaseHTTPRequestHandler):
+    """Prints the body of every POST request and answers ``204 No Content``."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        print(body.decode(errors="replace"), flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    receive = commands.add_parser("receive", help="run a stand-in webhook")
+    receive.add_argument("--bind", default="127.0.0.1:9000")
+    evaluate = commands.add_parser(
+        "evaluate", help="send the alerts of the rows stored from a date"
+    )
+    evaluate.add_argument("--since", type=datetime.date.fromisoformat, required=True)
+    args = parser.parse_args()
+
+    if args.command == "receive":
+        host, _, port = args.bind.rpartition(":")
+        ThreadingHTTPServer((host, int(port)), WebhookStandIn).serve_forever()
+        return
+
+    with engine.connect() as connection:
+        currencies = connection.execute(
+            select(AlertSubscription.currency).distinct()
+        ).scalars()
+        since = dict.fromkeys(currencies, args.since)
+    sender = AlertSender()
+    print(f"{notify_subscribers(since, sender)} notifications queued.")
+    sender.join()
+
+
+if __name__ == "__main__":
+    main()
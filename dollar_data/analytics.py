@@ -0,0 +1,206 @@
+"""Precomputed aggregates of the rates, kept in the ``RateAggregate`` table.
+
+For every currency and resolution (``daily``, ``weekly`` and ``monthly``) the table holds the
+OHLC of the ``buybid`` of each period and, over a rolling window of :data:`WINDOWS` periods, the
+mean of the close, the volatility of the log returns and the devaluation of the bolívar. The API
+reads these rows as they are, so analytic queries do not depend on the length of the history.
+
+After each ingestion :func:`refresh_aggregates` recomputes only the periods from the oldest
+written date onwards, plus the few periods before them that the rolling windows need.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import select, text
+
+from dollar_data.database import engine
+from dollar_data.models import Dollar, RateAggregate
+from dollar_data.upsert import bump_data_version, record_changes
+
+# Periods of the rolling statistics: about a month of business days, a quarter and a year
+WINDOWS = {"daily": 20, "weekly": 13, "monthly": 12}
+# pandas frequency of the periods of each resolution, weeks start on Monday
+FREQUENCIES = {"weekly": "W-SUN", "monthly": "M"}
+AGGREGATE_FIELDS = [
+    "period_start",
+    "period_end",
+    "open",
+    "high",
+    "low",
+    "close",
+    "change",
+    "rolling_mean",
+    "volatility",
+    "devaluation",
+]
+UPSERT_AGGREGATES_STATEMENT = text(
+    'INSERT INTO "RateAggregate" '
+    f'(currency, resolution, {", ".join(AGGREGATE_FIELDS)}) '
+    f'VALUES (:currency, :resolution, {", ".join(f":{field}" for field in AGGREGATE_FIELDS)}) '
+    "ON CONFLICT (currency, resolution, period_start) DO UPDATE SET "
+    + ", ".join(f"{field} = excluded.{field}" for field in AGGREGATE_FIELDS[1:])
+)
+
+
+def compute_aggregates(rates: DataFrame, resolution: str) -> DataFrame:
+    """Aggregates the daily rates of a currency into periods.
+
+    ``change`` is the relative change of the close from the previous period, ``rolling_mean``
+    the mean close and ``volatility`` the standard deviation of the log returns over the last
+    ``WINDOWS[resolution]`` periods. ``devaluation`` is the share of its value that the bolívar
+    lost against the currency over that window, ``1 - previous_close / close``. They are NaN
+    while there are not enough previous periods.
+
+    :param rates: The ``date`` and ``buybid`` of every published day, sorted by date.
+    :type rates: DataFrame
+    :param resolution: ``daily``, ``weekly`` or ``monthly``.
+    :type resolution: str
+    :return: One row per period with the :data:`AGGREGATE_FIELDS` columns.
+    :rtype: DataFrame
+
+    :Example:
+
+    .. code-block:: python
+
+        rates = pd.DataFrame({"date": pd.to_datetime(["2024-01-02", "2024-01-03"]), "buybid": [36.0, 36.3]})
+        compute_aggregates(rates, "weekly")
+        #   period_start period_end  open  high   low  close  change  ...
+        # 0   2024-01-01 2024-01-03  36.0  36.3  36.0   36.3     NaN  ...
+    """
+    dates = pd.to_datetime(rates["date"])
+    if resolution == "daily":
+        period_start = dates
+    else:
+        period_start = dates.dt.to_period(FREQUENCIES[resolution]).dt.start_time
+    grouped = rates.assign(date=dates).groupby(
+        period_start.rename("period_start"), sort=True
+    )
+    aggregates = grouped["buybid"].agg(
+        open="first", high="max", low="min", close="last"
+    )
+    aggregates.insert(0, "period_end", grouped["date"].max())
+
+    close = aggregates["close"]
+    window = WINDOWS[resolution]
+    aggregates["change"] = close.pct_change(fill_method=None)
+    aggregates["rolling_mean"] = close.rolling(window).mean()
+    aggregates["volatility"] = np.log(close).diff().rolling(window).std()
+    aggregates["devaluation"] = 1 - close.shift(window) / close
+    return aggregates.reset_index()
+
+
+def refresh_aggregates(since: dict | None = None) -> int:
+    """Recomputes the aggregates of the periods that new rates may have changed.
+
+    Currencies without any aggregate yet, e.g. on the first run, are computed from the start of
+    their history. The ``DataVersion`` stamp is bumped when the aggregates are written, so that
+    responses cached before they were up to date are dropped.
+
+    :param since: The oldest date written for every currency, only the periods from that date
+                  onwards are recomputed. Every currency from the start of its history if
+                  ``None``.
+    :type since: dict | None
+    :return: How many aggregate rows were written.
+    :rtype: int
+
+    :Example:
+
+    .. code-block:: python
+
+        result = insert_into_database(df)
+        if result.changed:
+            refresh_aggregates(df.groupby("Currency")["Date"].min().to_dict())
+    """
+    with engine.begin() as connection:
+        currencies = connection.execute(select(Dollar.currency).distinct()).scalars()
+        computed = set(
+            connection.execute(select(RateAggregate.currency).distinct()).scalars()
+        )
+        records = list()
+        for currency in currencies.all():
+            if since is None or currency not in computed:
+                start = None
+            elif currency in since:
+                start = pd.Timestamp(since[currency])
+            else:
+                continue
+            records.extend(_aggregate_records(connection, currency, start))
+        if records:
+            connection.execute(UPSERT_AGGREGATES_STATEMENT, records)
+            bump_data_version(connection)
+            record_changes(connection, "aggregates", since)
+    return len(records)
+
+
+def _aggregate_records(connection, currency: str, start) -> list:
+    history_start = _history_start(connection, currency, start)
+    statement = select(Dollar.date, Dollar.buybid).where(Dollar.currency == currency)
+    if history_start is not None:
+        statement = statement.where(Dollar.date >= history_start.date())
+    rates = pd.DataFrame(
+        connection.execute(statement.order_by(Dollar.date)).all(),
+        columns=["date", "buybid"],
+    )
+    if rates.empty:
+        return list()
+
+    records = list()
+    for resolution in WINDOWS:
+        aggregates = compute_aggregates(rates, resolution)
+        if start is not None:
+            # The periods before the one holding start were only needed by the windows
+            aggregates = aggregates[aggregates["period_end"] >= start]
+        for column in ("period_start", "period_end"):
+            aggregates[column] = aggregates[column].dt.strftime("%Y-%m-%d")
+        aggregates = aggregates.astype(object)
+        aggregates = aggregates.where(aggregates.notna(), None)
+        aggregates.insert(0, "resolution", resolution)
+        aggregates.insert(0, "currency", currency)
+        records.extend(aggregates.to_dict("records"))
+    return records
+
+
+def _history_start(connection, currency: str, start):
+    # The rates of the window + 1 periods before the one holding start, of every resolution.
+    # Periods are counted on the existing aggregates, as the rates may skip whole periods.
+    if start is None:
+        return None
+    starts = list()
+    for resolution, window in WINDOWS.items():
+        period_start = start
+        if resolution in FREQUENCIES:
+            period_start = start.to_period(FREQUENCIES[resolution]).start_time
+        previous = connection.execute(
+            select(RateAggregate.period_start)
+            .where(
+                RateAggregate.currency == currency,
+                RateAggregate.resolution == resolution,
+                RateAggregate.period_start < period_start.date(),
+            )
+            .order_by(RateAggregate.period_start.desc())
+            .limit(1)
+            .offset(window)
+        ).scalar()
+        if previous is None:
+            return None
+        starts.append(pd.Timestamp(previous))
+    return min(starts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recomputes every aggregate of the rates."
+    )
+    parser.parse_args()
+
+    from dollar_data.database import init_db
+
+    init_db()
+    print(f"{refresh_aggregates()} aggregates written.")
+
+
+if __name__ == "__main__":
+    main()
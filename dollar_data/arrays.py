@@ -0,0 +1,39 @@
+"""Reads of query results into NumPy structured arrays, for the jobs that compute on whole
+columns of rates: the gap detection, the conversions and the alerts.
+"""
+
+import numpy as np
+
+from dollar_data.database import engine
+
+
+def fetch_array(statement, dtype, connection=None) -> np.ndarray:
+    """Reads the rows of a query straight into a structured array, without a list of rows in
+    between.
+
+    SQLite returns the dates as ISO 8601 strings, which NumPy parses into ``datetime64`` fields
+    much faster than SQLAlchemy converts them to ``datetime.date``, so select the date columns
+    with ``type_coerce(column, String)``.
+
+    :param statement: The query, with one column per field of ``dtype``, in the same order.
+    :type statement: sqlalchemy.sql.expression.Select
+    :param dtype: The fields of the array.
+    :type dtype: numpy.typing.DTypeLike
+    :param connection: The connection to run the query on, a new one if not given.
+    :type connection: sqlalchemy.engine.Connection
+    :return: One element per row.
+    :rtype: numpy.ndarray
+
+    :Example:
+
+    .. code-block:: python
+
+        rows = fetch_array(
+            select(Dollar.currency, type_coerce(Dollar.date, String)),
+            [("currency", "U3"), ("date", "datetime64[D]")],
+        )
+    """
+    if connection is None:
+        with engine.connect() as connection:
+            return fetch_array(statement, dtype, connection)
+    return np.fromiter(map(tuple, connection.execute(statement)), dtype=dtype)
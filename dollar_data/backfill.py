@@ -0,0 +1,194 @@
+"""Backfills the database with every workbook archived on the BCV statistics page.
+
+The listing is walked page by page, the workbooks are downloaded concurrently over one pooled
+``requests.Session`` that retries with exponential backoff, every finished download is parsed
+in a process pool and every parsed workbook is upserted as soon as it is ready. Downloads go
+through the :mod:`dollar_data.downloads` cache, so workbooks that did not change are not
+downloaded again and workbooks that were already ingested are not parsed again, which makes an
+interrupted backfill cheap to resume. A workbook that cannot be downloaded or parsed is logged
+and skipped, the next backfill tries it again.
+
+Run it with::
+
+    python -m dollar_data.backfill --workers 8
+"""
+
+import argparse
+import logging
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from multiprocessing import get_context
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from xlrd import XLRDError
+
+from dollar_data.downloads import CACHE_DIR, DownloadCache
+from dollar_data.refresh import run_pending
+from dollar_data.upsert import UpsertResult
+from dollar_data.utils import (
+    BCV_URL,
+    WORKBOOK_LINKS_SELECTOR,
+    insert_into_database,
+    read_rates,
+)
+
+NEXT_PAGE_SELECTOR = "ul.pager li.pager-next a"
+
+logger = logging.getLogger(__name__)
+
+
+def make_session(max_workers: int = 8, retries: int = 5, backoff: float = 0.5):
+    """Creates a session whose connection pool fits ``max_workers`` concurrent downloads.
+
+    Failed requests, including 429 and 5xx responses, are retried ``retries`` times waiting
+    ``backoff * 2 ** attempt`` seconds between attempts.
+
+    :param max_workers: The number of threads that will share the session.
+    :type max_workers: int
+    :param retries: How many times a request is retried.
+    :type retries: int
+    :param backoff: The backoff factor between retries, in seconds.
+    :type backoff: float
+    :return: The configured session.
+    :rtype: requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_workers, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # The BCV website does not send its full certificate chain
+    session.verify = False
+    return session
+
+
+def list_workbook_urls(session: requests.Session, url: str = BCV_URL) -> list:
+    """Returns the URLs of every workbook linked from the paginated statistics page.
+
+    :param session: The session used for the requests.
+    :type session: requests.Session
+    :param url: The URL of the first page of the listing.
+    :type url: str
+    :return: The absolute URLs of the workbooks, newest first, without duplicates.
+    :rtype: list
+    :raises requests.exceptions.RequestException: If a page cannot be fetched.
+    """
+    urls = dict()
+    visited = set()
+    while url is not None and url not in visited:
+        visited.add(url)
+        response = session.get(url)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.text, features="html.parser")
+        for a in soup.select(WORKBOOK_LINKS_SELECTOR):
+            urls.setdefault(urljoin(url, a.get("href")), None)
+        next_page = soup.select_one(NEXT_PAGE_SELECTOR)
+        url = urljoin(url, next_page.get("href")) if next_page is not None else None
+    return list(urls)
+
+
+def backfill(
+    url: str = BCV_URL,
+    directory: str = CACHE_DIR,
+    max_workers: int = 8,
+    processes: int | None = None,
+) -> UpsertResult:
+    """Downloads, parses and upserts every workbook of the statistics page.
+
+    :param url: The URL of the first page of the listing, :data:`BCV_URL` by default.
+    :type url: str
+    :param directory: The directory of the download cache.
+    :type directory: str
+    :param max_workers: How many workbooks are downloaded at the same time.
+    :type max_workers: int
+    :param processes: How many processes parse workbooks, the CPU count by default.
+    :type processes: int | None
+    :return: The sum of the rows inserted, updated and skipped for every workbook.
+    :rtype: UpsertResult
+
+    :Example:
+
+    .. code-block:: python
+
+        backfill("http://localhost:8080/estadisticas/tipo-cambio-de-referencia-smc")
+        # UpsertResult(inserted=81564, updated=0, skipped=0)
+    """
+    total = UpsertResult()
+    # Forking while the download threads run is unsafe, the parsers are spawned instead
+    parsers = ProcessPoolExecutor(processes, mp_context=get_context("spawn"))
+    with make_session(max_workers) as session, ThreadPoolExecutor(
+        max_workers
+    ) as downloads, parsers:
+        cache = DownloadCache(directory, session)
+        urls = list_workbook_urls(session, url)
+        logger.info("%d workbooks found.", len(urls))
+        downloading = {
+            downloads.submit(cache.fetch, workbook_url): workbook_url
+            for workbook_url in urls
+        }
+        parsing = dict()
+        while downloading or parsing:
+            done, _ = wait(
+                downloading.keys() | parsing.keys(), return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future in downloading:
+                    workbook_url = downloading.pop(future)
+                    # A workbook that cannot be downloaded does not stop the others, it is
+                    # downloaded again by the next backfill
+                    try:
+                        download = future.result()
+                    except requests.RequestException as e:
+                        logger.warning("Skipping %s: %s", workbook_url, e)
+                        continue
+                    # Workbooks ingested by a previous run are not parsed again
+                    if download.changed:
+                        parsing[parsers.submit(read_rates, download.path)] = download
+                    continue
+                download = parsing.pop(future)
+                try:
+                    df = future.result()
+                except XLRDError as e:
+                    logger.warning("Skipping %s: %s", download.url, e)
+                    continue
+                total += insert_into_database(df)
+                cache.mark_processed(download)
+    # The aggregates, exports and site are refreshed from the oldest rates written, a failed
+    # refresh is logged and left to the next run of the ingestion job
+    run_pending()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=BCV_URL)
+    parser.add_argument("--directory", default=CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    from dollar_data.database import init_db
+    from dollar_data.logging import configure_logging
+
+    configure_logging()
+    init_db()
+    print(backfill(args.url, args.directory, args.workers, args.processes))
+
+
+if __name__ == "__main__":
+    main()
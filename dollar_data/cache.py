@@ -0,0 +1,142 @@
+"""In-process read-through cache of query results, invalidated by the ingestion job.
+
+Every gunicorn worker keeps its own :class:`VersionedCache`. They stay coherent through the
+``DataVersion`` stamp that :func:`dollar_data.upsert.upsert_rates` bumps in the transaction that
+writes new rates: entries are tagged with the version they were computed from, and once a cache
+sees a newer version every older entry is dropped.
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+
+from dollar_data.models import DataVersion
+
+meter = metrics.get_meter(__name__)
+hits_counter = meter.create_counter(
+    "dollar_data.cache.hits", description="Lookups served from the query cache"
+)
+misses_counter = meter.create_counter(
+    "dollar_data.cache.misses", description="Lookups computed and stored in the cache"
+)
+# Every cache of the process, for the hit ratio gauge
+caches = weakref.WeakSet()
+
+
+def observe_hit_ratio(options):
+    for cache in list(caches):
+        lookups = cache.hits + cache.misses
+        if lookups:
+            yield Observation(cache.hits / lookups, {"cache": cache.name})
+
+
+meter.create_observable_gauge(
+    "dollar_data.cache.hit_ratio",
+    callbacks=[observe_hit_ratio],
+    description="Share of the lookups served from the query cache since the process started",
+)
+
+
+class VersionedCache:
+    """A size bounded LRU cache whose entries expire when the data version changes.
+
+    Reading the version is a query, so it is done at most once every ``check_interval``
+    seconds; between two checks a worker can serve results of the previous version for at
+    most that long. An interval of 0 checks the version on every lookup.
+
+    :param name: Reported as the ``cache`` attribute of the hit and miss counters.
+    :type name: str
+    :param maxsize: How many entries are kept before the least recently used is evicted.
+    :type maxsize: int
+    :param check_interval: Seconds between two reads of the data version.
+    :type check_interval: float
+    :param version_reader: Returns the current data version, :meth:`DataVersion.current`
+                           by default. Any value that changes with the data works, e.g.
+                           :meth:`DataVersion.stamp`.
+    :type version_reader: Callable[[], Any]
+
+    :Example:
+
+    .. code-block:: python
+
+        cache = VersionedCache("rates", maxsize=256)
+        rows = cache.get_or_compute(("USD", "daily"), lambda: expensive_query())
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 256,
+        check_interval: float = 1.0,
+        version_reader=None,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self.version_reader = (
+            version_reader if version_reader is not None else DataVersion.current
+        )
+        self.version = None
+        self._checked_at = float("-inf")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        caches.add(self)
+
+    def current_version(self):
+        """Returns the data version, reading it again if the last read is too old.
+
+        Entries of an older version are dropped as soon as a newer version is read.
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            version = self.version_reader()
+            with self._lock:
+                if version != self.version:
+                    self._entries.clear()
+                    self.version = version
+                self._checked_at = now
+        return self.version
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value of ``key``, computing and storing it on a miss.
+
+        :param key: A hashable key, e.g. the parameters of the endpoint.
+        :param compute: Called without arguments to compute the value on a miss.
+        :type compute: Callable[[], Any]
+        :return: The value of ``key`` for the current data version.
+        """
+        version = self.current_version()
+        attributes = {"cache": self.name}
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                hits_counter.add(1, attributes)
+                return self._entries[key]
+            self.misses += 1
+        misses_counter.add(1, attributes)
+        value = compute()
+        with self._lock:
+            # Not stored if a newer version was read while computing
+            if version == self.version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Drops every entry and forces the next lookup to read the data version."""
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+            self._checked_at = float("-inf")
+
+    def __len__(self) -> int:
+        return len(self._entries)
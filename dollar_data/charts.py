@@ -0,0 +1,211 @@
+"""Server side rendering of the rate charts.
+
+Charts are drawn with the object oriented API of Matplotlib on the headless Agg canvas, without
+``pyplot`` and its global state, so they can be rendered from any thread or process. The web
+application renders them in a :class:`ChartRenderer` process pool, which keeps the CPU bound
+drawing away from the request threads, and keeps the artifacts in a
+:class:`dollar_data.web.http_cache.ResponseCache` until the data changes.
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+# Formats that can be rendered, with their mimetypes
+CHART_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+}
+# Without the dates, rendering the same data twice gives the same file
+METADATA = {
+    "png": {"Software": None},
+    "svg": {"Date": None},
+    "pdf": {"CreationDate": None, "ModDate": None},
+}
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", 2))
+# Seconds a request waits for a render, below the timeout of the gunicorn workers (30 s)
+RENDER_TIMEOUT = float(os.environ.get("CHART_RENDER_TIMEOUT", 20))
+# Renders that finished after their request gave up, kept for the next request of the chart
+KEEP_RENDERS = 32
+
+logger = logging.getLogger(__name__)
+
+
+def render_chart(
+    dates,
+    values,
+    fmt: str = "png",
+    label: str = "Bolívar respecto al Dólar",
+    figsize: tuple = (10, 6),
+    dpi: int = 100,
+) -> bytes:
+    """Draws a line chart of a rate over time.
+
+    :param dates: The dates of the rates, in ascending order.
+    :type dates: Sequence[datetime.date]
+    :param values: The rates in bolívares.
+    :type values: Sequence[float]
+    :param fmt: ``png``, ``svg`` or ``pdf``.
+    :type fmt: str
+    :param label: The legend of the line.
+    :type label: str
+    :param figsize: Width and height of the chart, in inches.
+    :type figsize: tuple
+    :param dpi: Resolution of ``png`` charts.
+    :type dpi: int
+    :raises ValueError: If the format is not supported.
+    :return: The file of the chart.
+    :rtype: bytes
+
+    :Example:
+
+    .. code-block:: python
+
+        import datetime
+        png = render_chart([datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)], [36.0, 36.1])
+    """
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unsupported chart format: {fmt}")
+    # Imported here so that only the processes that draw charts load Matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.plot(dates, values, label=label)
+    ax.set_xlabel("Fecha")
+    ax.set_ylabel("Precio Bolívares")
+    ax.tick_params(axis="x", labelrotation=75)
+    ax.legend()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi, metadata=METADATA[fmt])
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """Renders charts with :func:`render_chart` in a pool of processes.
+
+    The pool is started on the first render, with the ``spawn`` start method so that it is safe
+    to create from a threaded web worker. Concurrent renders of the same key share a single
+    render. A render that outlives the timeout of its request goes on in the pool and its result
+    is kept, up to ``keep`` of them, until a render of the same key takes it. A pool whose
+    worker died, e.g. killed for its memory, is replaced by a new one.
+
+    :param max_workers: Processes of the pool, the ``CHART_WORKERS`` environment variable or 2
+                        by default.
+    :type max_workers: int
+    :param timeout: Seconds to wait for a render before giving up, the ``CHART_RENDER_TIMEOUT``
+                    environment variable or 20 by default.
+    :type timeout: float
+    :param keep: How many finished renders that no request took yet are kept.
+    :type keep: int
+
+    :Example:
+
+    .. code-block:: python
+
+        renderer = ChartRenderer()
+        png = renderer.render(("USD", "png"), dates, values, "png")
+    """
+
+    def __init__(
+        self,
+        max_workers: int = CHART_WORKERS,
+        timeout: float = RENDER_TIMEOUT,
+        keep: int = KEEP_RENDERS,
+    ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.keep = keep
+        self._executor = None
+        # Key -> future of its render and pool, in the order they were submitted
+        self._pending = dict()
+        # Reentrant, done callbacks run in the submitting thread if the render already ended
+        self._lock = threading.RLock()
+
+    def render(self, key, *args, **kwargs) -> bytes:
+        """Renders ``render_chart(*args, **kwargs)`` in the pool and waits for the result.
+
+        :param key: Identifies the chart, renders of an equal key in progress or finished and
+                    not taken yet are reused.
+        :return: The file of the chart.
+        :rtype: bytes
+        :raises concurrent.futures.TimeoutError: If the render takes longer than the timeout.
+        """
+        try:
+            return self._wait(key, args, kwargs)
+        except BrokenProcessPool:
+            # The render was lost with the worker, it runs once more in a new pool
+            logger.warning("A chart worker died, restarting the pool.")
+            return self._wait(key, args, kwargs)
+
+    def _wait(self, key, args, kwargs) -> bytes:
+        with self._lock:
+            future, executor = self._pending.get(key, (None, None))
+            if future is None:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        self.max_workers, mp_context=get_context("spawn")
+                    )
+                executor = self._executor
+                try:
+                    future = executor.submit(render_chart, *args, **kwargs)
+                except BrokenProcessPool:
+                    self._reset(executor)
+                    raise
+                self._pending[key] = future, executor
+                future.add_done_callback(lambda _: self._prune())
+        try:
+            result = future.result(self.timeout)
+        except TimeoutError:
+            # The render goes on, and stays pending for the next request of the chart
+            raise
+        except BrokenProcessPool:
+            self._forget(key, future)
+            self._reset(executor)
+            raise
+        except Exception:
+            self._forget(key, future)
+            raise
+        self._forget(key, future)
+        return result
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key, (None,))[0] is future:
+                del self._pending[key]
+
+    def _prune(self):
+        # Failed renders are dropped, finished ones beyond ``keep`` too, the oldest first
+        with self._lock:
+            finished = list()
+            for key, (future, _) in list(self._pending.items()):
+                if not future.done():
+                    continue
+                if future.cancelled() or future.exception() is not None:
+                    del self._pending[key]
+                else:
+                    finished.append(key)
+            for key in finished[: max(len(finished) - self.keep, 0)]:
+                del self._pending[key]
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """Stops the pool, it is started again by the next render."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,220 @@
+"""Conversions between currencies at the rate published on a date, from an in-memory index.
+
+The BCV publishes rates on business days only. The rate of a currency on any date, weekends and
+holidays included, is the last one published on or before it. :class:`AsOfIndex` keeps the
+``buybid`` of every currency in two sorted NumPy arrays, dates and rates, so the rate of a date
+is found with a binary search (:func:`numpy.searchsorted`) instead of a query, and thousands of
+lookups are answered with one vectorized search per currency.
+
+Every process builds its index on first use and keeps it in a :class:`VersionedCache`, which
+rebuilds it once the ingestion job writes new rates.
+
+:Example:
+
+.. code-block:: python
+
+    convert(100, "USD", "2024-01-06")
+    # Conversion(amount=100.0, currency='USD', date='2024-01-06', rate_date='2024-01-05', ...)
+    convert_many([100, 250.5], ["USD", "EUR"], ["2024-01-06", "2024-01-08"], to="USD")
+"""
+
+import datetime
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import String, select, type_coerce
+
+from dollar_data.arrays import fetch_array
+from dollar_data.cache import VersionedCache
+from dollar_data.models import Dollar
+
+# Code of the bolívar, the currency every BCV rate is quoted in
+BOLIVAR = "VES"
+
+
+class Conversion(NamedTuple):
+    """An amount converted at the rates in effect on a date.
+
+    A named tuple rather than a dataclass: batches create thousands of them and they serialize
+    to JSON as arrays.
+    """
+
+    amount: float
+    currency: str
+    date: str
+    # Date of the rate used, the last one published on or before ``date``
+    rate_date: str | None
+    rate: float | None
+    result: float | None
+
+
+class AsOfIndex:
+    """The rates of every currency, sorted by date in arrays, for lookups as of a date.
+
+    :param series: The dates, as ``datetime64[D]``, and the rates of every currency, both
+                   sorted by date.
+    :type series: dict[str, tuple[numpy.ndarray, numpy.ndarray]]
+    """
+
+    def __init__(self, series: dict):
+        self.series = series
+
+    @classmethod
+    def load(cls, connection=None) -> "AsOfIndex":
+        """Reads the ``buybid`` of every rate, in the order of the ``(currency, date)`` index.
+
+        :param connection: The connection to read from, one of :data:`engine` by default.
+        :type connection: sqlalchemy.Connection | None
+        :return: The index of every stored rate.
+        :rtype: AsOfIndex
+        """
+        rows = fetch_array(
+            select(Dollar.currency, type_coerce(Dollar.date, String), Dollar.buybid)
+            .where(Dollar.buybid.is_not(None))
+            .order_by(Dollar.currency, Dollar.date),
+            [("currency", "U3"), ("date", "datetime64[D]"), ("rate", "float64")],
+            connection,
+        )
+        codes, starts = np.unique(rows["currency"], return_index=True)
+        ends = np.append(starts[1:], len(rows))
+        return cls(
+            {
+                str(code): (
+                    np.ascontiguousarray(rows["date"][start:end]),
+                    np.ascontiguousarray(rows["rate"][start:end]),
+                )
+                for code, start, end in zip(codes, starts, ends)
+            }
+        )
+
+    def lookup(self, currency: str, dates) -> tuple:
+        """Returns the rates in effect on ``dates``, the last published on or before each.
+
+        The bolívar always has a rate of 1.
+
+        :param currency: A three letter currency code.
+        :type currency: str
+        :param dates: The dates to look up.
+        :type dates: numpy.ndarray
+        :return: The dates of the rates, ``NaT`` where there is none, and the rates, ``NaN``
+                 where there is none, e.g. before the first rate of the currency.
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        if currency == BOLIVAR:
+            return dates.copy(), np.ones(dates.shape)
+        if currency not in self.series:
+            return np.full(dates.shape, np.datetime64("NaT", "D")), np.full(
+                dates.shape, np.nan
+            )
+        series_dates, series_rates = self.series[currency]
+        positions = np.searchsorted(series_dates, dates, side="right") - 1
+        found = positions >= 0
+        positions = np.where(found, positions, 0)
+        return (
+            np.where(found, series_dates[positions], np.datetime64("NaT", "D")),
+            np.where(found, series_rates[positions], np.nan),
+        )
+
+    def convert(self, amounts, currencies, dates, to: str = BOLIVAR) -> tuple:
+        """Converts every amount from its currency to ``to`` at the rates of its date.
+
+        Amounts are converted through the bolívar: ``amount * rate(currency) / rate(to)``, both
+        rates as of the same date.
+
+        :param amounts: The amounts to convert.
+        :type amounts: numpy.ndarray
+        :param currencies: The three letter code of the currency of every amount.
+        :type currencies: numpy.ndarray
+        :param dates: The date of every amount.
+        :type dates: numpy.ndarray
+        :param to: The currency to convert to, the bolívar by default.
+        :type to: str
+        :return: The date of the rate of every currency, the rate from the currency to ``to``
+                 and the converted amounts, ``NaT`` and ``NaN`` where a rate is missing.
+        :rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        """
+        amounts = np.asarray(amounts, dtype="float64")
+        currencies = np.asarray(currencies)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        rate_dates = np.full(dates.shape, np.datetime64("NaT", "D"))
+        rates = np.full(dates.shape, np.nan)
+        # One search per currency, however many amounts there are
+        codes, inverse = np.unique(currencies, return_inverse=True)
+        for i, code in enumerate(codes):
+            selected = inverse == i
+            rate_dates[selected], rates[selected] = self.lookup(
+                str(code), dates[selected]
+            )
+        if to != BOLIVAR:
+            rates = rates / self.lookup(to, dates)[1]
+        return rate_dates, rates, amounts * rates
+
+
+# The index of the current data version, rebuilt by the first lookup after new rates are written
+indexes = VersionedCache("convert", maxsize=1)
+
+
+def current_index() -> AsOfIndex:
+    """Returns the index of the current data version, building it if needed."""
+    return indexes.get_or_compute("index", AsOfIndex.load)
+
+
+def convert_many(amounts, currencies, dates, to: str = BOLIVAR) -> list:
+    """Converts a batch of amounts with :meth:`AsOfIndex.convert` on :func:`current_index`.
+
+    :param amounts: The amounts to convert.
+    :type amounts: Sequence[float]
+    :param currencies: The three letter code of the currency of every amount.
+    :type currencies: Sequence[str]
+    :param dates: The date of every amount, as ISO 8601 strings or dates.
+    :type dates: Sequence[str | datetime.date]
+    :param to: The currency to convert to, the bolívar by default.
+    :type to: str
+    :return: The conversion of every amount, whose ``rate_date``, ``rate`` and ``result`` are
+             None when there is no rate for its currency on its date.
+    :rtype: list[Conversion]
+    :raises ValueError: If an amount is not a finite number or a date is not a full date.
+    :raises TypeError: If a date is neither a string nor a date.
+    """
+    to = to.upper()
+    amounts = np.asarray(amounts, dtype="float64")
+    if not np.isfinite(amounts).all():
+        raise ValueError("amounts must be finite numbers")
+    currencies = np.char.upper(np.asarray(currencies, dtype=str))
+    dates = _as_dates(dates)
+    rate_dates, rates, results = current_index().convert(amounts, currencies, dates, to)
+    missing = np.isnan(results)
+    return list(
+        map(
+            Conversion._make,
+            zip(
+                amounts.tolist(),
+                currencies.tolist(),
+                np.datetime_as_string(dates).tolist(),
+                np.where(missing, None, np.datetime_as_string(rate_dates)).tolist(),
+                np.where(missing, None, rates).tolist(),
+                np.where(missing, None, results).tolist(),
+            ),
+        )
+    )
+
+
+def _as_dates(dates) -> np.ndarray:
+    # NumPy also takes "NaT" and partial dates such as "2024" or "2024-01"
+    return np.array(
+        [
+            (
+                date
+                if isinstance(date, datetime.date)
+                else datetime.date.fromisoformat(date)
+            )
+            for date in dates
+        ],
+        dtype="datetime64[D]",
+    )
+
+
+def convert(amount: float, currency: str, date, to: str = BOLIVAR) -> Conversion:
+    """Converts an amount at the rates of a date, see :func:`convert_many`."""
+    return convert_many([amount], [currency], [date], to)[0]
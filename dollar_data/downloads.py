@@ -0,0 +1,189 @@
+"""Conditional, content-addressed downloads of the BCV workbooks.
+
+Workbooks are streamed to disk in chunks and saved under the SHA-256 of their content. A small
+JSON manifest remembers, for every URL, the ``ETag``/``Last-Modified`` validators and the hash of
+the last download, and the hashes of the workbooks that were already ingested. The next download
+of the same URL is a conditional request, and a workbook whose content was already ingested is
+reported as unchanged, so callers can return before parsing anything.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import requests
+from opentelemetry import metrics
+
+from dollar_data.telemetry import stage
+from dollar_data.utils import BCV_URL, EXCEL_FILES_DIR, latest_workbook_url
+
+CACHE_DIR = f"{EXCEL_FILES_DIR}cache/"
+CHUNK_SIZE = 64 * 1024
+
+meter = metrics.get_meter(__name__)
+downloaded_bytes = meter.create_histogram(
+    "dollar_data.download.size",
+    unit="By",
+    description="Size of the downloaded workbooks",
+)
+requests_counter = meter.create_counter(
+    "dollar_data.download.requests",
+    description="Workbook requests by result: downloaded or not_modified",
+)
+
+
+@dataclass(frozen=True)
+class Download:
+    """A workbook in the download cache."""
+
+    url: str
+    path: str
+    sha256: str
+    # False when the exact same content was already marked as processed
+    changed: bool
+
+
+class DownloadCache:
+    """Downloads workbooks into ``directory`` and keeps its ``manifest.json`` up to date.
+
+    The cache can be shared by several threads, the manifest is only touched under a lock and is
+    replaced atomically on every update.
+
+    :param directory: Where the workbooks and the manifest are saved.
+    :type directory: str
+    :param session: The session used for the requests, ``requests`` itself by default.
+    :type session: requests.Session | None
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, session=None):
+        self.directory = directory
+        self.session = session if session is not None else requests
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.Lock()
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {"urls": {}, "processed": {}}
+
+    def fetch(self, url: str) -> Download:
+        """Downloads ``url`` unless the server or the manifest says it did not change.
+
+        :param url: The URL of the workbook.
+        :type url: str
+        :return: The cached workbook.
+        :rtype: Download
+        :raises requests.exceptions.RequestException: If the workbook cannot be downloaded, or
+                                                      the server answers ``304 Not Modified``
+                                                      to a request that was not conditional.
+        """
+        with self._lock:
+            entry = dict(self.manifest["urls"].get(url, {}))
+        headers = dict()
+        if entry and os.path.exists(self._path(entry["sha256"])):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        with stage("download", url=url), self.session.get(
+            url, headers=headers, stream=True, verify=False
+        ) as response:
+            if response.status_code == 304:
+                # Only a conditional request can be answered with the cached workbook
+                if not headers:
+                    raise requests.HTTPError(
+                        f"304 Not Modified for {url} without a cached copy",
+                        response=response,
+                    )
+                requests_counter.add(1, {"result": "not_modified"})
+                return self._download(url, entry["sha256"])
+            response.raise_for_status()
+            sha256 = self._save(response)
+            requests_counter.add(1, {"result": "downloaded"})
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+        with self._lock:
+            previous = self.manifest["urls"].get(url, {}).get("sha256")
+            self.manifest["urls"][url] = {"sha256": sha256, **validators}
+            if previous not in (None, sha256) and not self._is_referenced(previous):
+                Path(self._path(previous)).unlink(missing_ok=True)
+            self._write_manifest()
+        return self._download(url, sha256)
+
+    def mark_processed(self, download: Download):
+        """Records that the content of ``download`` was ingested."""
+        with self._lock:
+            self.manifest["processed"][download.sha256] = datetime.now().isoformat()
+            self._write_manifest()
+
+    def _download(self, url: str, sha256: str) -> Download:
+        with self._lock:
+            changed = sha256 not in self.manifest["processed"]
+        return Download(
+            url=url, path=self._path(sha256), sha256=sha256, changed=changed
+        )
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.xls")
+
+    def _save(self, response) -> str:
+        digest = hashlib.sha256()
+        size = 0
+        partial_path = os.path.join(
+            self.directory, f".{threading.get_ident()}.{os.getpid()}.part"
+        )
+        with open(partial_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        downloaded_bytes.record(size)
+        sha256 = digest.hexdigest()
+        os.replace(partial_path, self._path(sha256))
+        return sha256
+
+    def _is_referenced(self, sha256: str) -> bool:
+        return any(
+            entry["sha256"] == sha256 for entry in self.manifest["urls"].values()
+        )
+
+    def _write_manifest(self):
+        partial_path = f"{self.manifest_path}.part"
+        with open(partial_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(partial_path, self.manifest_path)
+
+
+def fetch_latest_workbook(
+    url: str = BCV_URL, cache: DownloadCache | None = None
+) -> Download:
+    """Downloads the latest workbook of the statistics page through the download cache.
+
+    :param url: The URL of the statistics page, :data:`dollar_data.utils.BCV_URL` by default.
+    :type url: str
+    :param cache: The download cache, one in :data:`CACHE_DIR` by default.
+    :type cache: DownloadCache | None
+    :return: The cached workbook, check ``changed`` before parsing it.
+    :rtype: Download
+
+    :Example:
+
+    .. code-block:: python
+
+        cache = DownloadCache()
+        download = fetch_latest_workbook(cache=cache)
+        if download.changed:
+            insert_into_database(read_rates(download.path))
+            cache.mark_processed(download)
+    """
+    cache = cache if cache is not None else DownloadCache()
+    return cache.fetch(latest_workbook_url(url, cache.session))
@@ -0,0 +1,277 @@
+"""Columnar exports of the rates for bulk consumers.
+
+After each ingestion the rates are exported to :data:`EXPORT_DIR` as:
+
+* A Parquet dataset partitioned by currency and year, ``parquet/currency=USD/year=2024/``,
+  readable by ``pandas.read_parquet``, ``pyarrow.dataset`` or any Hive aware reader. Only the
+  partitions holding written rates are rewritten.
+* ``rates.arrow``, an uncompressed Arrow IPC file of every rate with one record batch per
+  currency, built from the Parquet partitions. It can be memory mapped and read without copies.
+* ``manifest.json``, listing the partitions and the batch of every currency.
+
+Every file is written to a temporary file and renamed, so readers never see a partial file and
+the ones that mapped the previous snapshot keep reading it. The exports need the optional
+``pyarrow`` package, they are skipped without it.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+from itertools import groupby
+
+from sqlalchemy import select
+
+from dollar_data.database import cwd, engine
+from dollar_data.files import replace, write_json
+from dollar_data.models import DataVersion, Dollar
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional, the exports are skipped when it is not installed
+    pa = None
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", f"{cwd}/dollar_data/exports/")
+PARQUET_DIR = "parquet"
+SNAPSHOT_FILE = "rates.arrow"
+MANIFEST_FILE = "manifest.json"
+RATE_COLUMNS = ["buybid", "sellask", "usd_buybid", "usd_sellask"]
+# Largest chunk of the Arrow IPC streams of iter_ipc_stream(), in bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def export_rates(since: dict | None = None, directory: str = EXPORT_DIR) -> dict:
+    """Rewrites the Parquet partitions holding rates written since a date, then the snapshot.
+
+    Currencies missing from the manifest, e.g. on the first run, are exported entirely. Every
+    write of rates leaves an export pending, which :mod:`dollar_data.refresh` runs with the
+    oldest date written of every currency.
+
+    :param since: The oldest date written for every currency, the partitions of the years from
+                  that date onwards are rewritten. Every partition if ``None``.
+    :type since: dict | None
+    :param directory: Where the exports are written, :data:`EXPORT_DIR` by default.
+    :type directory: str
+    :return: The manifest of the exports, empty if ``pyarrow`` is not installed.
+    :rtype: dict
+
+    :Example:
+
+    .. code-block:: python
+
+        export_rates({"USD": datetime.date(2024, 5, 2)})
+        # {'partitions': {'USD': {...}}, 'version': 42, 'currencies': {...}, ...}
+    """
+    if pa is None:
+        logger.warning("pyarrow is not installed, skipping the export.")
+        return dict()
+    manifest = read_manifest(directory)
+    partitions = manifest.setdefault("partitions", dict())
+    with engine.connect() as connection:
+        currencies = connection.execute(select(Dollar.currency).distinct()).scalars()
+        for currency in currencies.all():
+            if since is None or currency not in partitions:
+                start = None
+            elif currency in since:
+                start = datetime.date(since[currency].year, 1, 1)
+            else:
+                continue
+            written = _export_currency(connection, currency, start, directory)
+            partitions.setdefault(currency, dict()).update(written)
+        manifest["version"] = connection.execute(
+            select(DataVersion.version).where(DataVersion.id == 1)
+        ).scalar()
+
+    if not any(partitions.values()):
+        return manifest
+    manifest["currencies"] = write_snapshot(directory)
+    manifest["snapshot"] = SNAPSHOT_FILE
+    manifest["generated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    write_json(os.path.join(directory, MANIFEST_FILE), manifest, indent=2)
+    return manifest
+
+
+def _export_currency(connection, currency: str, start, directory: str) -> dict:
+    statement = select(Dollar.date, *[getattr(Dollar, c) for c in RATE_COLUMNS]).where(
+        Dollar.currency == currency
+    )
+    if start is not None:
+        statement = statement.where(Dollar.date >= start)
+    rows = connection.execute(statement.order_by(Dollar.date)).all()
+
+    written = dict()
+    for year, year_rows in groupby(rows, key=lambda row: row[0].year):
+        table = _to_table(list(year_rows))
+        path = os.path.join(
+            PARQUET_DIR, f"currency={currency}", f"year={year}", "part-0.parquet"
+        )
+        replace(
+            os.path.join(directory, path),
+            lambda tmp: pq.write_table(table, tmp, compression="zstd"),
+        )
+        written[str(year)] = {"path": path, "rows": table.num_rows}
+    return written
+
+
+def _to_table(rows: list):
+    columns = list(zip(*rows))
+    arrays = [pa.array(columns[0], pa.date32())]
+    arrays.extend(pa.array(values, pa.float64()) for values in columns[1:])
+    return pa.Table.from_arrays(arrays, names=["date", *RATE_COLUMNS])
+
+
+def write_snapshot(directory: str = EXPORT_DIR) -> dict:
+    """Writes ``rates.arrow`` from the Parquet partitions, without reading the database.
+
+    :param directory: Where the exports are written, :data:`EXPORT_DIR` by default.
+    :type directory: str
+    :return: The index of the record batch of every currency and its number of rows.
+    :rtype: dict
+    """
+    dataset = ds.dataset(
+        os.path.join(directory, PARQUET_DIR), format="parquet", partitioning="hive"
+    )
+    table = dataset.to_table(columns=["currency", "date", *RATE_COLUMNS])
+    table = table.sort_by([("currency", "ascending"), ("date", "ascending")])
+    table = table.cast(
+        pa.schema(
+            [
+                ("currency", pa.string()),
+                ("date", pa.date32()),
+                *[(column, pa.float64()) for column in RATE_COLUMNS],
+            ]
+        )
+    )
+
+    # One batch per currency, sliced in the order of the sort above
+    counts = table.column("currency").value_counts()
+    currencies = dict()
+    batches = list()
+    offset = 0
+    for currency, rows in sorted(
+        zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist())
+    ):
+        batch = table.slice(offset, rows).combine_chunks().to_batches()[0]
+        currencies[currency] = {"batch": len(batches), "rows": rows}
+        batches.append(batch)
+        offset += rows
+
+    # Also in the file itself, so that readers never pair a snapshot with another manifest
+    schema = table.schema.with_metadata({"currencies": json.dumps(currencies)})
+
+    def write(path):
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+    replace(os.path.join(directory, SNAPSHOT_FILE), write)
+    return currencies
+
+
+def read_manifest(directory: str = EXPORT_DIR) -> dict:
+    """Returns the manifest of the exports, empty if nothing was exported yet."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict()
+
+
+@contextlib.contextmanager
+def read_currency(currency: str, directory: str = EXPORT_DIR):
+    """Maps the snapshot and gives the rates of a currency, without copying them.
+
+    The record batch points into the mapped file, so it can only be used inside the ``with``
+    block, which unmaps the file when it ends.
+
+    :param currency: A three letter currency code.
+    :type currency: str
+    :param directory: Where the exports are written, :data:`EXPORT_DIR` by default.
+    :type directory: str
+    :return: A context manager of the record batch of the currency, None if it was not exported.
+    :rtype: contextlib.AbstractContextManager[pyarrow.RecordBatch | None]
+    :raises FileNotFoundError: If nothing was exported yet.
+
+    :Example:
+
+    .. code-block:: python
+
+        with read_currency("USD") as batch:
+            batch.num_rows
+            # 2850
+    """
+    with pa.memory_map(os.path.join(directory, SNAPSHOT_FILE)) as source:
+        with pa.ipc.open_file(source) as reader:
+            batch = json.loads(reader.schema.metadata[b"currencies"]).get(currency)
+            yield reader.get_batch(batch["batch"]) if batch is not None else None
+
+
+def iter_ipc_stream(batch, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Serializes a record batch as an Arrow IPC stream, in chunks of at most ``chunk_size`` bytes.
+
+    The writer hands over the buffers of the batch as they are, so they are copied once, a chunk
+    at a time, into the yielded bytes.
+
+    :param batch: The record batch.
+    :type batch: pyarrow.RecordBatch
+    :param chunk_size: The largest chunk, in bytes.
+    :type chunk_size: int
+    :return: The chunks of the stream.
+    :rtype: Iterator[bytes]
+    """
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+        yield from sink.drain(chunk_size)
+    yield from sink.drain(chunk_size)
+
+
+class _Sink:
+    # A file object for pyarrow that keeps what is written to it until it is drained
+    closed = False
+
+    def __init__(self):
+        self.pieces = list()
+
+    def write(self, data) -> int:
+        self.pieces.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self, chunk_size: int):
+        for piece in self.pieces:
+            view = memoryview(piece)
+            for offset in range(0, len(view), chunk_size):
+                yield bytes(view[offset : offset + chunk_size])
+        self.pieces.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exports every rate to Parquet and Arrow."
+    )
+    parser.add_argument("--directory", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    from dollar_data.database import init_db
+
+    init_db()
+    manifest = export_rates(directory=args.directory)
+    print(
+        f"{sum(c['rows'] for c in manifest.get('currencies', {}).values())} rates exported."
+    )
+
+
+if __name__ == "__main__":
+    main()
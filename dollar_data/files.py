@@ -0,0 +1,54 @@
+"""Writes of the files read by other processes, e.g. the web server, while they are replaced.
+
+A file is written under a temporary name in its directory and renamed over the previous one,
+so readers see either the previous file or the new one, never a partial file, and the ones that
+opened or mapped the previous file keep reading it.
+"""
+
+import json
+import os
+import threading
+
+
+def replace(path: str, write):
+    """Writes the file ``path`` with ``write`` and renames it into place.
+
+    :param path: The file to write, its directory is created if needed.
+    :type path: str
+    :param write: Called with the temporary path to write to.
+    :type write: Callable[[str], Any]
+
+    :Example:
+
+    .. code-block:: python
+
+        replace("exports/rates.arrow", lambda path: pq.write_table(table, path))
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    # Unique to the writing thread, and created with the permissions of any other file, unlike
+    # the owner only files of mkstemp
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_json(path: str, data, **options):
+    """Writes ``data`` as the JSON file ``path``, see :func:`replace`.
+
+    :param path: The file to write.
+    :type path: str
+    :param data: Anything :func:`json.dump` can serialize.
+    :param options: Passed to :func:`json.dump`, e.g. ``indent``.
+    """
+
+    def write(tmp: str):
+        with open(tmp, "w") as f:
+            json.dump(data, f, **options)
+
+    replace(path, write)
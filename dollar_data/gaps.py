@@ -0,0 +1,400 @@
+"""Detection and repair of the business days missing from the rates of every currency.
+
+The BCV publishes rates from Monday to Friday, except on the Venezuelan holidays of
+:func:`holidays`. :func:`detect_gaps` reads the ``(currency, date)`` pairs in the order of their
+index, marks them on a boolean matrix of currencies by business days and finds every missing
+day of every currency with one NumPy operation, between the first and the last rate of the
+currency. How many business days passed since the last rate of a currency is its staleness.
+
+:func:`heal_gaps` records the gaps in the ``DataGap`` table, downloads again only the quarterly
+workbooks that cover them, upserts their rates and checks again. A gap that is still open
+after :data:`MAX_ATTEMPTS` re-fetches, e.g. a bank holiday that is not in the calendar, is not
+fetched again. The gaps and the staleness of every currency found by the last check of the
+process are exported as the ``dollar_data.gaps.open`` and ``dollar_data.staleness`` gauges.
+
+:Example:
+
+.. code-block:: python
+
+    report = detect_gaps()
+    report.gaps["USD"]  # array(['2024-03-04'], dtype='datetime64[D]')
+    report.staleness["USD"]  # 2
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+
+import numpy as np
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+from sqlalchemy import String, insert, select, type_coerce, update
+from xlrd import XLRDError
+
+from dollar_data.arrays import fetch_array
+from dollar_data.backfill import list_workbook_urls, make_session
+from dollar_data.database import engine
+from dollar_data.downloads import DownloadCache
+from dollar_data.models import DataGap, Dollar
+from dollar_data.refresh import run_pending
+from dollar_data.telemetry import stage
+from dollar_data.utils import BCV_URL, insert_into_database, read_rates
+
+# Holidays on the same date every year, as (month, day)
+FIXED_HOLIDAYS = (
+    (1, 1),  # Año Nuevo
+    (4, 19),  # Declaración de la Independencia
+    (5, 1),  # Día del Trabajador
+    (6, 24),  # Batalla de Carabobo
+    (7, 5),  # Día de la Independencia
+    (7, 24),  # Natalicio del Libertador
+    (10, 12),  # Día de la Resistencia Indígena
+    (12, 24),
+    (12, 25),
+    (12, 31),
+)
+# Holidays relative to Easter Sunday, in days: Carnival Monday and Tuesday, Holy Thursday and
+# Good Friday
+EASTER_HOLIDAYS = (-48, -47, -3, -2)
+# Other days without publication, e.g. bank holidays, as comma separated ISO 8601 dates
+EXTRA_HOLIDAYS = tuple(
+    day.strip()
+    for day in os.environ.get("BCV_EXTRA_HOLIDAYS", "").split(",")
+    if day.strip()
+)
+# Re-fetches of the workbook of a gap before giving up on it
+MAX_ATTEMPTS = int(os.environ.get("GAP_MAX_ATTEMPTS", 5))
+# Rows changed by a single UPDATE of the gaps, below the parameter limit of every database
+UPDATE_BATCH_SIZE = 500
+# The workbooks are named after their quarter, a to d, and year, e.g. 2_1_2c24_smc.xls
+WORKBOOK_QUARTER = re.compile(r"_2(?P<quarter>[a-d])(?P<year>\d{2})_smc", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class GapReport:
+    """The missing business days and the staleness of every currency."""
+
+    # Missing business days of every currency with gaps, as sorted datetime64[D] arrays
+    gaps: dict = field(default_factory=dict)
+    # Business days since the last rate of every currency, up to the day of the check
+    staleness: dict = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        """How many days are missing, over every currency."""
+        return sum(len(days) for days in self.gaps.values())
+
+    def pairs(self) -> set:
+        """Returns the missing days as ``(currency, datetime.date)`` pairs."""
+        return {
+            (currency, day)
+            for currency, days in self.gaps.items()
+            for day in days.tolist()
+        }
+
+
+# The report of the last check of this process, observed by the gauges
+latest_report = GapReport()
+
+
+def observe_gaps(options):
+    for currency, days in latest_report.gaps.items():
+        yield Observation(len(days), {"currency": currency})
+
+
+def observe_staleness(options):
+    for currency, days in latest_report.staleness.items():
+        yield Observation(days, {"currency": currency})
+
+
+meter = metrics.get_meter(__name__)
+meter.create_observable_gauge(
+    "dollar_data.gaps.open",
+    callbacks=[observe_gaps],
+    description="Business days without a rate between the first and the last rate of a currency",
+)
+meter.create_observable_gauge(
+    "dollar_data.staleness",
+    callbacks=[observe_staleness],
+    unit="d",
+    description="Business days since the last rate of a currency",
+)
+
+
+def easter(years) -> np.ndarray:
+    """Returns the date of Easter Sunday of every year, with the Gregorian computus.
+
+    :param years: The years.
+    :type years: numpy.ndarray
+    :return: The Easter Sundays, as ``datetime64[D]``.
+    :rtype: numpy.ndarray
+    """
+    years = np.asarray(years, dtype="int64")
+    a = years % 19
+    b, c = np.divmod(years, 100)
+    d, e = np.divmod(b, 4)
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = np.divmod(c, 4)
+    weekday = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * weekday) // 451
+    month, day = np.divmod(h + weekday - 7 * m + 114, 31)
+    return _dates(years, month, day + 1)
+
+
+def holidays(first_year: int, last_year: int) -> np.ndarray:
+    """Returns the days without publication between two years, weekends aside.
+
+    :param first_year: The first year, included.
+    :type first_year: int
+    :param last_year: The last year, included.
+    :type last_year: int
+    :return: The sorted holidays, as ``datetime64[D]``, :data:`EXTRA_HOLIDAYS` included.
+    :rtype: numpy.ndarray
+    """
+    years = np.arange(first_year, last_year + 1)
+    months, days = np.array(FIXED_HOLIDAYS).T
+    fixed = _dates(years[:, None], months, days)
+    movable = easter(years)[:, None] + np.array(EASTER_HOLIDAYS, dtype="timedelta64[D]")
+    return np.unique(
+        np.concatenate(
+            [
+                fixed.ravel(),
+                movable.ravel(),
+                np.array(EXTRA_HOLIDAYS, dtype="datetime64[D]"),
+            ]
+        )
+    )
+
+
+def business_calendar(first_year: int, last_year: int) -> np.busdaycalendar:
+    """Returns the calendar of the publication days of the BCV between two years."""
+    return np.busdaycalendar(
+        weekmask="1111100", holidays=holidays(first_year, last_year)
+    )
+
+
+def _dates(years, months, days) -> np.ndarray:
+    # datetime64 arithmetic from the year, broadcasting the three arguments
+    return (
+        (np.asarray(years) - 1970).astype("datetime64[Y]").astype("datetime64[M]")
+        + (np.asarray(months) - 1).astype("timedelta64[M]")
+    ).astype("datetime64[D]") + (np.asarray(days) - 1).astype("timedelta64[D]")
+
+
+def detect_gaps(connection=None, today: date | None = None) -> GapReport:
+    """Finds the business days without a rate and the staleness of every currency.
+
+    :param connection: The connection to read from, one of :data:`engine` by default.
+    :type connection: sqlalchemy.Connection | None
+    :param today: The day of the check, today by default.
+    :type today: datetime.date | None
+    :return: The gaps and the staleness of every currency.
+    :rtype: GapReport
+    """
+    rows = fetch_array(
+        select(Dollar.currency, type_coerce(Dollar.date, String)).order_by(
+            Dollar.currency, Dollar.date
+        ),
+        [("currency", "U3"), ("date", "datetime64[D]")],
+        connection,
+    )
+    if not len(rows):
+        return GapReport()
+
+    today = np.datetime64(today or date.today(), "D")
+    # First and last row of every currency
+    codes, starts, inverse = np.unique(
+        rows["currency"], return_index=True, return_inverse=True
+    )
+    ends = np.append(starts[1:], len(rows)) - 1
+    firsts, lasts = rows["date"][starts], rows["date"][ends]
+
+    first, last = firsts.min(), max(lasts.max(), today)
+    calendar = business_calendar(first.astype(object).year, last.astype(object).year)
+    days = np.arange(first, last + 1)
+    days = days[np.is_busday(days, busdaycal=calendar)]
+
+    # One row per currency, one column per business day, rates on other days are ignored
+    positions = np.searchsorted(days, rows["date"])
+    on_business_day = positions < len(days)
+    on_business_day[on_business_day] = (
+        days[positions[on_business_day]] == rows["date"][on_business_day]
+    )
+    published = np.zeros((len(codes), len(days)), dtype=bool)
+    published[inverse[on_business_day], positions[on_business_day]] = True
+    expected = (days >= firsts[:, None]) & (days <= lasts[:, None])
+    currencies, columns = np.nonzero(expected & ~published)
+
+    counts = np.bincount(currencies, minlength=len(codes))
+    missing = np.split(days[columns], np.cumsum(counts)[:-1])
+    staleness = np.busday_count(lasts + 1, today + 1, busdaycal=calendar).clip(0)
+    return GapReport(
+        gaps={
+            str(code): gaps
+            for code, gaps, count in zip(codes, missing, counts)
+            if count
+        },
+        staleness=dict(zip(map(str, codes), staleness.tolist())),
+    )
+
+
+def record_gaps(report: GapReport, attempted=frozenset()) -> set:
+    """Brings the ``DataGap`` table up to date with a report.
+
+    New gaps are inserted, gaps that are no longer in the report are resolved and resolved
+    gaps that are in the report again are reopened.
+
+    :param report: The gaps found by :func:`detect_gaps`.
+    :type report: GapReport
+    :param attempted: The gaps whose workbooks were fetched again since the report before,
+                      their attempts are incremented if they are still open.
+    :type attempted: set[tuple[str, datetime.date]]
+    :return: The open gaps that can still be fetched again, as ``(currency, date)`` pairs.
+    :rtype: set[tuple[str, datetime.date]]
+    """
+    now = datetime.now(timezone.utc)
+    missing = report.pairs()
+    with engine.begin() as connection:
+        known = {
+            (currency, day): (id_, attempts or 0, resolved_at)
+            for id_, currency, day, attempts, resolved_at in connection.execute(
+                select(
+                    DataGap.id,
+                    DataGap.currency,
+                    DataGap.date,
+                    DataGap.attempts,
+                    DataGap.resolved_at,
+                )
+            )
+        }
+        new = missing - known.keys()
+        if new:
+            connection.execute(
+                insert(DataGap),
+                [
+                    {"currency": c, "date": d, "detected_at": now, "attempts": 0}
+                    for c, d in sorted(new)
+                ],
+            )
+        reopened, resolved, failed = list(), list(), list()
+        attempts = dict.fromkeys(new, 0)
+        for key, (id_, count, resolved_at) in known.items():
+            if key not in missing:
+                if resolved_at is None:
+                    resolved.append(id_)
+                continue
+            if resolved_at is not None:
+                reopened.append(id_)
+            if key in attempted:
+                failed.append(id_)
+                count += 1
+            attempts[key] = count
+        _update(connection, reopened, resolved_at=None)
+        _update(connection, resolved, resolved_at=now)
+        _update(connection, failed, attempts=DataGap.attempts + 1, attempted_at=now)
+    return {key for key, count in attempts.items() if count < MAX_ATTEMPTS}
+
+
+def _update(connection, ids: list, **values):
+    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+        connection.execute(
+            update(DataGap)
+            .where(DataGap.id.in_(ids[start : start + UPDATE_BATCH_SIZE]))
+            .values(**values)
+        )
+
+
+def workbook_quarter(url: str) -> tuple | None:
+    """Returns the ``(year, quarter)`` covered by a workbook, from its name.
+
+    :param url: The URL of the workbook.
+    :type url: str
+    :return: The year and the quarter, from 1 to 4, or None if the name has no quarter.
+    :rtype: tuple[int, int] | None
+
+    :Example:
+
+    .. code-block:: python
+
+        workbook_quarter("https://www.bcv.org.ve/.../2_1_2c24_smc.xls")  # (2024, 3)
+    """
+    match = WORKBOOK_QUARTER.search(url.rsplit("/", 1)[-1])
+    if match is None:
+        return None
+    return 2000 + int(match["year"]), "abcd".index(match["quarter"].lower()) + 1
+
+
+def refetch_workbooks(days, url: str = BCV_URL, cache=None) -> dict:
+    """Downloads, parses and upserts the workbooks of the quarters of ``days``.
+
+    :param days: The days whose rates are missing.
+    :type days: Iterable[datetime.date]
+    :param url: The URL of the first page of the listing, :data:`BCV_URL` by default.
+    :type url: str
+    :param cache: The download cache, one in its default directory by default.
+    :type cache: dollar_data.downloads.DownloadCache | None
+    :return: The oldest date written of every currency, empty if nothing changed.
+    :rtype: dict
+    :raises requests.exceptions.RequestException: If the listing cannot be fetched.
+    """
+    quarters = {(day.year, (day.month - 1) // 3 + 1) for day in days}
+    cache = cache if cache is not None else DownloadCache(session=make_session(1))
+    since = dict()
+    for workbook_url in list_workbook_urls(cache.session, url):
+        if workbook_quarter(workbook_url) not in quarters:
+            continue
+        download = cache.fetch(workbook_url)
+        # Parsed even if it was ingested before, the rows that are already stored are skipped
+        try:
+            with stage("parse", path=download.path) as parsing:
+                df = read_rates(download.path)
+                parsing.rows = len(df)
+        except XLRDError as e:
+            logger.warning("Skipping %s: %s", workbook_url, e)
+            continue
+        result = insert_into_database(df)
+        logger.info("%s fetched again: %s", workbook_url, result)
+        if result.changed:
+            for currency, oldest in df.groupby("Currency")["Date"].min().items():
+                since[currency] = min(since.get(currency, oldest), oldest)
+        cache.mark_processed(download)
+    return since
+
+
+def heal_gaps(url: str = BCV_URL, cache=None) -> GapReport:
+    """Detects and records the gaps, then fetches the workbooks of the open ones again.
+
+    The refreshes left pending by the re-fetched rates (aggregates, exports, published site) are
+    run like after an ingestion, see :mod:`dollar_data.refresh`. A failed refresh is logged and
+    left to the next ingestion, it does not keep the gaps from being checked and recorded again:
+    they only depend on the rates, which are already stored.
+
+    :param url: The URL of the first page of the listing, :data:`BCV_URL` by default.
+    :type url: str
+    :param cache: The download cache, one in its default directory by default.
+    :type cache: dollar_data.downloads.DownloadCache | None
+    :return: The gaps left after the re-fetches.
+    :rtype: GapReport
+    """
+    global latest_report
+
+    with stage("detect") as detecting:
+        report = detect_gaps()
+        detecting.rows = report.count
+    pending = record_gaps(report)
+    if pending:
+        with stage("refetch") as refetching:
+            refetch_workbooks({day for _, day in pending}, url, cache)
+            refetching.rows = len(pending)
+        run_pending()
+        with stage("detect") as detecting:
+            report = detect_gaps()
+            detecting.rows = report.count
+        record_gaps(report, attempted=pending)
+    latest_report = report
+    return report
@@ -1,31 +1,62 @@
-from datetime import datetime
+import logging
 import pandas as pd
+from dollar_data.downloads import DownloadCache, fetch_latest_workbook
+from dollar_data.gaps import heal_gaps
 from dollar_data.models import Dollar
+from dollar_data.refresh import run_pending
+from dollar_data.telemetry import stage
+from dollar_data.upsert import REFRESH_STEPS
 from dollar_data.utils import (
-    clean_dataframe,
-    dollar_to_bs_rate,
-    read_xls,
-    scrape_excel,
+    read_rates,
     insert_into_database,
 )
 
+logger = logging.getLogger(__name__)
+
 
 def update_database():
-    file_path = scrape_excel()
-    data = read_xls(file_path)
-    last_date_db = Dollar.query.order_by(Dollar.id.desc()).first()
-    df = pd.DataFrame(data)
-    clean_dataframe(df)
-    df = dollar_to_bs_rate(df)
-    df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d %H:%M:%S")
-    print(df)
-    df = df.sort_values("Date", ascending=True).reset_index(drop=True)
-    df = df[~(df["Date"] <= last_date_db.date)]
-    insert_into_database(df)
-
-
-def check_missing_entries():
-    last_date_row = Dollar.query.order_by(Dollar.id.desc()).first()
-    last_date = datetime.strptime(last_date_row.date, "%Y-%m-%d %H:%M:%S")
-    actual_date = datetime.strptime(str(datetime.now()), "%Y-%m-%d %H:%M:%S.%f")
-    print(abs(last_date - actual_date))
+    """Ingests the latest workbook, then runs every refresh left pending by the writes.
+
+    The refreshes run even when the workbook did not change, so a retry of the job completes
+    the refreshes that a failed run left behind, see :mod:`dollar_data.refresh`.
+
+    :raises RuntimeError: If a refresh failed, it stays pending for the next run.
+    """
+    cache = DownloadCache()
+    download = fetch_latest_workbook(cache=cache)
+    if download.changed:
+        ingest(download)
+        cache.mark_processed(download)
+    else:
+        logger.info("%s did not change, skipping.", download.url)
+    failed = run_pending()
+    if failed:
+        raise RuntimeError(f"Could not refresh the {', '.join(failed)}.")
+
+
+def ingest(download):
+    """Writes the rates of a downloaded workbook that are newer than the stored ones."""
+    # Only the sheets published after the oldest high-water mark are opened
+    high_water_marks = Dollar.high_water_marks()
+    with stage("parse", path=download.path) as parsing:
+        df = read_rates(
+            download.path, since=min(high_water_marks.values(), default=None)
+        )
+        parsing.rows = len(df)
+    with stage("transform") as transforming:
+        last_dates = df["Currency"].map(pd.to_datetime(pd.Series(high_water_marks)))
+        df = df[last_dates.isna() | (df["Date"] > last_dates)]
+        transforming.rows = len(df)
+    # Rows already stored are skipped by the upsert, so re-running the job is safe. New rates
+    # also send alerts, unlike the older ones written by a backfill.
+    result = insert_into_database(df, refresh=(*REFRESH_STEPS, "alerts"))
+    logger.info("%s ingested: %s", download.url, result)
+
+
+def repair_gaps():
+    report = heal_gaps()
+    logger.info(
+        "%d business days missing, %s business days since the last USD rate.",
+        report.count,
+        report.staleness.get("USD"),
+    )
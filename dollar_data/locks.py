@@ -0,0 +1,131 @@
+"""Leases stored in the database, so that a job only runs in one process at a time.
+
+A lease is a row of the ``JobLock`` table with an owner and an expiration time. It can be taken
+when nobody holds it or when the previous owner let it expire, e.g. because its process died.
+While it is held a background thread keeps pushing the expiration back.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from dollar_data.database import engine
+
+ACQUIRE_STATEMENT = text(
+    'INSERT INTO "JobLock" (name, owner, expires_at) '
+    "VALUES (:name, :owner, :expires_at) "
+    "ON CONFLICT (name) DO UPDATE SET "
+    "owner = excluded.owner, expires_at = excluded.expires_at "
+    'WHERE "JobLock".expires_at < :now OR "JobLock".owner = excluded.owner'
+)
+OWNER_STATEMENT = text('SELECT owner FROM "JobLock" WHERE name = :name')
+RENEW_STATEMENT = text(
+    'UPDATE "JobLock" SET expires_at = :expires_at WHERE name = :name AND owner = :owner'
+)
+RELEASE_STATEMENT = text('DELETE FROM "JobLock" WHERE name = :name AND owner = :owner')
+
+# Identifies this process among every process using the database
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Seconds between two attempts to take a lease that is held
+POLL_INTERVAL = 1.0
+
+
+def _timestamp(moment: datetime) -> str:
+    # Stored in UTC with a fixed format, so that timestamps compare as strings
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def try_acquire(name: str, ttl: float, owner: str = OWNER) -> bool:
+    """Takes or renews the lease ``name`` for ``ttl`` seconds if it is free or expired.
+
+    :param name: The name of the lease, usually the id of the job.
+    :type name: str
+    :param ttl: For how many seconds the lease is held unless renewed.
+    :type ttl: float
+    :param owner: Who takes the lease, this process by default.
+    :type owner: str
+    :return: Whether ``owner`` holds the lease.
+    :rtype: bool
+    """
+    now = datetime.now(timezone.utc)
+    with engine.begin() as connection:
+        connection.execute(
+            ACQUIRE_STATEMENT,
+            {
+                "name": name,
+                "owner": owner,
+                "now": _timestamp(now),
+                "expires_at": _timestamp(now + timedelta(seconds=ttl)),
+            },
+        )
+        holder = connection.execute(OWNER_STATEMENT, {"name": name}).scalar()
+    return holder == owner
+
+
+def release(name: str, owner: str = OWNER):
+    """Gives the lease ``name`` back, if ``owner`` still holds it."""
+    with engine.begin() as connection:
+        connection.execute(RELEASE_STATEMENT, {"name": name, "owner": owner})
+
+
+@contextmanager
+def lease(name: str, ttl: float = 600.0, owner: str = OWNER, wait: float = 0.0):
+    """Holds the lease ``name`` for the duration of the block.
+
+    The lease is renewed every third of ``ttl`` while the block runs and released when it ends.
+    The block is given whether the lease was acquired, it should do nothing when it was not.
+
+    :param name: The name of the lease, usually the id of the job.
+    :type name: str
+    :param ttl: For how many seconds the lease survives a process that stopped renewing it.
+    :type ttl: float
+    :param owner: Who takes the lease, this process by default.
+    :type owner: str
+    :param wait: For how many seconds to wait for a lease that is held, not at all by default.
+    :type wait: float
+
+    :Example:
+
+    .. code-block:: python
+
+        with lease("update_database") as acquired:
+            if acquired:
+                update_database()
+    """
+    deadline = time.monotonic() + wait
+    while not try_acquire(name, ttl, owner):
+        left = deadline - time.monotonic()
+        if left <= 0:
+            yield False
+            return
+        time.sleep(min(POLL_INTERVAL, left))
+
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(ttl / 3):
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+            with engine.begin() as connection:
+                connection.execute(
+                    RENEW_STATEMENT,
+                    {
+                        "name": name,
+                        "owner": owner,
+                        "expires_at": _timestamp(expires_at),
+                    },
+                )
+
+    renewer = threading.Thread(target=renew, name=f"lease-{name}", daemon=True)
+    renewer.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        renewer.join()
+        release(name, owner)
@@ -1,16 +1,27 @@
+import functools
 import logging
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
 from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
 from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
 
+from dollar_data.telemetry import exporter_options, exporting_enabled, resource
+
+
+# Once per process, a second handler would log every record twice
+@functools.cache
 def configure_logging():
-    logger_provider = LoggerProvider()
+    logging.getLogger().setLevel(logging.INFO)
+    # Without a collector the records are written to stderr instead
+    if not exporting_enabled():
+        logging.basicConfig(level=logging.INFO)
+        return
+
+    logger_provider = LoggerProvider(resource=resource())
     set_logger_provider(logger_provider)
-    
-    exporter = OTLPLogExporter(endpoint="http://localhost:4317", insecure=True)
+
+    exporter = OTLPLogExporter(**exporter_options())
     logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
-    
+
     handler = LoggingHandler(logger_provider=logger_provider)
     logging.getLogger().addHandler(handler)
-    logging.getLogger().setLevel(logging.INFO)
\ No newline at end of file
@@ -1,10 +1,20 @@
+import functools
+
 from opentelemetry import metrics
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
 
+from dollar_data.telemetry import exporter_options, exporting_enabled, resource
+
+
+# Once per process, the job runner also creates the web app to publish the site
+@functools.cache
 def configure_metrics():
-    metric_exporter = OTLPMetricExporter(endpoint="http://localhost:4317", insecure=True)
-    metric_reader = PeriodicExportingMetricReader(metric_exporter)
-    meter_provider = MeterProvider(metric_readers=[metric_reader])
-    metrics.set_meter_provider(meter_provider)
\ No newline at end of file
+    metric_readers = []
+    # Without a collector the instruments record into a provider that exports nothing
+    if exporting_enabled():
+        metric_exporter = OTLPMetricExporter(**exporter_options())
+        metric_readers.append(PeriodicExportingMetricReader(metric_exporter))
+    meter_provider = MeterProvider(resource=resource(), metric_readers=metric_readers)
+    metrics.set_meter_provider(meter_provider)
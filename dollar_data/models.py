@@ -1,18 +1,211 @@
+import datetime
+from typing import Optional
+
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, REAL
+from sqlalchemy import func, Date, DateTime, Index, Integer, SmallInteger, String, REAL
 
 from dollar_data.database import Base
 
 
 class Dollar(Base):
     __tablename__ = "HistoricalDollar"
+    __table_args__ = (
+        # "latest row" lookups and date range scans per currency are seeks on this index
+        Index("ix_historicaldollar_currency_date", "currency", "date", unique=True),
+        # chart queries filtering by day of the month, already sorted by date
+        Index("ix_historicaldollar_currency_day_date", "currency", "day", "date"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
-    date: Mapped[str] = mapped_column(String(50))
+    date: Mapped[datetime.date] = mapped_column(Date, nullable=False)
     currency: Mapped[str] = mapped_column(String(3))
     buybid: Mapped[float] = mapped_column(REAL)
+    sellask: Mapped[Optional[float]] = mapped_column(REAL)
+    usd_buybid: Mapped[Optional[float]] = mapped_column(REAL)
+    usd_sellask: Mapped[Optional[float]] = mapped_column(REAL)
+    # Precomputed from date so that they can be indexed, see dollar_data.utils.insert_into_database
+    day: Mapped[int] = mapped_column(SmallInteger)
+    period: Mapped[str] = mapped_column(String(7))
 
     def __repr__(self) -> str:
         return f"Dollar(id={self.id!r}, date={self.date!r}, currency={self.currency!r}, buybid={self.buybid!r})"
 
     def as_dict(self):
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        data = {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        data["date"] = self.date.isoformat()
+        return data
+
+    @classmethod
+    def high_water_marks(cls) -> dict:
+        """Returns the date of the most recent row of every currency."""
+        rows = cls.query.with_entities(cls.currency, func.max(cls.date)).group_by(
+            cls.currency
+        )
+        return dict(rows.all())
+
+    @classmethod
+    def latest(cls, currency: str = "USD"):
+        """Returns the most recent row of a currency, or None if there is none."""
+        return (
+            cls.query.filter(cls.currency == currency).order_by(cls.date.desc()).first()
+        )
+
+
+class DataVersion(Base):
+    """A single row stamp bumped in the same transaction as every write of rates.
+
+    Caches of every process compare it against the version they were filled with, see
+    dollar_data.cache.
+    """
+
+    __tablename__ = "DataVersion"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer)
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+    @classmethod
+    def current(cls) -> int:
+        """Returns the current version, 0 when nothing was ever written."""
+        return cls.stamp()[0]
+
+    @classmethod
+    def stamp(cls) -> tuple:
+        """Returns the current version and when it was written, in UTC.
+
+        ``(0, None)`` when nothing was ever written.
+        """
+        row = cls.query.with_entities(cls.version, cls.updated_at).filter(cls.id == 1)
+        return tuple(row.first() or (0, None))
+
+
+class DataChange(Base):
+    """What a write of rates or aggregates changed, logged under the version it bumped.
+
+    One row per currency, with the oldest date written: every row of the currency from that
+    date on may have changed. A null currency means that everything may have changed. Read by
+    dollar_data.web.stream to push the changes to its clients.
+    """
+
+    __tablename__ = "DataChange"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, index=True)
+    # rates or aggregates
+    kind: Mapped[str] = mapped_column(String(10))
+    currency: Mapped[Optional[str]] = mapped_column(String(3))
+    since: Mapped[Optional[datetime.date]] = mapped_column(Date)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+
+class PendingRefresh(Base):
+    """A refresh of the data derived from the rates that a write of rates left to do.
+
+    Recorded in the transaction of the write, one row per step (e.g. ``aggregates``) and
+    currency, with the oldest date written since the step last ran and the ``DataVersion`` of
+    the last write. Deleted by dollar_data.refresh once the step succeeded, so a failed step is
+    run again by the next job instead of being forgotten.
+    """
+
+    __tablename__ = "PendingRefresh"
+    __table_args__ = (
+        Index("ix_pendingrefresh_step_currency", "step", "currency", unique=True),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    step: Mapped[str] = mapped_column(String(10))
+    currency: Mapped[str] = mapped_column(String(3))
+    since: Mapped[datetime.date] = mapped_column(Date, nullable=False)
+    version: Mapped[int] = mapped_column(Integer)
+
+
+class DataGap(Base):
+    """A business day without a rate for a currency, found by dollar_data.gaps.
+
+    Kept once resolved, with ``resolved_at`` set, so that a gap is never re-fetched more than
+    ``attempts`` allows even if it opens again.
+    """
+
+    __tablename__ = "DataGap"
+    __table_args__ = (
+        Index("ix_datagap_currency_date", "currency", "date", unique=True),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3))
+    date: Mapped[datetime.date] = mapped_column(Date, nullable=False)
+    detected_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+    # Re-fetches of the workbook of the date that did not fill the gap
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    attempted_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+    resolved_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+
+class AlertSubscription(Base):
+    """A notification sent when the ``buybid`` of a currency crosses a threshold.
+
+    Evaluated by dollar_data.alerts after every ingestion. A ``level`` subscription compares the
+    rate itself to ``threshold``, a ``change`` subscription its change in percent over the last
+    ``window`` days. It fires once per crossing, in ``direction``, and is sent to ``target``: an
+    ``http(s)://`` webhook or a ``mailto:`` address.
+    """
+
+    __tablename__ = "AlertSubscription"
+    __table_args__ = (Index("ix_alertsubscription_currency_kind", "currency", "kind"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3))
+    # level or change
+    kind: Mapped[str] = mapped_column(String(6))
+    # above or below
+    direction: Mapped[str] = mapped_column(String(5))
+    threshold: Mapped[float] = mapped_column(REAL)
+    # Days of a change subscription, null for a level one
+    window: Mapped[Optional[int]] = mapped_column(SmallInteger)
+    target: Mapped[str] = mapped_column(String(512))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+    triggered_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+    def as_dict(self):
+        data = {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        for name in ("created_at", "triggered_at"):
+            if data[name] is not None:
+                data[name] = data[name].isoformat()
+        return data
+
+
+class JobLock(Base):
+    """A lease on a job, see dollar_data.locks."""
+
+    __tablename__ = "JobLock"
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(128))
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+
+class RateAggregate(Base):
+    """OHLC and rolling statistics of the ``buybid`` of a currency over a period.
+
+    Maintained by dollar_data.analytics after every ingestion, one row per currency, resolution
+    (``daily``, ``weekly`` or ``monthly``) and period.
+    """
+
+    __tablename__ = "RateAggregate"
+    __table_args__ = (
+        Index(
+            "ix_rateaggregate_currency_resolution_period_start",
+            "currency",
+            "resolution",
+            "period_start",
+            unique=True,
+        ),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3))
+    resolution: Mapped[str] = mapped_column(String(7))
+    # First day of the period, and last day of the period with a published rate
+    period_start: Mapped[datetime.date] = mapped_column(Date, nullable=False)
+    period_end: Mapped[datetime.date] = mapped_column(Date)
+    open: Mapped[float] = mapped_column(REAL)
+    high: Mapped[float] = mapped_column(REAL)
+    low: Mapped[float] = mapped_column(REAL)
+    close: Mapped[float] = mapped_column(REAL)
+    # Null until there are enough previous periods
+    change: Mapped[Optional[float]] = mapped_column(REAL)
+    rolling_mean: Mapped[Optional[float]] = mapped_column(REAL)
+    volatility: Mapped[Optional[float]] = mapped_column(REAL)
+    devaluation: Mapped[Optional[float]] = mapped_column(REAL)
@@ -0,0 +1,232 @@
+"""Publishes the dashboard, JSON feeds and charts as static files for the web server.
+
+The data changes once per ingestion, so after every ingestion :func:`publish` renders, through
+the web app itself, everything that does not depend on the query of a visitor:
+
+* ``index.html``, the dashboard, whose chart starts from the feed of the whole USD series,
+* ``feeds/<currency>/<range>.json``, the response of ``/api/v1/rates`` for every currency and
+  every range of :data:`RANGES`, and ``feeds/index.json``, which lists them,
+* ``charts/<currency>/<range>.<format>`` for the currencies of :data:`CHART_CURRENCIES`,
+* ``static/``, the static files of the app.
+
+Every text file is saved next to its gzip (``.gz``) and, with the ``brotli`` package, brotli
+(``.br``) encodings, for the ``gzip_static`` and ``brotli_static`` modules of Nginx. The files
+are written to a new directory under ``versions/``, which the ``current`` symlink is then
+switched to with a rename, so the web server never serves a half published site. The last
+:data:`KEEP_VERSIONS` versions are kept.
+
+Run it with::
+
+    python -m dollar_data.publish --directory /var/www/dollar_data
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+
+from dollar_data.files import write_json
+from dollar_data.models import DataVersion, Dollar
+
+cwd = os.getcwd()
+PUBLISH_DIR = os.environ.get("PUBLISH_DIR", f"{cwd}/dollar_data/public/")
+# Published versions kept, the current one included
+KEEP_VERSIONS = int(os.environ.get("PUBLISH_KEEP_VERSIONS", 3))
+VERSIONS_DIR = "versions"
+CURRENT_LINK = "current"
+# Days of every feed before the day of publication, None for the whole history
+RANGES = {"1m": 31, "3m": 92, "1y": 366, "5y": 1827, "all": None}
+# Points of every feed, enough for a full width chart
+FEED_POINTS = 1000
+# Currencies with published charts, as comma separated codes
+CHART_CURRENCIES = tuple(
+    code.strip().upper()
+    for code in os.environ.get("PUBLISH_CHARTS", "USD").split(",")
+    if code.strip()
+)
+CHART_FORMATS = ("svg", "png")
+# Files whose encodings are published too, the others are already compressed
+COMPRESSIBLE = (".html", ".json", ".svg", ".css", ".js")
+
+logger = logging.getLogger(__name__)
+
+
+def publish(directory: str = PUBLISH_DIR, keep: int = KEEP_VERSIONS) -> str:
+    """Renders the site into a new version of ``directory`` and makes it the current one.
+
+    :param directory: Where the versions and the ``current`` symlink are.
+    :type directory: str
+    :param keep: How many versions are kept, the new one included.
+    :type keep: int
+    :return: The directory of the new version.
+    :rtype: str
+    :raises OSError: If the site cannot be written.
+
+    :Example:
+
+    .. code-block:: python
+
+        publish("/var/www/dollar_data")
+        # '/var/www/dollar_data/versions/v42-20240520T183000'
+    """
+    # The app is only created when publishing, it is not needed to import this module
+    from dollar_data.web.app import app
+    from dollar_data.web.api import chart_renderer
+
+    versions = os.path.join(directory, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    version, _ = DataVersion.stamp()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    name = f"v{version}-{now:%Y%m%dT%H%M%S}"
+
+    staging = tempfile.mkdtemp(prefix=f".{name}.", dir=versions)
+    try:
+        currencies = sorted(Dollar.high_water_marks())
+        with app.app_context():
+            client = app.test_client()
+            render_index(app, staging)
+            render_feeds(client, staging, currencies, now.date())
+            render_charts(client, staging, currencies, now.date())
+        shutil.copytree(app.static_folder, os.path.join(staging, "static"))
+        write_json(
+            os.path.join(staging, "version.json"),
+            {"version": name, "data_version": version, "published_at": now.isoformat()},
+            separators=(",", ":"),
+        )
+        precompress(staging)
+        # mkdtemp only lets its owner in, the web server runs as another user
+        os.chmod(staging, 0o755)
+        target = os.path.join(versions, name)
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        # The chart processes are not kept alive in the job runner between two publications
+        chart_renderer.shutdown()
+
+    switch(directory, target)
+    prune(directory, keep)
+    logger.info("Published %s.", target)
+    return target
+
+
+def render_index(app, directory: str):
+    """Renders the dashboard, starting from the feed of the whole USD series."""
+    from flask import render_template
+
+    with app.test_request_context("/"):
+        html = render_template("index.html", feed_url="/feeds/USD/all.json")
+    _write(os.path.join(directory, "index.html"), html.encode())
+
+
+def render_feeds(client, directory: str, currencies: list, today: datetime.date):
+    """Saves the response of ``/api/v1/rates`` for every currency and range."""
+    for currency in currencies:
+        for range_name, days in RANGES.items():
+            query = {"currency": currency, "max_points": FEED_POINTS}
+            if days is not None:
+                query["from"] = (today - datetime.timedelta(days=days)).isoformat()
+            path = os.path.join(directory, "feeds", currency, f"{range_name}.json")
+            _write(path, _get(client, "/api/v1/rates", query))
+    write_json(
+        os.path.join(directory, "feeds", "index.json"),
+        {"currencies": currencies, "ranges": list(RANGES)},
+        separators=(",", ":"),
+    )
+
+
+def render_charts(client, directory: str, currencies: list, today: datetime.date):
+    """Saves the charts of every range of the currencies of :data:`CHART_CURRENCIES`."""
+    for currency in CHART_CURRENCIES:
+        if currency not in currencies:
+            continue
+        for range_name, days in RANGES.items():
+            query = {"currency": currency}
+            if days is not None:
+                query["from"] = (today - datetime.timedelta(days=days)).isoformat()
+            for fmt in CHART_FORMATS:
+                path = os.path.join(
+                    directory, "charts", currency, f"{range_name}.{fmt}"
+                )
+                _write(path, _get(client, "/api/v1/chart", {**query, "format": fmt}))
+
+
+def _get(client, path: str, query: dict) -> bytes:
+    # Without Accept-Encoding the body is not compressed
+    response = client.get(path, query_string=query)
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"{path}?{query} answered {response.status_code}: {response.get_data()}"
+        )
+    return response.get_data()
+
+
+def precompress(directory: str):
+    """Saves the gzip and brotli encodings of every text file of ``directory`` next to it."""
+    from dollar_data.web.http_cache import compress
+
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if not filename.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, "rb") as f:
+                encoded = compress(f.read())
+            for encoding, extension in (("gzip", ".gz"), ("br", ".br")):
+                if encoding in encoded:
+                    _write(path + extension, encoded[encoding])
+
+
+def switch(directory: str, target: str):
+    """Points the ``current`` symlink of ``directory`` to ``target`` atomically.
+
+    The new link is created under a temporary name and renamed over the old one, so the link
+    always exists and always points to a complete version.
+    """
+    link = os.path.join(directory, CURRENT_LINK)
+    partial_link = f"{link}.{os.getpid()}.part"
+    os.symlink(os.path.relpath(target, directory), partial_link)
+    os.replace(partial_link, link)
+
+
+def prune(directory: str, keep: int = KEEP_VERSIONS):
+    """Removes all but the ``keep`` most recent versions, and never the current one.
+
+    Versions being written, whose names start with a dot, are left alone.
+    """
+    versions = os.path.join(directory, VERSIONS_DIR)
+    current = os.path.realpath(os.path.join(directory, CURRENT_LINK))
+    entries = sorted(
+        (
+            entry
+            for entry in os.scandir(versions)
+            if entry.is_dir() and not entry.name.startswith(".")
+        ),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in entries[keep:]:
+        if os.path.realpath(entry.path) != current:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directory", default=PUBLISH_DIR)
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS)
+    args = parser.parse_args()
+
+    print(publish(args.directory, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Refreshes of the data derived from the rates, left pending by every write of rates.
+
+A write of rates records, in its own transaction, every step that has to run again and from
+which date for every currency, in the ``PendingRefresh`` table (see
+:func:`dollar_data.upsert.upsert_rates`). :func:`run_pending` runs the steps and forgets them
+only once they succeeded, so a step that fails, or a job that stops between the write and the
+step, leaves the step to the next run instead of losing it.
+
+The steps, in the order they run:
+
+* ``aggregates``: :func:`dollar_data.analytics.refresh_aggregates`,
+* ``export``: :func:`dollar_data.export.export_rates`,
+* ``alerts``: :func:`dollar_data.alerts.notify_subscribers`, only left by the ingestion job,
+  older rates written by a backfill do not send alerts,
+* ``publish``: :func:`dollar_data.publish.publish`.
+"""
+
+import logging
+import threading
+
+import pandas as pd
+from sqlalchemy import delete, select
+
+from dollar_data.alerts import notify_subscribers
+from dollar_data.analytics import refresh_aggregates
+from dollar_data.database import engine
+from dollar_data.export import export_rates
+from dollar_data.locks import OWNER, lease
+from dollar_data.models import PendingRefresh
+from dollar_data.publish import publish
+from dollar_data.telemetry import stage
+
+# The steps of every job run under this lease, one run at a time even within a process
+LEASE = "refresh"
+LEASE_TTL = 600.0
+# Seconds a run waits for the run that holds the lease, which may be publishing the site
+LEASE_WAIT = 600.0
+
+logger = logging.getLogger(__name__)
+
+
+def _publish(since: dict) -> None:
+    # The site is published as a whole, whatever changed
+    publish()
+
+
+# Step -> name of its stage and function, called with the oldest date of every currency
+STEPS = {
+    "aggregates": ("aggregate", refresh_aggregates),
+    "export": ("export", export_rates),
+    "alerts": ("alerts", notify_subscribers),
+    "publish": ("publish", _publish),
+}
+
+
+def pending(step: str) -> tuple:
+    """Returns the refreshes of ``step`` left to do.
+
+    :param step: A step of :data:`STEPS`.
+    :type step: str
+    :return: The oldest date to refresh of every currency, as ``pandas.Timestamp``, and the
+             version each refresh was recorded with.
+    :rtype: tuple
+    """
+    statement = select(
+        PendingRefresh.currency, PendingRefresh.since, PendingRefresh.version
+    ).where(PendingRefresh.step == step)
+    with engine.connect() as connection:
+        rows = connection.execute(statement).all()
+    since = {currency: pd.Timestamp(date) for currency, date, _ in rows}
+    versions = {currency: version for currency, _, version in rows}
+    return since, versions
+
+
+def run_pending(steps=tuple(STEPS), wait: float = LEASE_WAIT) -> list:
+    """Runs the pending refreshes of ``steps``, forgetting the ones that succeed.
+
+    A failed step is logged and stays pending, the other steps run anyway. A refresh recorded
+    again by a write while its step was running stays pending too, as the step may not have
+    seen the new rates.
+
+    The steps run under the :data:`LEASE` lease, so that two jobs, in this process or another
+    one, never refresh the same data at the same time. A run waits up to ``wait`` seconds for
+    the lease, then leaves its steps pending and reports them as failed.
+
+    :param steps: The steps to run, every step of :data:`STEPS` by default.
+    :type steps: Iterable[str]
+    :param wait: For how many seconds to wait for another run, :data:`LEASE_WAIT` by default.
+    :type wait: float
+    :return: The steps that failed.
+    :rtype: list
+
+    :Example:
+
+    .. code-block:: python
+
+        insert_into_database(read_rates("data.xls"))
+        run_pending()
+        # []
+    """
+    # The owner of the leases of this process takes them again, every thread is its own owner
+    owner = f"{OWNER}:{threading.get_ident()}"
+    with lease(LEASE, LEASE_TTL, owner, wait) as acquired:
+        if not acquired:
+            logger.warning("The refreshes are still running somewhere else.")
+            return [step for step in STEPS if step in steps and pending(step)[0]]
+        return _run(steps)
+
+
+def _run(steps) -> list:
+    failed = list()
+    for step in STEPS:
+        if step not in steps:
+            continue
+        since, versions = pending(step)
+        if not since:
+            continue
+        stage_name, refresh = STEPS[step]
+        try:
+            with stage(stage_name) as running:
+                rows = refresh(since)
+                if isinstance(rows, int):
+                    running.rows = rows
+        except Exception:
+            logger.exception("Could not refresh the %s of %s.", step, sorted(since))
+            failed.append(step)
+            continue
+        forget(step, versions)
+    return failed
+
+
+def forget(step: str, versions: dict):
+    """Deletes the refreshes of ``step`` that were not recorded again since ``versions``."""
+    with engine.begin() as connection:
+        for currency, version in versions.items():
+            connection.execute(
+                delete(PendingRefresh).where(
+                    PendingRefresh.step == step,
+                    PendingRefresh.currency == currency,
+                    PendingRefresh.version == version,
+                )
+            )
@@ -0,0 +1,175 @@
+"""Job runner of the ingestion jobs.
+
+The jobs run in their own process, outside of the gunicorn workers, so they never compete with
+request threads for the GIL. ``gunicorn.conf.py`` starts it next to the workers; set
+``DOLLAR_DATA_JOB_RUNNER=external`` to run it elsewhere with::
+
+    python -m dollar_data.scheduler
+
+Every job takes a lease (see :mod:`dollar_data.locks`) before running, so even with several
+runners, e.g. one per container, a job never runs twice at the same time. Failed runs are
+retried with exponential backoff, and the duration, outcome and lag of every job are recorded
+with OpenTelemetry.
+
+The schedule is only kept in memory: a runner that starts, or restarts, runs every job a full
+interval later, unless it is started with ``--run-now``. Runs missed while the runner is up,
+e.g. because the previous run was still going, are coalesced into one.
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from opentelemetry import metrics, trace
+from opentelemetry.metrics import Observation
+
+from dollar_data.locks import lease
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+duration_histogram = meter.create_histogram(
+    "dollar_data.job.duration", unit="s", description="Duration of the job runs"
+)
+runs_counter = meter.create_counter(
+    "dollar_data.job.runs",
+    description="Job runs by status: success, failure or skipped",
+)
+# When every job last succeeded, by id, as a monotonic time
+last_success = dict()
+
+
+def observe_lag(options):
+    now = time.monotonic()
+    for job_id, succeeded_at in last_success.items():
+        yield Observation(now - succeeded_at, {"job": job_id})
+
+
+meter.create_observable_gauge(
+    "dollar_data.job.lag",
+    callbacks=[observe_lag],
+    unit="s",
+    description="Time since the last successful run of the job",
+)
+
+# Lease duration, renewed while the job runs
+LEASE_TTL = 600.0
+RETRIES = 3
+BACKOFF = 60.0
+
+
+def run_exclusively(
+    job_id: str, func, retries: int = RETRIES, backoff: float = BACKOFF
+):
+    """Runs ``func`` while holding the lease ``job_id``, retrying it when it fails.
+
+    The run is skipped when another process holds the lease. A failed attempt is retried up to
+    ``retries`` times, waiting ``backoff * 2 ** attempt`` seconds before each retry; the lease is
+    kept during the waits so that no other runner starts the job meanwhile.
+
+    :param job_id: The id of the job, also the name of its lease.
+    :type job_id: str
+    :param func: The job.
+    :type func: Callable[[], Any]
+    :param retries: How many times a failed run is retried.
+    :type retries: int
+    :param backoff: The wait before the first retry, in seconds.
+    :type backoff: float
+    :return: Whether the job ran and succeeded.
+    :rtype: bool
+    :raises Exception: The error of the last attempt, if every attempt failed.
+    """
+    with lease(job_id, LEASE_TTL) as acquired:
+        if not acquired:
+            logger.info("%s is running somewhere else, skipping.", job_id)
+            runs_counter.add(1, {"job": job_id, "status": "skipped"})
+            return False
+        for attempt in range(retries + 1):
+            start = time.monotonic()
+            try:
+                # The stages of the job are children of this span
+                with tracer.start_as_current_span(
+                    f"dollar_data.job.{job_id}", attributes={"attempt": attempt}
+                ):
+                    func()
+            except Exception as e:
+                duration_histogram.record(
+                    time.monotonic() - start, {"job": job_id, "status": "failure"}
+                )
+                runs_counter.add(1, {"job": job_id, "status": "failure"})
+                if attempt == retries:
+                    raise
+                wait = backoff * 2**attempt
+                logger.warning("%s failed (%r), retrying in %.0fs.", job_id, e, wait)
+                time.sleep(wait)
+            else:
+                duration_histogram.record(
+                    time.monotonic() - start, {"job": job_id, "status": "success"}
+                )
+                runs_counter.add(1, {"job": job_id, "status": "success"})
+                last_success[job_id] = time.monotonic()
+                return True
+
+
+def create_scheduler(run_now: bool = False) -> BlockingScheduler:
+    """Creates the scheduler of the ingestion jobs, every 24 hours.
+
+    Runs missed while the runner is up, e.g. while the previous run of the job is still going,
+    are coalesced into a single run, as long as they are less than an hour late, and a job never
+    overlaps with itself. The schedule is not stored: after a restart the first run is 24 hours
+    later, unless ``run_now`` is set.
+
+    :param run_now: Also run every job right away.
+    :type run_now: bool
+    :return: The scheduler, not started.
+    :rtype: BlockingScheduler
+    """
+    from dollar_data.jobs import repair_gaps, update_database
+
+    scheduler = BlockingScheduler(
+        job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 3600}
+    )
+    # Otherwise the first run is 24 hours after starting
+    first_run = {"next_run_time": datetime.now()} if run_now else {}
+    for job_id, func in (
+        ("update_database", update_database),
+        ("repair_gaps", repair_gaps),
+    ):
+        scheduler.add_job(
+            func=run_exclusively,
+            args=(job_id, func),
+            trigger="interval",
+            id=job_id,
+            hours=24,
+            **first_run,
+        )
+    return scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--run-now", action="store_true", help="run every job when starting"
+    )
+    args = parser.parse_args()
+
+    from dollar_data.database import init_db
+    from dollar_data.logging import configure_logging
+    from dollar_data.metrics import configure_metrics
+    from dollar_data.tracing import configure_tracing
+
+    init_db()
+    configure_metrics()
+    configure_logging()
+    configure_tracing()
+    scheduler = create_scheduler(args.run_now)
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Settings of the OpenTelemetry exporters and instrumentation of the ingestion stages.
+
+The exporters of :mod:`dollar_data.tracing`, :mod:`dollar_data.metrics` and
+:mod:`dollar_data.logging` send to the OTLP collector at ``OTEL_EXPORTER_OTLP_ENDPOINT``,
+``http://localhost:4317`` by default, as the service ``OTEL_SERVICE_NAME``. When the collector
+does not accept connections at startup, or ``OTEL_SDK_DISABLED=true``, no exporter is installed:
+spans and measurements are still created, so the code paths stay the same, but nothing is
+exported, nothing is retried in the background and the processes exit without waiting on the
+collector.
+
+Every stage of the ingestion runs in :func:`stage`, which opens a span and records its duration
+and the rows it processed. :func:`instrument_engine` adds a span and a duration measurement to
+every query of a SQLAlchemy engine.
+"""
+
+import functools
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from opentelemetry import metrics, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "dollar-data")
+SERVICE_VERSION = os.environ.get("OTEL_SERVICE_VERSION", "1.0.0")
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
+# Seconds an export may take, the exports run in background threads
+OTLP_TIMEOUT = int(os.environ.get("OTEL_EXPORTER_OTLP_TIMEOUT", 5))
+# Seconds to wait for the collector when checking that it is up
+CONNECT_TIMEOUT = 0.5
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+stage_duration = meter.create_histogram(
+    "dollar_data.stage.duration",
+    unit="s",
+    description="Duration of the ingestion stages, by stage and status",
+)
+stage_rows = meter.create_histogram(
+    "dollar_data.stage.rows", description="Rows processed by the ingestion stages"
+)
+query_duration = meter.create_histogram(
+    "dollar_data.db.query.duration",
+    unit="s",
+    description="Duration of the database queries, by operation",
+)
+
+
+def resource():
+    """Returns the resource describing this service, shared by every provider."""
+    from opentelemetry.sdk.resources import Resource
+
+    return Resource.create(
+        {"service.name": SERVICE_NAME, "service.version": SERVICE_VERSION}
+    )
+
+
+def exporter_options() -> dict:
+    """Returns the keyword arguments of the OTLP gRPC exporters."""
+    return {"endpoint": OTLP_ENDPOINT, "insecure": True, "timeout": OTLP_TIMEOUT}
+
+
+@functools.cache
+def exporting_enabled() -> bool:
+    """Whether the exporters should be installed, checked once per process.
+
+    :return: False if the SDK is disabled or the collector refuses connections.
+    :rtype: bool
+    """
+    if os.environ.get("OTEL_SDK_DISABLED", "").lower() == "true":
+        return False
+    endpoint = urlsplit(
+        OTLP_ENDPOINT if "//" in OTLP_ENDPOINT else f"//{OTLP_ENDPOINT}"
+    )
+    try:
+        with socket.create_connection(
+            (endpoint.hostname or "localhost", endpoint.port or 4317), CONNECT_TIMEOUT
+        ):
+            return True
+    except OSError as e:
+        logger.warning(
+            "No OTLP collector at %s (%s), telemetry is not exported.", OTLP_ENDPOINT, e
+        )
+        return False
+
+
+class Stage:
+    """A running stage of :func:`stage`, set ``rows`` to record how many rows it processed."""
+
+    def __init__(self, name: str, span):
+        self.name = name
+        self.span = span
+        self.rows = None
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Runs a stage of the ingestion in a span, recording its duration and rows.
+
+    :param name: The name of the stage, e.g. ``download`` or ``write``.
+    :type name: str
+    :param attributes: Added to the span.
+    :return: The stage, whose ``rows`` can be set before it ends.
+    :rtype: Stage
+
+    :Example:
+
+    .. code-block:: python
+
+        with stage("parse", path=download.path) as parsing:
+            df = read_rates(download.path)
+            parsing.rows = len(df)
+    """
+    status = "success"
+    start = time.perf_counter()
+    with tracer.start_as_current_span(
+        f"dollar_data.{name}", attributes=attributes
+    ) as span:
+        running = Stage(name, span)
+        try:
+            yield running
+        except BaseException:
+            status = "failure"
+            raise
+        finally:
+            stage_duration.record(
+                time.perf_counter() - start, {"stage": name, "status": status}
+            )
+            if running.rows is not None:
+                span.set_attribute("dollar_data.rows", running.rows)
+                stage_rows.record(running.rows, {"stage": name})
+
+
+def instrument_engine(engine):
+    """Wraps every query of ``engine`` in a client span and records its duration.
+
+    The span is a child of the current one, e.g. of the request or of the stage running the
+    query, and is named after the SQL operation.
+
+    :param engine: The engine to instrument.
+    :type engine: sqlalchemy.Engine
+    """
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+        span = tracer.start_span(
+            operation or "query",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": system,
+                "db.operation": operation,
+                "db.statement": statement,
+            },
+        )
+        conn.info.setdefault("dollar_data.queries", []).append(
+            (span, operation, time.perf_counter())
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        _end_query(conn.info)
+
+    @event.listens_for(engine, "handle_error")
+    def fail_query(context):
+        if context.connection is not None:
+            _end_query(context.connection.info, context.original_exception)
+
+
+def _end_query(info: dict, error: BaseException | None = None):
+    queries = info.get("dollar_data.queries")
+    if not queries:
+        return
+    span, operation, start = queries.pop()
+    query_duration.record(
+        time.perf_counter() - start,
+        {"db.operation": operation, "status": "failure" if error else "success"},
+    )
+    if error is not None:
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+    span.end()
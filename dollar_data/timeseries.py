@@ -0,0 +1,56 @@
+"""Helpers to reduce time series to a number of points a chart can draw."""
+
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Selects the points to keep with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always kept. The points in between are split into
+    ``threshold - 2`` buckets and, for every bucket, the point forming the largest triangle
+    with the point kept from the previous bucket and the average of the next bucket is kept.
+    The areas of a bucket are computed at once with NumPy, so the cost is linear in the number
+    of points with one Python iteration per bucket.
+
+    :param x: The x values, sorted in ascending order.
+    :type x: np.ndarray
+    :param y: The y values.
+    :type y: np.ndarray
+    :param threshold: The number of points to keep, at least 3.
+    :type threshold: int
+    :return: The sorted indices of the points to keep, every index if there are not more
+             points than ``threshold``.
+    :rtype: np.ndarray
+
+    :Example:
+
+    .. code-block:: python
+
+        x = np.arange(10_000, dtype=float)
+        y = np.sin(x / 100)
+        keep = lttb(x, y, 500)
+        x[keep], y[keep]  # 500 points that keep the shape of the curve
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # Bucket edges over the points between the first and the last one
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        keep[bucket + 1] = previous
+    return keep
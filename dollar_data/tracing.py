@@ -1,25 +1,39 @@
+import functools
+
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.resources import Resource
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
-def configure_tracing(app):
-    # Configure resource
-    resource = Resource(attributes={
-        "service.name": "your-flask-service",
-        "service.version": "1.0.0"
-    })
+from dollar_data.database import engine
+from dollar_data.telemetry import (
+    exporter_options,
+    exporting_enabled,
+    instrument_engine,
+    resource,
+)
+
+
+def configure_tracing(app=None):
+    _configure_provider()
+    # Flask in the web workers, and in the job runner when it publishes the site
+    if app is not None:
+        FlaskInstrumentor().instrument_app(app)
+
 
+# Once per process, the queries of the engine would get a span per instrumentation
+@functools.cache
+def _configure_provider():
     # Set up tracer provider
-    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider = TracerProvider(resource=resource())
     trace.set_tracer_provider(tracer_provider)
 
-    # Configure OTLP exporter
-    otlp_exporter = OTLPSpanExporter(endpoint="http://localhost:4317", insecure=True)
-    span_processor = BatchSpanProcessor(otlp_exporter)
-    tracer_provider.add_span_processor(span_processor)
+    # Configure OTLP exporter, spans are only kept in process without a collector
+    if exporting_enabled():
+        otlp_exporter = OTLPSpanExporter(**exporter_options())
+        span_processor = BatchSpanProcessor(otlp_exporter)
+        tracer_provider.add_span_processor(span_processor)
 
-    # Instrument Flask
-    FlaskInstrumentor().instrument_app(app)
\ No newline at end of file
+    # Instrument the queries
+    instrument_engine(engine)
@@ -0,0 +1,306 @@
+"""Idempotent bulk writes of exchange rates into the "HistoricalDollar" table.
+
+Rows are identified by ``(currency, date)``: a row that does not exist yet is inserted, a row
+whose rates changed is updated and a row that is already stored as is gets skipped, so the same
+workbook can be written any number of times without duplicating data.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import Engine, text
+
+# DataFrame column -> HistoricalDollar column, the first two form the conflict target
+UPSERT_COLUMNS = {
+    "Date": "date",
+    "Currency": "currency",
+    "Buy(BS. S BID)": "buybid",
+    "Sell(BS. S ASK)": "sellask",
+    "Buy(USD BID)": "usd_buybid",
+    "Sell(USD ASK)": "usd_sellask",
+}
+RATE_FIELDS = list(UPSERT_COLUMNS.values())[2:]
+INSERT_FIELDS = ["date", "currency", *RATE_FIELDS, "day", "period"]
+
+UPSERT_STATEMENT = (
+    f'INSERT INTO "HistoricalDollar" ({", ".join(INSERT_FIELDS)}) '
+    f'VALUES ({", ".join(f":{field}" for field in INSERT_FIELDS)}) '
+    "ON CONFLICT (currency, date) DO UPDATE SET "
+    + ", ".join(f"{field} = excluded.{field}" for field in RATE_FIELDS)
+    # Rows stored with the very same rates are left untouched and counted as skipped
+    + f' WHERE ({", ".join(RATE_FIELDS)})'
+    + f' IS DISTINCT FROM ({", ".join(f"excluded.{field}" for field in RATE_FIELDS)})'
+)
+
+# Tells the caches of every process that the rates changed, see dollar_data.cache
+BUMP_VERSION_STATEMENT = (
+    'INSERT INTO "DataVersion" (id, version, updated_at) VALUES (1, 1, :updated_at) '
+    "ON CONFLICT (id) DO UPDATE SET "
+    'version = "DataVersion".version + 1, updated_at = excluded.updated_at'
+)
+
+# Logs what a write changed under the version it just bumped, see dollar_data.web.stream
+RECORD_CHANGE_STATEMENT = (
+    'INSERT INTO "DataChange" (version, kind, currency, since, created_at) '
+    'SELECT version, :kind, :currency, :since, updated_at FROM "DataVersion" WHERE id = 1'
+)
+PRUNE_CHANGES_STATEMENT = 'DELETE FROM "DataChange" WHERE created_at < :cutoff'
+# Leaves the refreshes of the data derived from the rates to do, see dollar_data.refresh. A
+# refresh that is already pending keeps the oldest date and takes the new version.
+RECORD_PENDING_STATEMENT = (
+    'INSERT INTO "PendingRefresh" (step, currency, since, version) '
+    'SELECT :step, :currency, :since, version FROM "DataVersion" WHERE id = 1 '
+    "ON CONFLICT (step, currency) DO UPDATE SET version = excluded.version, since = CASE "
+    'WHEN excluded.since < "PendingRefresh".since THEN excluded.since '
+    'ELSE "PendingRefresh".since END'
+)
+# Refreshes left to do by every write of rates
+REFRESH_STEPS = ("aggregates", "export", "publish")
+# Clients of the stream that were disconnected for longer start over
+CHANGE_RETENTION = timedelta(days=7)
+
+# On top of the pragmas that dollar_data.database sets on every connection
+SQLITE_PRAGMAS = ("PRAGMA cache_size=-65536",)
+
+
+@dataclass(frozen=True)
+class UpsertResult:
+    """Counts of the rows written by :func:`upsert_rates`."""
+
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    @property
+    def changed(self) -> int:
+        return self.inserted + self.updated
+
+    def __add__(self, other: "UpsertResult") -> "UpsertResult":
+        return UpsertResult(
+            inserted=self.inserted + other.inserted,
+            updated=self.updated + other.updated,
+            skipped=self.skipped + other.skipped,
+        )
+
+
+def to_records(df: DataFrame) -> list:
+    """Converts a rates DataFrame into the parameter dictionaries of the upsert statement.
+
+    The conversion is vectorized per column: dates are rendered once as ``YYYY-MM-DD`` (the way
+    SQLAlchemy stores a ``Date`` on SQLite), ``day`` and ``period`` are derived from them and
+    missing rates become ``None``. Only the ``Date``, ``Currency`` and ``Buy(BS. S BID)`` columns
+    are required.
+
+    :param df: A DataFrame as returned by :func:`dollar_data.utils.read_rates`.
+    :type df: DataFrame
+    :raises KeyError: If the DataFrame does not contain the required columns.
+    :return: One dictionary per row, keyed by the HistoricalDollar column names.
+    :rtype: list
+    """
+    required_columns = list(UPSERT_COLUMNS)[:3]
+    if not all(col in df.columns for col in required_columns):
+        raise KeyError(f"DataFrame must contain columns: {required_columns}")
+
+    dates = pd.to_datetime(df["Date"])
+    columns = {
+        "date": dates.dt.strftime("%Y-%m-%d").tolist(),
+        "currency": df["Currency"].tolist(),
+        "day": dates.dt.day.tolist(),
+        "period": dates.dt.strftime("%Y-%m").tolist(),
+    }
+    for source, field in list(UPSERT_COLUMNS.items())[2:]:
+        if source in df.columns:
+            values = df[source].astype(object)
+            columns[field] = values.where(values.notna(), None).tolist()
+        else:
+            columns[field] = [None] * len(df)
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def upsert_rates(
+    df: DataFrame, engine: Engine, refresh: tuple = REFRESH_STEPS
+) -> UpsertResult:
+    """Inserts or updates the rates of a DataFrame in a single transaction.
+
+    SQLite databases take a fast path: the statement is run through the DBAPI ``executemany``
+    of one raw connection, with a bigger page cache. In WAL mode readers keep seeing the
+    previous rates until the write commits instead of waiting for it.
+    Other backends run the same statement through SQLAlchemy. Either way the whole batch is
+    committed at once or not at all.
+
+    When any row is inserted or updated the ``DataVersion`` stamp is bumped in the same
+    transaction, so caches are invalidated exactly when the new rates become visible, and the
+    ``refresh`` steps are recorded as pending from the oldest date written of every currency,
+    so they are not lost if the process stops before running them.
+
+    Inserted rows are counted as the rows whose id is above the highest id before the write,
+    updated rows as the remaining changes reported by the driver, and every other row as skipped.
+
+    :param df: A DataFrame as returned by :func:`dollar_data.utils.read_rates`.
+    :type df: DataFrame
+    :param engine: The SQLAlchemy Engine of the database to write to.
+    :type engine: Engine
+    :param refresh: The steps of :mod:`dollar_data.refresh` to run after the write,
+                    :data:`REFRESH_STEPS` by default.
+    :type refresh: tuple
+    :raises TypeError: If the input `df` is not a Pandas DataFrame.
+    :raises KeyError: If the DataFrame does not contain the required columns.
+    :return: How many rows were inserted, updated and skipped.
+    :rtype: UpsertResult
+
+    :Example:
+
+    .. code-block:: python
+
+        result = upsert_rates(read_rates("data.xls"), engine)
+        # UpsertResult(inserted=1302, updated=0, skipped=0)
+        result = upsert_rates(read_rates("data.xls"), engine)
+        # UpsertResult(inserted=0, updated=0, skipped=1302)
+    """
+    if not isinstance(df, DataFrame):
+        raise TypeError("Input 'df' must be a Pandas DataFrame")
+
+    records = to_records(df)
+    if not records:
+        return UpsertResult()
+    dates = pd.to_datetime(df["Date"]).dt.strftime("%Y-%m-%d")
+    changes = _change_parameters("rates", dates.groupby(df["Currency"]).min().to_dict())
+    pending = [
+        {"step": step, "currency": change["currency"], "since": change["since"]}
+        for step in refresh
+        for change in changes
+    ]
+    if engine.dialect.name == "sqlite":
+        changed, inserted = _upsert_sqlite(engine, records, changes, pending)
+    else:
+        changed, inserted = _upsert_generic(engine, records, changes, pending)
+    return UpsertResult(
+        inserted=inserted,
+        updated=changed - inserted,
+        skipped=len(records) - changed,
+    )
+
+
+def _upsert_sqlite(
+    engine: Engine, records: list, changes: list, pending: list = ()
+) -> tuple:
+    statement = UPSERT_STATEMENT.replace("IS DISTINCT FROM", "IS NOT")
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            (max_id,) = cursor.execute(
+                'SELECT coalesce(max(id), 0) FROM "HistoricalDollar"'
+            ).fetchone()
+            cursor.executemany(statement, records)
+            changed = cursor.rowcount
+            (inserted,) = cursor.execute(
+                'SELECT count(*) FROM "HistoricalDollar" WHERE id > ?', (max_id,)
+            ).fetchone()
+            if changed:
+                cursor.execute(BUMP_VERSION_STATEMENT, _version_parameters())
+                cursor.executemany(RECORD_CHANGE_STATEMENT, changes)
+                cursor.execute(PRUNE_CHANGES_STATEMENT, _prune_parameters())
+                cursor.executemany(RECORD_PENDING_STATEMENT, pending)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+    return changed, inserted
+
+
+def _upsert_generic(
+    engine: Engine, records: list, changes: list, pending: list = ()
+) -> tuple:
+    with engine.begin() as connection:
+        max_id = connection.execute(
+            text('SELECT coalesce(max(id), 0) FROM "HistoricalDollar"')
+        ).scalar_one()
+        changed = connection.execute(text(UPSERT_STATEMENT), records).rowcount
+        inserted = connection.execute(
+            text('SELECT count(*) FROM "HistoricalDollar" WHERE id > :id'),
+            {"id": max_id},
+        ).scalar_one()
+        if changed:
+            bump_data_version(connection)
+            connection.execute(text(RECORD_CHANGE_STATEMENT), changes)
+            connection.execute(text(PRUNE_CHANGES_STATEMENT), _prune_parameters())
+            if pending:
+                connection.execute(text(RECORD_PENDING_STATEMENT), pending)
+    return changed, inserted
+
+
+def bump_data_version(connection):
+    """Bumps the ``DataVersion`` stamp in the transaction of ``connection``.
+
+    For writes of data derived from the rates, so that caches filled meanwhile are dropped.
+    """
+    connection.execute(text(BUMP_VERSION_STATEMENT), _version_parameters())
+
+
+def record_changes(connection, kind: str, since: dict | None):
+    """Logs the changes of a write in the ``DataChange`` table, after :func:`bump_data_version`.
+
+    :param connection: The connection of the transaction of the write.
+    :type connection: sqlalchemy.Connection
+    :param kind: What was written, ``rates`` or ``aggregates``.
+    :type kind: str
+    :param since: The oldest date written for every currency, or None if everything may have
+                  changed.
+    :type since: dict | None
+    """
+    connection.execute(text(RECORD_CHANGE_STATEMENT), _change_parameters(kind, since))
+    connection.execute(text(PRUNE_CHANGES_STATEMENT), _prune_parameters())
+
+
+def record_pending(connection, since: dict, steps: tuple = REFRESH_STEPS):
+    """Leaves ``steps`` to refresh from ``since``, after :func:`bump_data_version`.
+
+    :param connection: The connection of the transaction of the write.
+    :type connection: sqlalchemy.Connection
+    :param since: The oldest date written for every currency.
+    :type since: dict
+    :param steps: The steps of :mod:`dollar_data.refresh`, :data:`REFRESH_STEPS` by default.
+    :type steps: tuple
+    """
+    connection.execute(
+        text(RECORD_PENDING_STATEMENT),
+        [
+            {"step": step, "currency": change["currency"], "since": change["since"]}
+            for step in steps
+            for change in _change_parameters("rates", since)
+        ],
+    )
+
+
+def _change_parameters(kind: str, since: dict | None) -> list:
+    if since is None:
+        return [{"kind": kind, "currency": None, "since": None}]
+    return [
+        {
+            "kind": kind,
+            "currency": currency,
+            "since": pd.Timestamp(date).strftime("%Y-%m-%d"),
+        }
+        for currency, date in since.items()
+    ]
+
+
+def _prune_parameters() -> dict:
+    cutoff = datetime.now(timezone.utc) - CHANGE_RETENTION
+    return {"cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S.000000")}
+
+
+def _version_parameters() -> dict:
+    # Stored in UTC, without the time zone, and to the second like HTTP dates
+    now = datetime.now(timezone.utc)
+    return {"updated_at": now.strftime("%Y-%m-%d %H:%M:%S.000000")}
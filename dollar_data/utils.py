@@ -2,19 +2,33 @@
 
 import os
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine
 import xlrd
-import matplotlib.pyplot as plt
 import pathlib
+import tempfile
+from urllib.parse import urljoin
 import requests
 from bs4 import BeautifulSoup
 
+from dollar_data.charts import render_chart
+from dollar_data.database import engine
+from dollar_data.telemetry import stage
+from dollar_data.upsert import REFRESH_STEPS, UpsertResult, upsert_rates
+
 pd.options.mode.copy_on_write = True
 
 cwd = os.getcwd()
-engine = create_engine(f"sqlite:////{cwd}/database.db", echo=True)
+
+# Can point to a stand-in of the BCV website, e.g. a local HTTP server
+BCV_URL = os.environ.get(
+    "BCV_URL", "https://www.bcv.org.ve/estadisticas/tipo-cambio-de-referencia-smc"
+)
+# Links to the daily workbooks in the table of the statistics page
+WORKBOOK_LINKS_SELECTOR = "#block-system-main > div > div.view-content > table > tbody > tr > td.views-field.views-field-field-diario > span > a"
+EXCEL_FILES_DIR = f"{cwd}/dollar_data/excel_files/"
 
 
 def read_xls(path: pathlib.Path | str) -> list:
@@ -62,6 +76,88 @@ def read_xls(path: pathlib.Path | str) -> list:
     return data
 
 
+RATE_COLUMNS = [
+    "Date",
+    "Currency",
+    "Country",
+    "Buy(USD BID)",
+    "Sell(USD ASK)",
+    "Buy(BS. S BID)",
+    "Sell(BS. S ASK)",
+]
+
+
+def read_rates(path: pathlib.Path | str, since=None) -> DataFrame:
+    """Reads the rates of every currency from an Excel (.xls) file into typed columns.
+
+    Unlike :func:`read_xls`, the rate block is not assumed to live in rows 10 to 30. Each
+    sheet is read column by column with ``xlrd`` and every sheet is concatenated before any
+    conversion, so the filtering and type conversions run once, vectorized, over the whole
+    workbook. A row belongs to the rate block when its second cell is a three letter currency
+    code and its ``Buy(BS. S BID)`` cell is a number. Sheets are loaded on demand and unloaded
+    as soon as their columns are copied, so only one sheet is held in memory at a time.
+
+    Sheets are selected by the date in their name before any of them is opened, so with
+    ``since`` only the sheets published after that date are ever loaded.
+
+    :param path: The path to the Excel file.  Can be a string or a pathlib.Path object.
+    :type path: pathlib.Path | str
+    :param since: Skip the sheets dated on or before this date, read every sheet if None.
+    :type since: datetime.date | pd.Timestamp | None
+    :return: A DataFrame with the :data:`RATE_COLUMNS` columns, a ``datetime64`` ``Date``
+             column parsed from the sheet names and ``float64`` rate columns, sorted by date.
+    :rtype: DataFrame
+    :raises FileNotFoundError: If the specified file does not exist.
+    :raises XLRDError: If there is an error reading the Excel file (e.g., invalid format).
+
+    :Example:
+
+    .. code-block:: python
+
+        rates = read_rates("data.xls")
+        print(rates[rates["Currency"] == "EUR"])
+        #         Date Currency Country  Buy(USD BID)  Sell(USD ASK)  Buy(BS. S BID)  Sell(BS. S ASK)
+        # 0 2024-01-20      EUR  U.M.E.      1.087800       1.089100       39.289012        39.336028
+        new_rates = read_rates("data.xls", since=datetime.date(2024, 1, 19))
+    """
+    sheet_dates = list()
+    sheet_sizes = list()
+    columns = [list() for _ in RATE_COLUMNS[1:]]
+    wb = xlrd.open_workbook(path, on_demand=True)
+    try:
+        names = wb.sheet_names()
+        # The current format names each sheet with the date
+        dates = pd.to_datetime(
+            pd.Series(names, dtype=object), format="%d%m%Y", errors="coerce"
+        )
+        selected = dates.notna() if since is None else dates > pd.Timestamp(since)
+        for sheetx in np.flatnonzero(selected.to_numpy()).tolist():
+            sheet = wb.sheet_by_index(sheetx)
+            if sheet.ncols >= len(RATE_COLUMNS):
+                # The first column of the sheet is blank
+                for colx, values in enumerate(columns, start=1):
+                    values.extend(sheet.col_values(colx))
+                sheet_dates.append(dates.iat[sheetx])
+                sheet_sizes.append(sheet.nrows)
+            wb.unload_sheet(sheetx)
+    finally:
+        wb.release_resources()
+
+    df = DataFrame(dict(zip(RATE_COLUMNS[1:], columns)))
+    df.insert(
+        0, "Date", np.repeat(np.array(sheet_dates, dtype="datetime64[ns]"), sheet_sizes)
+    )
+    for column in RATE_COLUMNS[3:]:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+
+    currencies = df["Currency"].astype(str).str.strip()
+    mask = currencies.str.fullmatch("[A-Z]{3}", na=False) & df["Buy(BS. S BID)"].notna()
+    df = df[mask]
+    df["Currency"] = currencies[mask]
+    df["Country"] = df["Country"].astype(str).str.strip()
+    return df.sort_values("Date", kind="stable").reset_index(drop=True)
+
+
 def clean_dataframe(df: DataFrame) -> None:
     """Renames columns in a Pandas DataFrame.
 
@@ -190,10 +286,12 @@ def dollar_to_bs_rate_plot(df: DataFrame):
         df = pd.DataFrame(data)
         dollar_to_bs_rate_plot(df)  # Displays the plot.
     """
+    # Interactive, unlike the headless charts of dollar_data.charts
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
-    df_bs_dollar_date = dollar_to_bs_rate(df)
+    df_bs_dollar_date = dollar_to_bs_rate(df).sort_values("Date")
     plt.xticks(rotation=75)
-    df_bs_dollar_date.sort_values("Date")
     df_bs_dollar_date.plot(
         ax=ax,
         x="Date",
@@ -205,22 +303,24 @@ def dollar_to_bs_rate_plot(df: DataFrame):
     ax.legend(["Bolívar respecto al Dólar"])
 
 
-def plot_pdf(df: DataFrame):
+def plot_pdf(df: DataFrame, path: pathlib.Path | str = "dollar_to_bs_rate.pdf") -> str:
     """Generates and saves a PDF plot of the USD to BS. S exchange rate over time.
 
     This function takes a Pandas DataFrame, extracts the USD to BS. S exchange rate data
-    using the `dollar_to_bs_rate` function, and creates a line plot of the rate over time.
-    The plot is then saved as a PDF file named "dollar_to_bs_rate.pdf".
+    using the `dollar_to_bs_rate` function, and renders a line plot of the rate over time
+    with :func:`dollar_data.charts.render_chart`. The PDF is written to a temporary file and
+    then moved to ``path``, so concurrent calls never leave a partially written file.
 
     :param df: The input DataFrame containing currency exchange rate data.
     :type df: DataFrame
+    :param path: Where the PDF is saved, "dollar_to_bs_rate.pdf" by default.
+    :type path: pathlib.Path | str
 
     :raises TypeError: If the input is not a Pandas DataFrame.
     :raises KeyError: If the DataFrame does not contain the required columns.
-    :raises FileNotFoundError: If the function `dollar_to_bs_rate` cannot find the file.
-    :raises XLRDError: If the function `dollar_to_bs_rate` fails to read the file.
 
-    :return: None
+    :return: The path of the PDF.
+    :rtype: str
 
     :Example:
 
@@ -232,31 +332,32 @@ def plot_pdf(df: DataFrame):
                 'Currency': ['USD', 'EUR', 'USD'],
                 'Buy(BS. S BID)': [10, 20, 30]}
         df = pd.DataFrame(data)
-        plot_pdf(df)  # Generates and saves the PDF plot.  Waku waku! (Excited!)
+        plot_pdf(df, "usd.pdf")  # Generates and saves the PDF plot.  Waku waku! (Excited!)
     """
-    fig, ax = plt.subplots()
-    df_bs_dollar_date = dollar_to_bs_rate(df)
-    plt.xticks(rotation=75)
-    df_bs_dollar_date.sort_values("Date")
-    df_bs_dollar_date.plot(
-        ax=ax,
-        x="Date",
-        y="Buy(BS. S BID)",
-        ylabel="Precio Bolívares",
-        xlabel="Fecha",
+    df_bs_dollar_date = dollar_to_bs_rate(df).sort_values("Date")
+    body = render_chart(
+        df_bs_dollar_date["Date"].dt.date.tolist(),
+        df_bs_dollar_date["Buy(BS. S BID)"].tolist(),
+        "pdf",
         figsize=(10, 10),
     )
-    ax.legend(["Bolívar respecto al Dólar"])
-    plt.savefig("dollar_to_bs_rate.pdf")
+    path = os.path.abspath(path)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), suffix=".pdf.tmp", delete=False
+    ) as f:
+        f.write(body)
+    os.replace(f.name, path)
+    return path
 
 
-def scrape_excel() -> str:
+def scrape_excel(url: str = BCV_URL) -> str:
     """Scrapes the latest Excel file containing exchange rate data from the BCV website.
 
     This function fetches the HTML from the BCV website, parses it using BeautifulSoup,
     extracts the link to the latest Excel file, downloads the file, and saves it locally.
 
-    :param None: This function does not take any parameters.
+    :param url: The URL of the statistics page, :data:`BCV_URL` by default.
+    :type url: str
 
     :return: The full path to the saved Excel file.
     :rtype: str
@@ -271,52 +372,65 @@ def scrape_excel() -> str:
         scrape_excel()
         # '/path/to/your/dollar_data/excel_files/last_updated_excel.xls'  # Example path.
     """
-    html = requests.get(
-        "https://www.bcv.org.ve/estadisticas/tipo-cambio-de-referencia-smc",
-        verify=False,
-    )
-    soup = BeautifulSoup(html.text, features="html.parser")
-    a = soup.select(
-        "#block-system-main > div > div.view-content > table > tbody > tr.odd.views-row-first > td.views-field.views-field-field-diario > span > a"
-    )
-    url = a[0].get("href")
-    file_stream = requests.get(url, verify=False)
     file_name = "last_updated_excel.xls"
-    path = f"{cwd}/dollar_data/excel_files/"
+    path = EXCEL_FILES_DIR
     Path(path).mkdir(exist_ok=True)
-    with open(f"{path}{file_name}", "wb") as f:
-        f.write(file_stream.content)
+    with requests.get(latest_workbook_url(url), stream=True, verify=False) as stream:
+        stream.raise_for_status()
+        with open(f"{path}{file_name}", "wb") as f:
+            for chunk in stream.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
     return f"{path}{file_name}"
 
 
-def insert_into_database(df: DataFrame):
-    """Inserts data from a Pandas DataFrame into a SQL database.
+def latest_workbook_url(url: str = BCV_URL, session=requests) -> str:
+    """Returns the URL of the latest Excel file linked from the BCV statistics page.
 
-    This function takes a Pandas DataFrame containing historical dollar exchange rate data,
-    resets the index, renames the columns to match the database schema, and appends the data
-    to the "HistoricalDollar" table in the specified SQL database.
+    :param url: The URL of the statistics page, :data:`BCV_URL` by default.
+    :type url: str
+    :param session: The session used for the request, ``requests`` itself by default.
+    :type session: requests.Session
+    :return: The absolute URL of the latest Excel file.
+    :rtype: str
+    :raises requests.exceptions.RequestException: If there's an error during the HTTP request.
+    :raises IndexError: If the expected HTML elements are not found on the BCV website.
+    """
+    with stage("scrape", url=url):
+        html = session.get(url, verify=False)
+        html.raise_for_status()
+        soup = BeautifulSoup(html.text, features="html.parser")
+        # The first row of the table is the latest workbook
+        a = soup.select(WORKBOOK_LINKS_SELECTOR)
+        return urljoin(url, a[0].get("href"))
+
+
+def insert_into_database(df: DataFrame, refresh: tuple = REFRESH_STEPS) -> UpsertResult:
+    """Inserts or updates data from a Pandas DataFrame in a SQL database.
+
+    This function takes a Pandas DataFrame containing historical exchange rate data, as returned
+    by :func:`read_rates` or :func:`dollar_to_bs_rate`, and upserts it into the "HistoricalDollar"
+    table of the specified SQL database through :func:`dollar_data.upsert.upsert_rates`. Rows
+    are matched on ``(currency, date)``, so writing the same data twice does not duplicate it.
 
     :param df: The Pandas DataFrame containing the data to insert.
     :type df: DataFrame
-    :param engine: The SQLAlchemy Engine object used to connect to the database.
-    :type engine: Engine
+    :param refresh: The steps of :mod:`dollar_data.refresh` left pending by the write.
+    :type refresh: tuple
     :raises TypeError: If the input `df` is not a Pandas DataFrame.
-    :raises TypeError: If the input `engine` is not a SQLAlchemy Engine.
+    :raises TypeError: If the module `engine` is not a SQLAlchemy Engine.
     :raises Exception: If an error occurs during the database insertion process.
-    :return: None
-    :rtype: None
+    :return: How many rows were inserted, updated and skipped.
+    :rtype: UpsertResult
 
     :Example:
 
     .. code-block:: python
 
         import pandas as pd
-        from sqlalchemy import create_engine
-        # ... database connection details ...
-        engine = create_engine('sqlite:////{somepath}/database.db')  # Example
-        data = {'DATE': ['2024-01-20'], 'CURRENCY': ['USD'], 'BUYBID': [10]}
+        data = {'Date': ['2024-01-20'], 'Currency': ['USD'], 'Buy(BS. S BID)': [10]}
         df = pd.DataFrame(data)
-        insert_into_database(df, engine)
+        insert_into_database(df)
+        # UpsertResult(inserted=1, updated=0, skipped=0)
     """
     if not isinstance(df, DataFrame):
         raise TypeError("Input 'df' must be a Pandas DataFrame")
@@ -324,11 +438,9 @@ def insert_into_database(df: DataFrame):
     if not isinstance(engine, Engine):
         raise TypeError("Input 'engine' must be a SQLAlchemy Engine")
 
-    df = df.reset_index(drop=True)
-    df = df.rename(
-        columns={"Date": "DATE", "Currency": "CURRENCY", "Buy(BS. S BID)": "BUYBID"}
-    )
     try:
-        df.to_sql(con=engine, name="HistoricalDollar", if_exists="append", index=False)
+        with stage("write") as writing:
+            writing.rows = len(df)
+            return upsert_rates(df, engine, refresh)
     except Exception as e:
         raise Exception(f"Error inserting data into database: {e}")
@@ -0,0 +1,707 @@
+"""JSON API of the exchange rates, mounted under ``/api/v1``."""
+
+import contextlib
+import csv
+import datetime
+import hmac
+import io
+import json
+import math
+import os
+from concurrent import futures
+
+from flask import Blueprint, Response, abort, request, send_file
+from sqlalchemy import func, select
+from werkzeug.datastructures import WWWAuthenticate
+from werkzeug.exceptions import ServiceUnavailable, Unauthorized
+
+from dollar_data.charts import CHART_FORMATS, ChartRenderer
+from dollar_data.database import db_session, engine
+from dollar_data.models import AlertSubscription, Dollar, RateAggregate
+from dollar_data.web.http_cache import ResponseCache
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+RAW_COLUMNS = ["date", "buybid", "sellask", "usd_buybid", "usd_sellask"]
+RESOLUTIONS = ("raw", "daily", "weekly", "monthly")
+# Resolutions of the precomputed aggregates, see dollar_data.analytics
+AGGREGATE_RESOLUTIONS = ("daily", "weekly", "monthly")
+AGGREGATE_COLUMNS = [
+    "period_start",
+    "period_end",
+    "open",
+    "high",
+    "low",
+    "close",
+    "change",
+    "rolling_mean",
+    "volatility",
+    "devaluation",
+]
+DEFAULT_MAX_POINTS = 1000
+MAX_POINTS = 10_000
+# Rows per chunk of a streamed response
+CHUNK_ROWS = 500
+# Rows fetched from the database at a time by the bulk export
+EXPORT_ROWS = 1000
+EXPORT_COLUMNS = ["date", "currency", "buybid", "sellask", "usd_buybid", "usd_sellask"]
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# Amounts converted by a request of convert_batch()
+MAX_CONVERSIONS = 10_000
+CONVERSION_COLUMNS = ["amount", "currency", "date", "rate_date", "rate", "result"]
+# Seconds a client is asked to wait before asking again for a chart whose render timed out
+CHART_RETRY_AFTER = 5
+# Subscriptions to alerts are managed with this bearer token, the endpoints are off without it
+ALERTS_TOKEN = os.environ.get("ALERTS_TOKEN")
+ALERT_KINDS = ("level", "change")
+ALERT_DIRECTIONS = ("above", "below")
+# Longest window of a change subscription, in days
+MAX_ALERT_WINDOW = 3650
+
+# Responses of rates() by their arguments
+rates_responses = ResponseCache("rates", maxsize=512)
+# Responses of analytics() by their arguments
+analytics_responses = ResponseCache("analytics", maxsize=256)
+# Rendered charts of chart() by their arguments
+chart_responses = ResponseCache("charts", maxsize=64)
+chart_renderer = ChartRenderer()
+
+
+@api.errorhandler(400)
+def bad_request(error):
+    return {"error": error.description}, 400
+
+
+@api.errorhandler(401)
+def unauthorized(error):
+    headers = [
+        (name, value)
+        for name, value in error.get_headers()
+        if name == "WWW-Authenticate"
+    ]
+    return {"error": error.description}, 401, headers
+
+
+@api.errorhandler(403)
+def forbidden(error):
+    return {"error": error.description}, 403
+
+
+@api.errorhandler(404)
+def not_found(error):
+    return {"error": error.description}, 404
+
+
+@api.errorhandler(503)
+def service_unavailable(error):
+    headers = [
+        (name, value) for name, value in error.get_headers() if name == "Retry-After"
+    ]
+    return {"error": error.description}, 503, headers
+
+
+def parse_rates_args(args) -> dict:
+    """Validates the query string of the rates endpoints.
+
+    :param args: The query string arguments of the request.
+    :type args: werkzeug.datastructures.MultiDict
+    :return: The ``currency``, ``start``, ``end``, ``resolution`` and ``max_points`` arguments.
+    :rtype: dict
+    :raises werkzeug.exceptions.BadRequest: If an argument is not valid.
+    """
+    currency = args.get("currency", "USD").upper()
+    if len(currency) != 3 or not currency.isalpha():
+        abort(400, "currency must be a three letter currency code")
+    resolution = args.get("resolution", "daily")
+    if resolution not in RESOLUTIONS:
+        abort(400, f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    try:
+        start = _parse_date(args.get("from"))
+        end = _parse_date(args.get("to"))
+        max_points = int(args.get("max_points", DEFAULT_MAX_POINTS))
+    except ValueError as e:
+        abort(400, str(e))
+    if not 3 <= max_points <= MAX_POINTS:
+        abort(400, f"max_points must be between 3 and {MAX_POINTS}")
+    return {
+        "currency": currency,
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "max_points": max_points,
+    }
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+def _bucket(resolution: str):
+    if resolution != "weekly":
+        return Dollar.period
+    # The Monday of the week, like the weekly aggregates of dollar_data.analytics, so weeks that
+    # span two years are not split
+    if db_session.get_bind().dialect.name == "sqlite":
+        return func.date(Dollar.date, "weekday 0", "-6 days")
+    return func.date_trunc("week", Dollar.date)
+
+
+def query_rates(currency, start, end, resolution) -> tuple:
+    """Builds the query of a series of rates.
+
+    Raw series return every rate column of every row and daily series the ``buybid`` of every
+    row. Weekly and monthly series are aggregated by the database, they return the ``buybid`` of
+    the last published day of each period, found through the ``(currency, date)`` index.
+
+    :return: The column names and the ``select`` statement, ordered by date.
+    :rtype: tuple
+    """
+    conditions = [Dollar.currency == currency]
+    if start is not None:
+        conditions.append(Dollar.date >= start)
+    if end is not None:
+        conditions.append(Dollar.date <= end)
+
+    if resolution == "raw":
+        columns = [getattr(Dollar, column) for column in RAW_COLUMNS]
+        return RAW_COLUMNS, select(*columns).where(*conditions).order_by(Dollar.date)
+    if resolution == "daily":
+        # There is already one row per published day
+        statement = select(Dollar.date, Dollar.buybid).where(*conditions)
+        return ["date", "buybid"], statement.order_by(Dollar.date)
+
+    closes = (
+        select(func.max(Dollar.date).label("date"))
+        .where(*conditions)
+        .group_by(_bucket(resolution))
+        .subquery()
+    )
+    statement = (
+        select(Dollar.date, Dollar.buybid)
+        .join(closes, Dollar.date == closes.c.date)
+        .where(Dollar.currency == currency)
+        .order_by(Dollar.date)
+    )
+    return ["date", "buybid"], statement
+
+
+def downsample(rows: list, max_points: int) -> list:
+    """Keeps at most ``max_points`` rows with :func:`dollar_data.timeseries.lttb` on buybid."""
+    if len(rows) <= max_points:
+        return rows
+    # Only loaded once a series is long enough, the web workers do not need numpy otherwise
+    import numpy as np
+
+    from dollar_data.timeseries import lttb
+
+    x = np.fromiter(
+        (row[0].toordinal() for row in rows), dtype="float64", count=len(rows)
+    )
+    y = np.fromiter((row[1] for row in rows), dtype="float64", count=len(rows))
+    return [rows[i] for i in lttb(x, y, max_points)]
+
+
+def iter_json(header: dict, columns: list, rows):
+    """Serializes ``header`` with the ``columns`` and ``rows`` as compact JSON arrays.
+
+    Dates are serialized as ISO 8601 strings and the rows are yielded :data:`CHUNK_ROWS` at a
+    time, so the result can be streamed or joined.
+    """
+    head = json.dumps({**header, "columns": columns}, separators=(",", ":"))
+    yield head[:-1] + ',"points":['
+    chunk = list()
+    for i, row in enumerate(rows):
+        values = json.dumps(list(row), separators=(",", ":"), default=_isoformat)
+        chunk.append(("," if i else "") + values)
+        if len(chunk) == CHUNK_ROWS:
+            yield "".join(chunk)
+            chunk.clear()
+    yield "".join(chunk) + "]}"
+
+
+def _isoformat(value) -> str:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+@api.route("/rates")
+def rates():
+    """Returns a series of rates of a currency.
+
+    Query string arguments:
+
+    * ``currency``: three letter code, ``USD`` by default.
+    * ``from`` and ``to``: ISO 8601 dates, both included, the whole history by default.
+    * ``resolution``: ``raw``, ``daily`` (default), ``weekly`` or ``monthly``.
+    * ``max_points``: series longer than this are downsampled with LTTB, 1000 by default.
+
+    Responses are compressed and kept in :data:`rates_responses` until the ingestion job writes
+    new rates, and carry an ``ETag`` so that clients can revalidate them.
+
+    The response looks like
+    ``{"currency":"USD","resolution":"daily","columns":["date","buybid"],"points":[["2024-01-02",36.0],...]}``.
+    """
+    args = parse_rates_args(request.args)
+    return rates_responses.respond(
+        tuple(args.values()),
+        lambda: "".join(iter_json(*compute_rates(**args))),
+        "application/json",
+    )
+
+
+@api.route("/rates/export")
+def rates_export():
+    """Streams every rate matching the filters as CSV or newline delimited JSON.
+
+    Query string arguments:
+
+    * ``format``: ``csv`` (default) or ``ndjson``.
+    * ``currency``: three letter code, every currency by default.
+    * ``from`` and ``to``: ISO 8601 dates, both included, the whole history by default.
+
+    Rows are read with a streamed Core query :data:`EXPORT_ROWS` at a time and written out as
+    they are read, so memory use does not depend on the size of the export and the first bytes
+    are sent right away. The query runs on a connection of its own, opened and closed by the
+    generator of the response, so the response does not need the request context (nor the
+    tracing context of the request, which has ended when the rows are sent).
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        abort(400, f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    currency = request.args.get("currency")
+    if currency is not None and (len(currency) != 3 or not currency.isalpha()):
+        abort(400, "currency must be a three letter currency code")
+    try:
+        start = _parse_date(request.args.get("from"))
+        end = _parse_date(request.args.get("to"))
+    except ValueError as e:
+        abort(400, str(e))
+
+    conditions = list()
+    if currency is not None:
+        conditions.append(Dollar.currency == currency.upper())
+    if start is not None:
+        conditions.append(Dollar.date >= start)
+    if end is not None:
+        conditions.append(Dollar.date <= end)
+    columns = [getattr(Dollar, column) for column in EXPORT_COLUMNS]
+    statement = (
+        select(*columns).where(*conditions).order_by(Dollar.currency, Dollar.date)
+    )
+    chunks = iter_csv(statement) if fmt == "csv" else iter_ndjson(statement)
+    response = Response(chunks, mimetype=EXPORT_FORMATS[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename=rates.{fmt}"
+    return response
+
+
+def iter_partitions(statement):
+    """Runs ``statement`` on its own connection and yields its rows in lists.
+
+    The connection is closed when the generator ends or is closed, e.g. when the client
+    disconnects in the middle of the response.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_ROWS
+        ).execute(statement)
+        for partition in result.partitions():
+            yield partition
+
+
+def iter_csv(statement):
+    """Yields the rows of ``statement`` as CSV, with a header, a partition at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    with contextlib.closing(iter_partitions(statement)) as partitions:
+        for partition in partitions:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(partition)
+            yield buffer.getvalue()
+
+
+def iter_ndjson(statement):
+    """Yields the rows of ``statement`` as JSON objects, one per line."""
+    with contextlib.closing(iter_partitions(statement)) as partitions:
+        for partition in partitions:
+            yield "".join(
+                json.dumps(
+                    dict(zip(EXPORT_COLUMNS, row)),
+                    separators=(",", ":"),
+                    default=_isoformat,
+                )
+                + "\n"
+                for row in partition
+            )
+
+
+def compute_rates(currency, start, end, resolution, max_points) -> tuple:
+    """Runs and downsamples the query of :func:`rates`.
+
+    :return: The header of the response, the column names and the rows.
+    :rtype: tuple
+    """
+    columns, statement = query_rates(currency, start, end, resolution)
+    rows = downsample(db_session.execute(statement).all(), max_points)
+    header = {
+        "currency": currency,
+        "resolution": resolution,
+        "from": rows[0][0].isoformat() if rows else None,
+        "to": rows[-1][0].isoformat() if rows else None,
+    }
+    return header, columns, rows
+
+
+@api.route("/chart")
+def chart():
+    """Returns a chart of a series of rates.
+
+    Takes the arguments of :func:`rates` plus ``format``: ``png`` (default), ``svg`` or
+    ``pdf``. Charts are rendered by :data:`chart_renderer` out of the request threads and kept
+    in :data:`chart_responses` until the ingestion job writes new rates.
+
+    When the render takes longer than the timeout of the renderer the response is a 503 with a
+    ``Retry-After`` header. The render goes on in the pool, and the next request for the same
+    chart and data version takes its result, or waits for it if it is still running, instead of
+    starting another one.
+    """
+    args = parse_rates_args(request.args)
+    fmt = request.args.get("format", "png")
+    if fmt not in CHART_FORMATS:
+        abort(400, f"format must be one of {', '.join(CHART_FORMATS)}")
+    key = (*args.values(), fmt)
+    try:
+        return chart_responses.respond(
+            key,
+            lambda: render_rates_chart(key, fmt, **args),
+            CHART_FORMATS[fmt],
+            compressible=fmt == "svg",
+        )
+    except futures.TimeoutError:
+        raise ServiceUnavailable(
+            "The chart is still being rendered", retry_after=CHART_RETRY_AFTER
+        )
+
+
+def render_rates_chart(key, fmt, currency, **args) -> bytes:
+    """Queries the series of :func:`chart` and renders it with :data:`chart_renderer`."""
+    header, columns, rows = compute_rates(currency, **args)
+    dates = [row[0] for row in rows]
+    values = [row[1] for row in rows]
+    # Renders of the same chart are only shared within a data version
+    version_key = (*key, chart_responses.cache.version)
+    return chart_renderer.render(
+        version_key, dates, values, fmt, label=f"Bolívares por {currency}"
+    )
+
+
+@api.route("/analytics")
+def analytics():
+    """Returns the precomputed aggregates of a currency, see :mod:`dollar_data.analytics`.
+
+    Query string arguments:
+
+    * ``currency``: three letter code, ``USD`` by default.
+    * ``from`` and ``to``: ISO 8601 dates, the periods starting between them are returned.
+    * ``resolution``: ``daily`` (default), ``weekly`` or ``monthly``.
+
+    Every point holds the :data:`AGGREGATE_COLUMNS` of a period, in the response format of
+    :func:`rates`.
+    """
+    args = parse_rates_args(request.args)
+    if args["resolution"] not in AGGREGATE_RESOLUTIONS:
+        abort(400, f"resolution must be one of {', '.join(AGGREGATE_RESOLUTIONS)}")
+    del args["max_points"]
+    return analytics_responses.respond(
+        tuple(args.values()),
+        lambda: "".join(iter_json(*compute_analytics(**args))),
+        "application/json",
+    )
+
+
+def compute_analytics(currency, start, end, resolution) -> tuple:
+    """Reads the aggregates of :func:`analytics` through their unique index.
+
+    :return: The header of the response, the column names and the rows.
+    :rtype: tuple
+    """
+    conditions = [
+        RateAggregate.currency == currency,
+        RateAggregate.resolution == resolution,
+    ]
+    if start is not None:
+        conditions.append(RateAggregate.period_start >= start)
+    if end is not None:
+        conditions.append(RateAggregate.period_start <= end)
+    columns = [getattr(RateAggregate, column) for column in AGGREGATE_COLUMNS]
+    statement = select(*columns).where(*conditions).order_by(RateAggregate.period_start)
+    rows = db_session.execute(statement).all()
+    header = {
+        "currency": currency,
+        "resolution": resolution,
+        "from": rows[0][0].isoformat() if rows else None,
+        "to": rows[-1][0].isoformat() if rows else None,
+    }
+    return header, AGGREGATE_COLUMNS, rows
+
+
+@api.route("/convert")
+def convert_amount():
+    """Converts an amount at the rate in effect on a date, see :mod:`dollar_data.convert`.
+
+    Query string arguments:
+
+    * ``amount``: the amount to convert, 1 by default.
+    * ``currency``: three letter code of the amount, ``USD`` by default.
+    * ``date``: ISO 8601 date, today by default. On weekends and holidays the last rate
+      published before the date is used.
+    * ``to``: three letter code to convert to, ``VES`` (bolívares) by default.
+
+    The response looks like
+    ``{"amount":100.0,"currency":"USD","date":"2024-01-06","to":"VES","rate_date":"2024-01-05","rate":36.2,"result":3620.0}``.
+    """
+    from dollar_data.convert import BOLIVAR, convert
+
+    currency = _parse_currency(request.args.get("currency", "USD"))
+    to = _parse_currency(request.args.get("to", BOLIVAR), "to")
+    try:
+        amount = float(request.args.get("amount", 1))
+        date = _parse_date(request.args.get("date")) or datetime.date.today()
+    except ValueError as e:
+        abort(400, str(e))
+    if not math.isfinite(amount):
+        abort(400, "amount must be a finite number")
+    conversion = convert(amount, currency, date, to)
+    if conversion.result is None:
+        abort(404, f"No rate of {currency} to {to} on or before {date.isoformat()}")
+    return {**conversion._asdict(), "to": to}
+
+
+@api.route("/convert", methods=["POST"])
+def convert_batch():
+    """Converts a batch of amounts, each at the rate in effect on its date.
+
+    The body is a JSON object with the ``conversions`` to make, at most
+    :data:`MAX_CONVERSIONS` ``[amount, currency, date]`` triples, and optionally the currency
+    to convert ``to``, ``VES`` by default:
+    ``{"to":"VES","conversions":[[100,"USD","2024-01-06"],[250.5,"EUR","2024-01-08"]]}``.
+
+    The response holds a row of :data:`CONVERSION_COLUMNS` per triple, in the same order, where
+    ``rate_date``, ``rate`` and ``result`` are null if there is no rate for the currency on
+    the date: ``{"to":"VES","columns":[...],"conversions":[[100.0,"USD","2024-01-06",...],...]}``.
+    The whole batch is rejected with a 400 if an amount is not a finite number or a date is not
+    a full ISO 8601 date.
+    """
+    from dollar_data.convert import BOLIVAR, convert_many
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("conversions"), list):
+        abort(400, "the body must be a JSON object with a list of conversions")
+    triples = body["conversions"]
+    if len(triples) > MAX_CONVERSIONS:
+        abort(400, f"at most {MAX_CONVERSIONS} conversions per request")
+    if not all(isinstance(triple, list) and len(triple) == 3 for triple in triples):
+        abort(400, "every conversion must be an [amount, currency, date] triple")
+    to = _parse_currency(str(body.get("to", BOLIVAR)), "to")
+    amounts, currencies, dates = zip(*triples) if triples else ((), (), ())
+    try:
+        conversions = convert_many(amounts, currencies, dates, to)
+    except (TypeError, ValueError) as e:
+        abort(400, f"invalid conversion: {e}")
+    return Response(
+        json.dumps(
+            {"to": to, "columns": CONVERSION_COLUMNS, "conversions": conversions},
+            separators=(",", ":"),
+        ),
+        mimetype="application/json",
+    )
+
+
+def _parse_currency(value: str, name: str = "currency") -> str:
+    if len(value) != 3 or not value.isalpha():
+        abort(400, f"{name} must be a three letter currency code")
+    return value.upper()
+
+
+@api.route("/alerts", methods=["POST"])
+def create_alert():
+    """Subscribes a webhook or an email address to an alert, see :mod:`dollar_data.alerts`.
+
+    Needs an ``Authorization: Bearer`` header with :data:`ALERTS_TOKEN`, responds
+    ``401 Unauthorized`` without it and ``403 Forbidden`` if alerts are disabled. The body is a
+    JSON object with:
+
+    * ``currency``: three letter code of the rate to watch, ``USD`` by default.
+    * ``kind``: ``level`` to compare the rate itself to the threshold, ``change`` to compare its
+      change in percent over ``window`` days.
+    * ``direction``: ``above`` to fire when the value rises to the threshold, ``below`` when it
+      falls to it.
+    * ``threshold``: the level, in bolívares, or the change, in percent.
+    * ``window``: days of a ``change`` alert, 1 by default.
+    * ``target``: an ``http(s)://`` URL that receives the notifications as JSON, or a
+      ``mailto:`` address.
+
+    Responds ``201 Created`` with the subscription, whose ``id`` is needed to delete it.
+    """
+    _authorize_alerts()
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, "the body must be a JSON object")
+    subscription = AlertSubscription(
+        **parse_alert(body), created_at=datetime.datetime.now(datetime.timezone.utc)
+    )
+    db_session.add(subscription)
+    db_session.commit()
+    return subscription.as_dict(), 201
+
+
+def parse_alert(body: dict) -> dict:
+    """Validates the body of :func:`create_alert`.
+
+    :param body: The JSON body of the request.
+    :type body: dict
+    :return: The columns of the subscription.
+    :rtype: dict
+    :raises werkzeug.exceptions.BadRequest: If a field is not valid.
+    """
+    kind = body.get("kind")
+    if kind not in ALERT_KINDS:
+        abort(400, f"kind must be one of {', '.join(ALERT_KINDS)}")
+    direction = body.get("direction")
+    if direction not in ALERT_DIRECTIONS:
+        abort(400, f"direction must be one of {', '.join(ALERT_DIRECTIONS)}")
+    threshold, window = body.get("threshold"), body.get("window", 1)
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+        abort(400, "threshold must be a number")
+    if kind == "level":
+        window = None
+    elif not isinstance(window, int) or not 1 <= window <= MAX_ALERT_WINDOW:
+        abort(400, f"window must be a number of days between 1 and {MAX_ALERT_WINDOW}")
+    target = body.get("target")
+    if (
+        not isinstance(target, str)
+        or not target.startswith(("http://", "https://", "mailto:"))
+        or len(target) > 512
+    ):
+        abort(
+            400, "target must be an http(s):// or mailto: URL of at most 512 characters"
+        )
+    return {
+        "currency": _parse_currency(str(body.get("currency", "USD"))),
+        "kind": kind,
+        "direction": direction,
+        "threshold": float(threshold),
+        "window": window,
+        "target": target,
+    }
+
+
+@api.route("/alerts/<int:alert_id>")
+def get_alert(alert_id):
+    """Returns a subscription created by :func:`create_alert`."""
+    _authorize_alerts()
+    return _get_alert(alert_id).as_dict()
+
+
+@api.route("/alerts/<int:alert_id>", methods=["DELETE"])
+def delete_alert(alert_id):
+    """Deletes a subscription created by :func:`create_alert`."""
+    _authorize_alerts()
+    db_session.delete(_get_alert(alert_id))
+    db_session.commit()
+    return Response(status=204)
+
+
+def _get_alert(alert_id: int) -> AlertSubscription:
+    subscription = db_session.get(AlertSubscription, alert_id)
+    if subscription is None:
+        abort(404, f"No alert {alert_id}")
+    return subscription
+
+
+def _authorize_alerts():
+    if ALERTS_TOKEN is None:
+        abort(403, "Alerts are disabled, set ALERTS_TOKEN to enable them")
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.encode(), ALERTS_TOKEN.encode()
+    ):
+        raise Unauthorized(
+            "A valid bearer token is needed to manage alerts",
+            www_authenticate=WWWAuthenticate("bearer", {"realm": "alerts"}),
+        )
+
+
+@api.route("/export/manifest.json")
+def export_manifest():
+    """Returns the manifest of the columnar exports, see :mod:`dollar_data.export`."""
+    from dollar_data.export import EXPORT_DIR, MANIFEST_FILE
+
+    return _send_export(os.path.join(EXPORT_DIR, MANIFEST_FILE), "application/json")
+
+
+@api.route("/export/parquet/<currency>/<int:year>.parquet")
+def export_partition(currency, year):
+    """Returns the Parquet partition of the rates of a currency in a year."""
+    from dollar_data.export import EXPORT_DIR, PARQUET_DIR
+
+    if len(currency) != 3 or not currency.isalpha():
+        abort(400, "currency must be a three letter currency code")
+    path = os.path.join(
+        EXPORT_DIR,
+        PARQUET_DIR,
+        f"currency={currency.upper()}",
+        f"year={year}",
+        "part-0.parquet",
+    )
+    return _send_export(path, "application/vnd.apache.parquet")
+
+
+@api.route("/export/rates.arrow")
+def export_snapshot():
+    """Returns the Arrow snapshot of every rate.
+
+    The whole snapshot is sent as an Arrow IPC file straight from the disk. With a ``currency``
+    argument only the rates of that currency are sent, as an Arrow IPC stream of the batch of
+    the memory mapped snapshot: its buffers are copied once, a chunk at a time, into the
+    response, and the snapshot is unmapped once the response is sent.
+    """
+    from dollar_data.export import (
+        EXPORT_DIR,
+        SNAPSHOT_FILE,
+        iter_ipc_stream,
+        pa,
+        read_currency,
+    )
+
+    if "currency" not in request.args:
+        path = os.path.join(EXPORT_DIR, SNAPSHOT_FILE)
+        return _send_export(path, "application/vnd.apache.arrow.file")
+    currency = request.args["currency"].upper()
+    if pa is None:
+        abort(404, "Filtering the snapshot needs pyarrow on the server")
+    snapshot = contextlib.ExitStack()
+    try:
+        batch = snapshot.enter_context(read_currency(currency))
+    except FileNotFoundError:
+        batch = None
+    if batch is None:
+        snapshot.close()
+        abort(404, f"No exported rates of {currency}")
+
+    response = Response(
+        iter_ipc_stream(batch), mimetype="application/vnd.apache.arrow.stream"
+    )
+    # Also when the client goes away in the middle of the response
+    response.call_on_close(snapshot.close)
+    return response
+
+
+def _send_export(path: str, mimetype: str) -> Response:
+    # Sent with the sendfile of the server where available, revalidated by modification time
+    if not os.path.isfile(path):
+        abort(404, "Not exported yet")
+    return send_file(path, mimetype=mimetype, conditional=True, max_age=0)
@@ -1,15 +1,21 @@
 import os
 from flask import Flask, render_template
-from sqlalchemy import func
 from dollar_data.database import db_session, init_db
 from dollar_data.logging import configure_logging
 from dollar_data.metrics import configure_metrics
-from dollar_data.models import Dollar
 from dollar_data.tracing import configure_tracing
+from dollar_data.web.api import api
+from dollar_data.web.http_cache import ResponseCache, init_static_caching
+from dollar_data.web import stream
 
 
 class Config:
     SCHEDULER_API_ENABLED = True
+    # Where browsers open the event stream of dollar_data.web.stream. By default its own port on
+    # the host of the page, set it when a proxy routes the stream elsewhere
+    STREAM_URL = os.environ.get("STREAM_URL")
+    STREAM_PORT = stream.STREAM_BIND.rpartition(":")[2]
+    STREAM_PATH = stream.STREAM_PATH
 
 
 cwd = os.getcwd()
@@ -22,10 +28,13 @@ def create_app():
     configure_metrics()
     configure_logging()
     configure_tracing(app)
+    app.register_blueprint(api)
+    init_static_caching(app)
     return app
 
 
 app = create_app()
+pages = ResponseCache("pages", maxsize=16)
 
 
 @app.teardown_appcontext
@@ -35,11 +44,12 @@ def shutdown_session(exception=None):
 
 @app.route("/")
 def hello_world():
-    data = Dollar.query.filter(func.strftime("%d", Dollar.date) == "10").all()
-    serialized = list()
-    for _ in data:
-        serialized.append(_.as_dict())
-    return render_template(template_name_or_list="index.html", data=serialized)
+    # The chart fetches its data from dollar_data.web.api
+    return pages.respond(
+        ("index",),
+        lambda: render_template(template_name_or_list="index.html"),
+        "text/html",
+    )
 
 
 @app.route("/test")
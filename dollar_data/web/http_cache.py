@@ -0,0 +1,159 @@
+"""HTTP caching of the responses derived from the rates.
+
+Responses get a strong ``ETag`` and a ``Last-Modified`` derived from the ``DataVersion`` stamp,
+so a client that already has the current version gets a ``304 Not Modified`` without the
+response being rendered or even looked up. Bodies are rendered and compressed (gzip, and
+brotli when the ``brotli`` package is installed) once per data version and kept in a
+:class:`dollar_data.cache.VersionedCache`.
+
+Static files are served with a ``v`` query string holding the hash of their content, which
+lets them be cached as immutable for a year.
+"""
+
+import gzip
+import hashlib
+import os
+import time
+from datetime import timezone
+
+from flask import Response, request
+
+from dollar_data.cache import VersionedCache
+from dollar_data.models import DataVersion
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used when it is not installed
+    brotli = None
+
+# Changes on every deployment so that pages rendered by an older release are not reused
+BUILD_ID = os.environ.get("BUILD_ID", str(int(time.time())))
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Clients must revalidate, which costs a 304 while the data does not change
+CACHE_CONTROL = "public, no-cache"
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def compress(body: bytes) -> dict:
+    """Returns ``body`` in every supported content encoding, keyed by encoding."""
+    encoded = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=11)
+    return encoded
+
+
+class ResponseCache:
+    """Conditional, precompressed responses for views whose content only depends on the data.
+
+    :param name: The name of the underlying :class:`VersionedCache`.
+    :type name: str
+    :param maxsize: How many rendered responses are kept.
+    :type maxsize: int
+
+    :Example:
+
+    .. code-block:: python
+
+        pages = ResponseCache("pages")
+
+        @app.route("/")
+        def index():
+            return pages.respond(("index",), lambda: render_template("index.html"), "text/html")
+    """
+
+    def __init__(self, name: str, maxsize: int = 256):
+        self.cache = VersionedCache(name, maxsize, version_reader=DataVersion.stamp)
+
+    def respond(
+        self, key: tuple, render, mimetype: str, compressible: bool = True
+    ) -> Response:
+        """Answers the current request with the response of ``key``.
+
+        :param key: Identifies the response among the others of the cache, e.g. the arguments
+                    of the view.
+        :type key: tuple
+        :param render: Called without arguments on a miss, returns the body as str or bytes.
+        :type render: Callable[[], str | bytes]
+        :param mimetype: The mimetype of the body.
+        :type mimetype: str
+        :param compressible: Whether the body is worth compressing, not for e.g. PNG images.
+        :type compressible: bool
+        :return: A 304 response if the client has the current version, the body otherwise.
+        :rtype: Response
+        """
+        version, updated_at = self.cache.current_version()
+        encoding = "identity"
+        if compressible:
+            encoding = request.accept_encodings.best_match(
+                ENCODINGS, default="identity"
+            )
+        key_hash = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        etag = f"{BUILD_ID}.{version}.{key_hash}.{encoding}"
+
+        response = Response(mimetype=mimetype)
+        response.set_etag(etag)
+        if updated_at is not None:
+            response.last_modified = updated_at.replace(tzinfo=timezone.utc)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        if compressible:
+            response.vary.add("Accept-Encoding")
+        if self._not_modified(etag, response.last_modified):
+            response.status_code = 304
+            return response
+
+        bodies = self.cache.get_or_compute(
+            key,
+            lambda: (compress if compressible else _identity)(_to_bytes(render())),
+        )
+        response.set_data(bodies[encoding])
+        if encoding != "identity":
+            response.content_encoding = encoding
+        return response
+
+    @staticmethod
+    def _not_modified(etag, last_modified) -> bool:
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+        if request.if_modified_since and last_modified:
+            return last_modified <= request.if_modified_since
+        return False
+
+
+def _identity(body: bytes) -> dict:
+    return {"identity": body}
+
+
+def _to_bytes(body) -> bytes:
+    return body.encode() if isinstance(body, str) else body
+
+
+def init_static_caching(app):
+    """Serves the static files of ``app`` as immutable, versioned by the hash of their content.
+
+    ``url_for("static", filename=...)`` gets a ``v`` argument with the hash of the file, so an
+    updated file gets a new URL and the responses to versioned URLs can be cached for a year.
+    """
+    hashes = dict()
+
+    @app.url_defaults
+    def add_static_version(endpoint, values):
+        if endpoint != "static" or "filename" not in values or "v" in values:
+            return
+        filename = values["filename"]
+        if filename not in hashes:
+            try:
+                with open(os.path.join(app.static_folder, filename), "rb") as f:
+                    hashes[filename] = hashlib.sha1(f.read()).hexdigest()[:12]
+            except OSError:
+                hashes[filename] = None
+        if hashes[filename] is not None:
+            values["v"] = hashes[filename]
+
+    @app.after_request
+    def cache_static_files(response):
+        if request.endpoint == "static" and "v" in request.args:
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
@@ -0,0 +1,429 @@
+"""Server-Sent Events stream of the rates and aggregates written by the ingestion jobs.
+
+Clients open ``/api/v1/stream`` with an ``EventSource`` and receive, within
+:data:`POLL_INTERVAL` seconds of every write, the rows that changed instead of reloading
+whole series:
+
+* ``rates``: the rows of ``HistoricalDollar`` written by the ingestion, as
+  ``{"version":12,"columns":[...],"rows":[["2024-01-05","USD",36.15,...],...]}``.
+* ``aggregates``: the rows of ``RateAggregate`` recomputed after them, in the same format.
+* ``reset``: too much changed to be sent, e.g. after a backfill, or the changes since the
+  ``Last-Event-ID`` of a reconnecting client are no longer logged. Clients should fetch the
+  series again from the JSON API.
+* ``hello``: sent first, with the current version as its id.
+
+The id of every event is the data version of the write. Browsers send the id of the last event
+they received as ``Last-Event-ID`` when they reconnect, and the events they missed meanwhile are
+sent before any new one. Other clients can pass it as the ``last_event_id`` argument.
+
+The stream is served by its own process, a single asyncio event loop, so thousands of idle
+connections cost a coroutine and a socket each instead of a gunicorn worker.
+``gunicorn.conf.py`` starts it next to the workers; set ``DOLLAR_DATA_STREAM=external`` to run
+it elsewhere with::
+
+    python -m dollar_data.web.stream --bind 0.0.0.0:8001
+
+The jobs log what every write changed in the ``DataChange`` table, in the transaction that
+bumps the data version (see :func:`dollar_data.upsert.record_changes`). The server reads the
+version once every :data:`POLL_INTERVAL` seconds, however many clients are connected, and
+fans the new changes out to all of them.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+from collections import deque
+from dataclasses import dataclass
+from itertools import groupby
+from urllib.parse import parse_qs, urlsplit
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+from sqlalchemy import or_, select
+
+from dollar_data.database import engine
+from dollar_data.models import DataChange, DataVersion, Dollar, RateAggregate
+from dollar_data.web.api import _isoformat
+
+STREAM_PATH = "/api/v1/stream"
+STREAM_BIND = os.environ.get("STREAM_BIND", "0.0.0.0:8001")
+# Seconds between two reads of the data version
+POLL_INTERVAL = float(os.environ.get("STREAM_POLL_INTERVAL", 2.0))
+# Seconds without events before a comment is sent, so that proxies keep the connection open
+HEARTBEAT_INTERVAL = 15.0
+# Milliseconds browsers wait before reconnecting
+RETRY_MS = 3000
+# Events queued for a client before it is considered too slow and disconnected
+CLIENT_QUEUE_SIZE = 64
+# Events kept in memory for the clients that reconnect, older ones are read from the database
+RECENT_EVENTS = 256
+# Changes with more rows are sent as a reset
+MAX_EVENT_ROWS = 10_000
+# Seconds a client has to send its request
+REQUEST_TIMEOUT = 10.0
+# Open files asked for when the hard limit is unlimited, the default of fs.nr_open on Linux
+MAX_OPEN_FILES = 1024 * 1024
+RATE_COLUMNS = ["date", "currency", "buybid", "sellask", "usd_buybid", "usd_sellask"]
+AGGREGATE_COLUMNS = [
+    "currency",
+    "resolution",
+    "period_start",
+    "period_end",
+    "open",
+    "high",
+    "low",
+    "close",
+    "change",
+    "rolling_mean",
+    "volatility",
+    "devaluation",
+]
+RESPONSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: keep-alive\r\n"
+    # Served on its own port, the dashboard may live on another origin
+    b"Access-Control-Allow-Origin: *\r\n"
+    # Nginx would otherwise buffer the events
+    b"X-Accel-Buffering: no\r\n"
+    b"\r\n"
+)
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+events_counter = meter.create_counter(
+    "dollar_data.stream.events", description="Events published to the stream, by kind"
+)
+disconnects_counter = meter.create_counter(
+    "dollar_data.stream.slow_clients",
+    description="Clients disconnected because they did not keep up with the events",
+)
+
+
+@dataclass(frozen=True)
+class Event:
+    """An event of the stream, encoded once for every client."""
+
+    version: int
+    kind: str
+    data: bytes
+
+    @classmethod
+    def encode(cls, version: int, kind: str, payload: dict) -> "Event":
+        data = json.dumps(payload, separators=(",", ":"), default=_isoformat)
+        return cls(
+            version, kind, f"id: {version}\nevent: {kind}\ndata: {data}\n\n".encode()
+        )
+
+
+def reset_event(version: int) -> Event:
+    return Event.encode(version, "reset", {"version": version})
+
+
+def read_version() -> int:
+    """Returns the current data version, 0 when nothing was ever written."""
+    with engine.connect() as connection:
+        return _read_version(connection)
+
+
+def _read_version(connection) -> int:
+    statement = select(DataVersion.version).where(DataVersion.id == 1)
+    return connection.execute(statement).scalar() or 0
+
+
+def load_events(after: int) -> tuple:
+    """Reads the events of every version written after ``after``.
+
+    :param after: The last version the caller knows about.
+    :type after: int
+    :return: The events, oldest first, and the current version. A single reset event when the
+             changes of a version are not logged, e.g. because they were pruned.
+    :rtype: tuple[list[Event], int]
+    """
+    with engine.connect() as connection:
+        version = _read_version(connection)
+        if version == after:
+            return [], version
+        if version < after:
+            # The database was replaced by an older one
+            return [reset_event(version)], version
+        statement = (
+            select(
+                DataChange.version,
+                DataChange.kind,
+                DataChange.currency,
+                DataChange.since,
+            )
+            .where(DataChange.version > after, DataChange.version <= version)
+            .order_by(DataChange.version, DataChange.id)
+        )
+        changes = connection.execute(statement).all()
+        if len({change.version for change in changes}) < version - after:
+            return [reset_event(version)], version
+        events = [
+            _build_event(connection, changed_version, kind, list(group))
+            for (changed_version, kind), group in groupby(
+                changes, key=lambda change: (change.version, change.kind)
+            )
+        ]
+        return events, version
+
+
+def _build_event(connection, version: int, kind: str, changes: list) -> Event:
+    if any(change.currency is None for change in changes):
+        return reset_event(version)
+    if kind == "rates":
+        model, columns, key = Dollar, RATE_COLUMNS, Dollar.date
+        order = [Dollar.date, Dollar.currency]
+    else:
+        model, columns, key = RateAggregate, AGGREGATE_COLUMNS, RateAggregate.period_end
+        order = [
+            RateAggregate.currency,
+            RateAggregate.resolution,
+            RateAggregate.period_start,
+        ]
+    where = or_(
+        *[
+            (model.currency == change.currency) & (key >= change.since)
+            for change in changes
+        ]
+    )
+    statement = select(*[getattr(model, column) for column in columns]).where(where)
+    rows = connection.execute(
+        statement.order_by(*order).limit(MAX_EVENT_ROWS + 1)
+    ).all()
+    if len(rows) > MAX_EVENT_ROWS:
+        return reset_event(version)
+    return Event.encode(
+        version,
+        kind,
+        {"version": version, "columns": columns, "rows": [list(row) for row in rows]},
+    )
+
+
+class Client:
+    """A connected client and the events queued for it."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+
+
+class Broadcaster:
+    """Polls the data version and fans the new events out to every connected client.
+
+    :param poll_interval: Seconds between two reads of the data version.
+    :type poll_interval: float
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.version = None
+        self.clients = set()
+        self.recent = deque(maxlen=RECENT_EVENTS)
+        # Every event after this version is in recent
+        self.recent_since = None
+
+    async def run(self):
+        """Publishes the events of every new version until cancelled."""
+        while True:
+            try:
+                if self.version is None:
+                    self.version = await asyncio.to_thread(read_version)
+                    self.recent_since = self.version
+                else:
+                    events, version = await asyncio.to_thread(load_events, self.version)
+                    for event in events:
+                        self.publish(event)
+                    self.version = version
+            except Exception:
+                logger.exception("Could not read the changes of the rates.")
+            await asyncio.sleep(self.poll_interval)
+
+    def publish(self, event: Event):
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_since = self.recent[0].version
+        self.recent.append(event)
+        events_counter.add(1, {"kind": event.kind})
+        for client in list(self.clients):
+            try:
+                client.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # It reconnects and gets the events it missed from its Last-Event-ID
+                self.clients.discard(client)
+                client.writer.transport.abort()
+                disconnects_counter.add(1)
+
+    async def missed_events(self, last_event_id: int) -> list:
+        """Returns the events after ``last_event_id``, from memory when they are recent."""
+        if self.recent_since is not None and last_event_id >= self.recent_since:
+            if last_event_id <= self.version:
+                return [event for event in self.recent if event.version > last_event_id]
+        events, _ = await asyncio.to_thread(load_events, last_event_id)
+        return events
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves a connection: parses the request, then streams the events to it."""
+        try:
+            request = await asyncio.wait_for(_read_request(reader), REQUEST_TIMEOUT)
+        except (
+            asyncio.TimeoutError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+            EOFError,
+            ValueError,
+        ):
+            writer.transport.abort()
+            return
+        method, path, query, headers = request
+        if path != STREAM_PATH:
+            await _respond(writer, b"404 Not Found")
+            return
+        if method != "GET":
+            await _respond(writer, b"405 Method Not Allowed")
+            return
+        last_event_id = (
+            headers.get("last-event-id") or query.get("last_event_id", [""])[0]
+        )
+
+        client = Client(writer)
+        # Registered first, so that no event published meanwhile is missed
+        self.clients.add(client)
+        try:
+            await self.stream(client, last_event_id)
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.transport.abort()
+
+    async def stream(self, client: Client, last_event_id: str):
+        """Sends the events missed since ``last_event_id``, then every new event."""
+        writer = client.writer
+        writer.write(RESPONSE_HEADERS + f"retry: {RETRY_MS}\n\n".encode())
+        if last_event_id.isdigit():
+            last_sent = int(last_event_id)
+            backlog = await self.missed_events(last_sent)
+        else:
+            last_sent = self.version
+            backlog = [Event.encode(last_sent, "hello", {"version": last_sent})]
+        for event in backlog:
+            writer.write(event.data)
+            last_sent = event.version
+        await writer.drain()
+        while not writer.is_closing():
+            try:
+                event = await asyncio.wait_for(client.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                writer.write(b": keep-alive\n\n")
+            else:
+                # Already sent with the backlog
+                if event.version <= last_sent:
+                    continue
+                writer.write(event.data)
+                last_sent = event.version
+            await writer.drain()
+
+    def observe_clients(self, options):
+        yield Observation(len(self.clients))
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple:
+    head = await reader.readuntil(b"\r\n\r\n")
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = request_line.split(" ", 2)
+    headers = dict()
+    for line in filter(None, header_lines):
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    return method, url.path, parse_qs(url.query), headers
+
+
+async def _respond(writer: asyncio.StreamWriter, status: bytes):
+    writer.write(
+        b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+    )
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, poll_interval: float = POLL_INTERVAL):
+    """Serves the stream until the process receives SIGINT or SIGTERM."""
+    broadcaster = Broadcaster(poll_interval)
+    meter.create_observable_gauge(
+        "dollar_data.stream.clients",
+        callbacks=[broadcaster.observe_clients],
+        description="Clients connected to the stream",
+    )
+    broadcaster.version = await asyncio.to_thread(read_version)
+    broadcaster.recent_since = broadcaster.version
+    server = await asyncio.start_server(broadcaster.handle, host, port, backlog=1024)
+    polling = asyncio.create_task(broadcaster.run())
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    logger.info("Streaming the rates on %s:%s%s", host, port, STREAM_PATH)
+    async with server:
+        await stop.wait()
+    polling.cancel()
+    for client in list(broadcaster.clients):
+        client.writer.transport.abort()
+
+
+def raise_open_files_limit(limit: int = MAX_OPEN_FILES) -> int:
+    """Raises the soft limit of open files to the hard one, every client holds a socket.
+
+    The hard limit may be unlimited or above what the kernel allows, so at most ``limit`` is
+    asked for. When the system refuses, the soft limit is kept.
+
+    :param limit: Most open files asked for.
+    :type limit: int
+    :return: The soft limit of open files.
+    :rtype: int
+    """
+    import resource
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return soft
+    wanted = limit if hard == resource.RLIM_INFINITY else min(hard, limit)
+    if wanted <= soft:
+        return soft
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    except (ValueError, OSError) as e:
+        logger.warning(
+            "Could not raise the limit of open files from %d to %d: %s", soft, wanted, e
+        )
+        return soft
+    return wanted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default=STREAM_BIND, help="host:port to listen on")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+    host, _, port = args.bind.rpartition(":")
+
+    from dollar_data.database import init_db
+    from dollar_data.logging import configure_logging
+    from dollar_data.metrics import configure_metrics
+
+    configure_metrics()
+    configure_logging()
+    raise_open_files_limit()
+    init_db()
+    asyncio.run(serve(host or "0.0.0.0", int(port), args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
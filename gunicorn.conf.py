@@ -1,4 +1,43 @@
+import os
+import subprocess
+import sys
+
 wsgi_app = "dollar_data.wsgi:app"
 bind = "0.0.0.0:8000"
 workers = 2
-preload_app = True
\ No newline at end of file
+preload_app = True
+# Requests that wait for a slower chart render answer 503 before, see CHART_RENDER_TIMEOUT
+timeout = 30
+
+# The scheduled jobs run in a single process next to the workers, unless they are run
+# somewhere else with ``python -m dollar_data.scheduler``. So does the event stream of the rates,
+# which holds its connections on an event loop instead of tying up a worker for each, unless it
+# is run with ``python -m dollar_data.web.stream``
+children = list()
+
+
+def when_ready(server):
+    for module, setting in (
+        ("dollar_data.scheduler", "DOLLAR_DATA_JOB_RUNNER"),
+        ("dollar_data.web.stream", "DOLLAR_DATA_STREAM"),
+    ):
+        if os.environ.get(setting) == "external":
+            continue
+        child = subprocess.Popen([sys.executable, "-m", module])
+        children.append(child)
+        server.log.info("Started %s (pid: %s)", module, child.pid)
+
+
+def post_fork(server, worker):
+    # The connections opened by the master while preloading the app must not be shared
+    from dollar_data.database import engine
+
+    engine.dispose(close=False)
+
+
+def on_exit(server):
+    for child in children:
+        if child.poll() is None:
+            child.terminate()
+    for child in children:
+        child.wait(timeout=30)
@@ -0,0 +1,147 @@
+"""Fixtures shared by the tests.
+
+Every setting that points to a file is moved to a temporary directory before dollar_data is
+imported, so the tests never touch the database, exports or site of the working directory.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="dollar_data-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'database.db')}"
+os.environ["EXPORT_DIR"] = os.path.join(TEST_DIR, "exports", "")
+os.environ["PUBLISH_DIR"] = os.path.join(TEST_DIR, "public", "")
+os.environ["OTEL_SDK_DISABLED"] = "true"
+
+# Currencies of the workbooks of the workbook fixture, with their rates in US dollars
+WORKBOOK_CURRENCIES = [
+    ("USD", "E.E.U.U.", 1.0),
+    ("EUR", "U.M.E.", 1.09),
+    ("CNY", "China", 0.14),
+    ("GBP", "Reino Unido", 1.27),
+]
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    from dollar_data.database import engine, init_db
+
+    init_db()
+    return engine
+
+
+@pytest.fixture
+def database(engine):
+    """The test database, emptied after the test.
+
+    The ``DataVersion`` stamp is bumped instead of being deleted, so that the caches of the
+    process do not serve the rows of a previous test.
+    """
+    from dollar_data.database import Base, db_session
+    from dollar_data.upsert import bump_data_version
+
+    yield engine
+    db_session.remove()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name != "DataVersion":
+                connection.execute(table.delete())
+        bump_data_version(connection)
+
+
+@pytest.fixture
+def serve():
+    """Starts HTTP servers on free local ports, in threads stopped after the test.
+
+    Called with a request handler class, returns the URL of the server.
+    """
+    servers = []
+
+    def start(handler) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def client(database):
+    """A test client of the web app, on the test database."""
+    from dollar_data.web.app import app
+
+    return app.test_client()
+
+
+@pytest.fixture
+def rates():
+    """Builds DataFrames of rates as returned by :func:`dollar_data.utils.read_rates`.
+
+    Called with the dates and the rates of every currency, ``{"USD": 36.0}`` by default. The
+    rate of a currency is either one value per date, or the first one, which goes up by
+    ``step`` every date. With a ``spread``, the ask is the bid plus the spread.
+    """
+
+    def build(dates, currencies=None, step=0.1, spread=None) -> pd.DataFrame:
+        dates = pd.DatetimeIndex(dates)
+        frames = list()
+        for currency, values in (currencies or {"USD": 36.0}).items():
+            if not np.ndim(values):
+                values = [values + i * step for i in range(len(dates))]
+            frame = pd.DataFrame(
+                {"Date": dates, "Currency": currency, "Buy(BS. S BID)": values}
+            )
+            if spread is not None:
+                frame["Sell(BS. S ASK)"] = frame["Buy(BS. S BID)"] + spread
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+
+    return build
+
+
+@pytest.fixture
+def workbook():
+    """Writes workbooks in the format of the BCV statistics page.
+
+    Called with the path, the date of the first sheet, how many sheets and how many currencies
+    per sheet. Every business day gets a sheet named after its date, with one row per currency
+    from row 10 on: code, country, USD bid and ask and bolívar bid and ask.
+    """
+    import xlwt
+
+    def write(path, start: datetime.date, days: int = 5, currencies: int = 3):
+        wb = xlwt.Workbook()
+        for i, date in enumerate(pd.bdate_range(start, periods=days).date):
+            sheet = wb.add_sheet(date.strftime("%d%m%Y"))
+            sheet.write(1, 1, "BANCO CENTRAL DE VENEZUELA")
+            sheet.write(4, 1, f"Fecha Valor: {date:%d/%m/%Y}")
+            sheet.write(8, 1, "Moneda")
+            sheet.write(8, 3, "Compra (BID) ME/USD")
+            sheet.write(8, 5, "Compra (BID) Bs./ME")
+            bolivar = 36.0 + i / 10
+            rows = WORKBOOK_CURRENCIES[:currencies]
+            for row, (code, country, usd) in enumerate(rows, start=10):
+                for column, value in enumerate(
+                    (code, country, usd, usd, bolivar * usd, bolivar * usd), start=1
+                ):
+                    sheet.write(row, column, value)
+            sheet.write(10 + len(rows) + 1, 1, "Fuente: BCV")
+        wb.save(str(path))
+
+    return write
@@ -0,0 +1,237 @@
+import datetime
+import json
+from http.server import BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import insert
+
+from dollar_data import alerts
+from dollar_data.alerts import AlertSender, Notification, crossings, evaluate_alerts
+from dollar_data.models import AlertSubscription
+from dollar_data.upsert import upsert_rates
+from dollar_data.web import api
+
+TOKEN = "secret"
+ALERT = {
+    "currency": "USD",
+    "kind": "level",
+    "direction": "above",
+    "threshold": 40.0,
+    "target": "https://example.com/hook",
+}
+
+
+def subscribe(database, kind, direction, threshold, window=None) -> int:
+    with database.begin() as connection:
+        return connection.execute(
+            insert(AlertSubscription).values(
+                currency="USD",
+                kind=kind,
+                direction=direction,
+                threshold=threshold,
+                window=window,
+                target="https://example.com/hook",
+                created_at=datetime.datetime.now(datetime.timezone.utc),
+            )
+        ).inserted_primary_key[0]
+
+
+def fired(notifications) -> list:
+    return [
+        (notification.subscription, notification.payload["date"])
+        for notification in notifications
+    ]
+
+
+def notification(target: str) -> Notification:
+    return Notification(1, target, {"subscription": 1})
+
+
+@pytest.fixture
+def results(monkeypatch):
+    """Records the result of every notification instead of counting it."""
+    recorded = []
+
+    class Counter:
+        def add(self, amount, attributes):
+            recorded.extend([attributes["result"]] * amount)
+
+    monkeypatch.setattr(alerts, "notifications_counter", Counter())
+    return recorded
+
+
+@pytest.fixture
+def webhook(serve):
+    """Serves a webhook answering with the given statuses in turn, then ``204``.
+
+    Returns its URL, the bodies it received are in the ``received`` attribute of the factory.
+    """
+    received = []
+
+    def start(*statuses) -> str:
+        answers = list(statuses)
+
+        class Webhook(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                received.append(json.loads(body))
+                self.send_response(answers.pop(0) if answers else 204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return f"{serve(Webhook)}/hook"
+
+    start.received = received
+    return start
+
+
+@pytest.mark.parametrize(
+    "direction, path, thresholds, expected",
+    [
+        ("above", [36.0, 36.5, 37.2, 36.8, 37.5], [36.2, 37.0, 38.0], [0, 1, -1]),
+        ("below", [38.0, 37.5, 36.1, 36.8, 35.0], [35.5, 36.5, 37.0], [3, 1, 1]),
+    ],
+)
+def test_crossings(direction, path, thresholds, expected):
+    steps = crossings(np.array(path), np.array(thresholds), direction)
+
+    assert steps.tolist() == expected
+
+
+def test_crossings_skip_missing_values():
+    path = np.array([np.nan, 37.0, np.nan, 38.0])
+
+    assert crossings(path, np.array([36.0, 37.5]), "above").tolist() == [-1, -1]
+
+
+def test_level_alerts_fire_once_per_crossing(database, rates):
+    above = subscribe(database, "level", "above", 37.0)
+    below = subscribe(database, "level", "below", 36.9)
+    upsert_rates(
+        rates(
+            pd.bdate_range("2024-01-02", periods=4), {"USD": [36.0, 36.5, 37.2, 36.8]}
+        ),
+        database,
+    )
+
+    notifications = evaluate_alerts({"USD": datetime.date(2024, 1, 2)})
+
+    assert fired(notifications) == [(above, "2024-01-04"), (below, "2024-01-05")]
+    assert notifications[0].payload["value"] == 37.2
+
+    # The rate before the new ones is the starting point, so a crossing is not missed
+    upsert_rates(
+        rates(pd.bdate_range("2024-01-08", periods=1), {"USD": [37.5]}), database
+    )
+    assert fired(evaluate_alerts({"USD": datetime.date(2024, 1, 8)})) == [
+        (above, "2024-01-08")
+    ]
+
+    # Staying past the threshold does not fire again
+    upsert_rates(
+        rates(pd.bdate_range("2024-01-09", periods=2), {"USD": [37.8, 38.1]}), database
+    )
+    assert evaluate_alerts({"USD": datetime.date(2024, 1, 9)}) == []
+
+
+def test_change_alerts_compare_with_the_start_of_the_window(database, rates):
+    daily = subscribe(database, "change", "above", 1.0, window=1)
+    two_days = subscribe(database, "change", "above", 1.0, window=2)
+    falling = subscribe(database, "change", "below", -1.0, window=1)
+    # From Friday 29 December 2023 to Monday 8 January 2024: +0.55 % a day, +1.1 % in two
+    # days, then -1.35 % from the Friday before
+    upsert_rates(
+        rates(
+            pd.bdate_range("2023-12-29", periods=7),
+            {"USD": [36.0, 36.2, 36.4, 36.6, 36.8, 37.0, 36.5]},
+        ),
+        database,
+    )
+
+    notifications = evaluate_alerts({"USD": datetime.date(2023, 12, 29)})
+
+    assert fired(notifications) == [(two_days, "2024-01-02"), (falling, "2024-01-08")]
+    assert daily not in {subscription for subscription, _ in fired(notifications)}
+    assert notifications[0].payload["window"] == 2
+    assert notifications[0].payload["value"] == pytest.approx(36.4 / 36.0 * 100 - 100)
+
+
+def test_sender_retries_server_errors(webhook, results):
+    url = webhook(500, 503)
+    sender = AlertSender(workers=1, retries=3, backoff=0.01)
+
+    assert sender.submit(notification(url))
+    sender.join()
+
+    assert webhook.received == [{"subscription": 1}] * 3
+    assert results == ["delivered"]
+
+
+def test_sender_gives_up(webhook, results):
+    sender = AlertSender(workers=1, retries=1, backoff=0.01)
+
+    # A client error is not retried, a server error only ``retries`` times
+    sender.submit(notification(webhook(400)))
+    sender.join()
+    sender.submit(notification(webhook(500, 500, 500)))
+    sender.join()
+
+    assert len(webhook.received) == 3
+    assert results == ["failed", "failed"]
+
+
+def test_sender_drops_notifications_when_the_queue_is_full(results):
+    # Without workers, nothing takes the notifications out of the queue
+    sender = AlertSender(workers=0, queue_size=2)
+
+    submitted = [sender.submit(notification("https://example.com")) for _ in range(3)]
+
+    assert submitted == [True, True, False]
+    assert sender.queue.qsize() == 2
+    assert results == ["dropped"]
+
+
+def test_alerts_are_disabled_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(api, "ALERTS_TOKEN", None)
+
+    response = client.post(
+        "/api/v1/alerts", json=ALERT, headers={"Authorization": f"Bearer {TOKEN}"}
+    )
+
+    assert response.status_code == 403
+    assert "disabled" in response.json["error"]
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong", f"Basic {TOKEN}"])
+def test_alerts_need_the_token(client, monkeypatch, authorization):
+    monkeypatch.setattr(api, "ALERTS_TOKEN", TOKEN)
+    headers = {"Authorization": authorization} if authorization else {}
+
+    response = client.post("/api/v1/alerts", json=ALERT, headers=headers)
+
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"].startswith("Bearer")
+    assert client.get("/api/v1/alerts/1", headers=headers).status_code == 401
+    assert client.delete("/api/v1/alerts/1", headers=headers).status_code == 401
+
+
+def test_manage_alerts(client, monkeypatch):
+    monkeypatch.setattr(api, "ALERTS_TOKEN", TOKEN)
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+
+    created = client.post("/api/v1/alerts", json=ALERT, headers=headers)
+    url = f"/api/v1/alerts/{created.json['id']}"
+
+    assert created.status_code == 201
+    assert client.get(url, headers=headers).json == created.json
+    assert client.delete(url, headers=headers).status_code == 204
+    assert client.get(url, headers=headers).status_code == 404
+    invalid = client.post(
+        "/api/v1/alerts", json={**ALERT, "kind": "x"}, headers=headers
+    )
+    assert invalid.status_code == 400
@@ -0,0 +1,128 @@
+import json
+
+import pandas as pd
+import pytest
+
+from dollar_data.analytics import refresh_aggregates
+from dollar_data.upsert import upsert_rates
+
+
+@pytest.fixture
+def year_end(database, rates):
+    # Both years share the week of Monday 2024-12-30
+    upsert_rates(rates(pd.bdate_range("2024-12-16", "2025-01-10")), database)
+    refresh_aggregates({"USD": "2024-12-16"})
+
+
+def test_weekly_rates_close_on_the_last_day_of_each_monday_week(client, year_end):
+    response = client.get("/api/v1/rates?resolution=weekly")
+
+    assert response.status_code == 200
+    dates = [point[0] for point in response.get_json()["points"]]
+    assert dates == ["2024-12-20", "2024-12-27", "2025-01-03", "2025-01-10"]
+
+
+def test_weekly_rates_match_the_weekly_aggregates(client, year_end):
+    rates = client.get("/api/v1/rates?resolution=weekly").get_json()
+    analytics = client.get("/api/v1/analytics?resolution=weekly").get_json()
+
+    columns = analytics["columns"]
+    periods = [dict(zip(columns, point)) for point in analytics["points"]]
+    assert [period["period_start"] for period in periods] == [
+        "2024-12-16",
+        "2024-12-23",
+        "2024-12-30",
+        "2025-01-06",
+    ]
+    assert [[period["period_end"], period["close"]] for period in periods] == [
+        [date, pytest.approx(close)] for date, close in rates["points"]
+    ]
+
+
+def test_chart_answers_503_while_the_render_is_too_slow(client, year_end, monkeypatch):
+    from dollar_data.charts import ChartRenderer
+    from dollar_data.web import api
+
+    # Starting the pool alone takes longer than that
+    renderer = ChartRenderer(max_workers=1, timeout=0.001)
+    monkeypatch.setattr(api, "chart_renderer", renderer)
+    try:
+        response = client.get("/api/v1/chart?format=svg")
+    finally:
+        renderer.shutdown()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(api.CHART_RETRY_AFTER)
+    assert response.get_json() == {"error": "The chart is still being rendered"}
+
+
+def test_chart_serves_the_render_that_timed_out_once_it_finished(
+    client, year_end, monkeypatch
+):
+    from dollar_data.charts import ChartRenderer
+    from dollar_data.web import api
+
+    renderer = ChartRenderer(max_workers=1, timeout=0.001)
+    monkeypatch.setattr(api, "chart_renderer", renderer)
+    try:
+        assert client.get("/api/v1/chart?format=svg").status_code == 503
+        ((future, _),) = renderer._pending.values()
+        future.result(timeout=60)
+
+        # A new render could not finish within the timeout, the first one is served
+        response = client.get("/api/v1/chart?format=svg")
+    finally:
+        renderer.shutdown()
+
+    assert response.status_code == 200
+    assert response.get_data() == future.result()
+    assert renderer._pending == {}
+
+
+def test_rates_export_streams_csv_and_ndjson(client, database, rates):
+    upsert_rates(rates(pd.bdate_range("2024-01-01", periods=3)), database)
+    upsert_rates(
+        rates(pd.bdate_range("2024-01-01", periods=2), {"EUR": 39.0}), database
+    )
+
+    csv_lines = client.get("/api/v1/rates/export?currency=usd").get_data(as_text=True)
+
+    assert csv_lines.splitlines() == [
+        "date,currency,buybid,sellask,usd_buybid,usd_sellask",
+        "2024-01-01,USD,36.0,,,",
+        "2024-01-02,USD,36.1,,,",
+        "2024-01-03,USD,36.2,,,",
+    ]
+    response = client.get("/api/v1/rates/export?format=ndjson&from=2024-01-02")
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row["currency"], row["date"]) for row in rows] == [
+        ("EUR", "2024-01-02"),
+        ("USD", "2024-01-02"),
+        ("USD", "2024-01-03"),
+    ]
+
+
+def test_rates_export_releases_its_connection_when_closed(
+    client, database, monkeypatch, rates
+):
+    from dollar_data.web import api
+
+    monkeypatch.setattr(api, "EXPORT_ROWS", 10)
+    upsert_rates(rates(pd.bdate_range("2020-01-01", periods=100)), database)
+    checked_out = database.pool.checkedout()
+
+    response = client.get("/api/v1/rates/export", buffered=False)
+    chunks = iter(response.response)
+    next(chunks), next(chunks)
+    assert database.pool.checkedout() == checked_out + 1
+    # What the server does when the client goes away
+    response.close()
+
+    assert database.pool.checkedout() == checked_out
+
+
+def test_index_opens_the_stream_on_its_own_port_by_default(client):
+    page = client.get("/").get_data(as_text=True)
+
+    assert "const streamUrl = null" in page
+    assert ":8001/api/v1/stream`" in page
@@ -0,0 +1,113 @@
+import datetime
+import functools
+from http.server import SimpleHTTPRequestHandler
+
+import pytest
+from sqlalchemy import text
+
+from dollar_data import backfill as backfill_module
+from dollar_data.backfill import backfill, list_workbook_urls, make_session
+from dollar_data.refresh import pending
+from dollar_data.upsert import UpsertResult
+
+DAYS = 5
+CURRENCIES = 3
+# Listing pages of the stand-in of the statistics page, newest workbooks first
+PAGES = [["2024-01-16.xls", "2024-01-09.xls"], ["2024-01-02.xls"]]
+LISTING = """<html><body>
+<div id="block-system-main"><div><div class="view-content"><table><tbody>
+{rows}
+</tbody></table></div></div></div>
+{pager}
+</body></html>"""
+ROW = (
+    '<tr><td class="views-field views-field-field-diario">'
+    '<span><a href="/workbooks/{name}">{name}</a></span></td></tr>'
+)
+PAGER = '<ul class="pager"><li class="pager-next"><a href="{href}">next</a></li></ul>'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def statistics_page(tmp_path, serve, workbook):
+    """Serves a paginated listing of workbooks, returns the URL of its first page."""
+    site = tmp_path / "site"
+    (site / "workbooks").mkdir(parents=True)
+    for page, names in enumerate(PAGES):
+        for name in names:
+            start = datetime.date.fromisoformat(name.removesuffix(".xls"))
+            workbook(site / "workbooks" / name, start, DAYS, CURRENCIES)
+        pager = (
+            PAGER.format(href=f"page{page + 1}.html") if page + 1 < len(PAGES) else ""
+        )
+        rows = "\n".join(ROW.format(name=name) for name in names)
+        (site / f"page{page}.html").write_text(LISTING.format(rows=rows, pager=pager))
+    url = serve(functools.partial(QuietHandler, directory=site))
+    return f"{url}/page0.html"
+
+
+def count_rates(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(
+            text('SELECT count(*) FROM "HistoricalDollar"')
+        ).scalar()
+
+
+def test_list_workbook_urls_follows_the_pager(statistics_page):
+    with make_session(retries=0) as session:
+        urls = list_workbook_urls(session, statistics_page)
+
+    base = statistics_page.removesuffix("page0.html")
+    assert urls == [f"{base}workbooks/{name}" for names in PAGES for name in names]
+
+
+def test_backfill_then_rerun(database, statistics_page, tmp_path):
+    rates = len(PAGES[0] + PAGES[1]) * DAYS * CURRENCIES
+
+    first = backfill(statistics_page, tmp_path / "cache", max_workers=2, processes=1)
+    second = backfill(statistics_page, tmp_path / "cache", max_workers=2, processes=1)
+
+    assert first == UpsertResult(inserted=rates)
+    # Workbooks already ingested are neither parsed nor written again
+    assert second == UpsertResult()
+    assert count_rates(database) == rates
+
+
+def test_interrupted_backfill_resumes(database, statistics_page, tmp_path, monkeypatch):
+    workbook_rates = DAYS * CURRENCIES
+    insert_into_database = backfill_module.insert_into_database
+    calls = []
+
+    def interrupted(df):
+        calls.append(len(df))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return insert_into_database(df)
+
+    monkeypatch.setattr(backfill_module, "insert_into_database", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        backfill(statistics_page, tmp_path / "cache", max_workers=2, processes=1)
+    assert count_rates(database) == workbook_rates
+
+    monkeypatch.setattr(backfill_module, "insert_into_database", insert_into_database)
+    resumed = backfill(statistics_page, tmp_path / "cache", max_workers=2, processes=1)
+
+    # Only the workbooks that were not written are parsed again
+    assert resumed == UpsertResult(inserted=2 * workbook_rates)
+    assert count_rates(database) == 3 * workbook_rates
+
+
+def test_backfill_skips_failed_downloads(database, statistics_page, tmp_path, caplog):
+    workbook_rates = DAYS * CURRENCIES
+    (tmp_path / "site" / "workbooks" / "2024-01-09.xls").unlink()
+
+    result = backfill(statistics_page, tmp_path / "cache", max_workers=2, processes=1)
+
+    assert result == UpsertResult(inserted=2 * workbook_rates)
+    assert "Skipping" in caplog.text and "2024-01-09.xls" in caplog.text
+    # The refreshes of the workbooks that were written still ran
+    assert pending("aggregates") == ({}, {})
@@ -0,0 +1,36 @@
+import datetime
+
+import pytest
+
+from dollar_data.charts import ChartRenderer, render_chart
+
+DATES = [datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)]
+VALUES = [36.0, 36.1]
+
+
+@pytest.fixture
+def renderer():
+    renderer = ChartRenderer(max_workers=1, timeout=60)
+    yield renderer
+    renderer.shutdown()
+
+
+def test_render_chart_is_reproducible():
+    png = render_chart(DATES, VALUES, "png")
+
+    assert png.startswith(b"\x89PNG")
+    assert render_chart(DATES, VALUES, "png") == png
+    with pytest.raises(ValueError):
+        render_chart(DATES, VALUES, "gif")
+
+
+def test_renderer_replaces_a_pool_whose_worker_died(renderer):
+    png = renderer.render("chart", DATES, VALUES, "png")
+    broken = renderer._executor
+    for process in list(broken._processes.values()):
+        process.kill()
+        process.join()
+
+    assert renderer.render("chart", DATES, VALUES, "png") == png
+    assert renderer._executor is not broken
+    assert renderer._pending == {}
@@ -0,0 +1,83 @@
+import pytest
+
+from dollar_data.convert import convert_many
+from dollar_data.upsert import upsert_rates
+
+
+@pytest.fixture
+def stored(database, rates):
+    upsert_rates(
+        rates(
+            ["2024-01-04", "2024-01-05", "2024-01-08"],
+            {"USD": [36.0, 36.2, 36.4], "EUR": [39.0, 39.5, 40.0]},
+        ),
+        database,
+    )
+
+
+def test_convert_uses_the_last_rate_published_before_the_date(client, stored):
+    response = client.get("/api/v1/convert?amount=100&currency=usd&date=2024-01-06")
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "amount": 100.0,
+        "currency": "USD",
+        "date": "2024-01-06",
+        "to": "VES",
+        "rate_date": "2024-01-05",
+        "rate": pytest.approx(36.2),
+        "result": pytest.approx(3620.0),
+    }
+
+
+def test_convert_between_two_currencies(stored):
+    (conversion,) = convert_many([390], ["EUR"], ["2024-01-04"], to="USD")
+
+    assert conversion.result == pytest.approx(390 * 39.0 / 36.0)
+
+
+def test_convert_without_a_rate_on_the_date(client, stored):
+    response = client.get("/api/v1/convert?date=2024-01-03")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("amount", ["nan", "inf", "-inf", "ten"])
+def test_convert_rejects_amounts_that_are_not_finite(client, stored, amount):
+    response = client.get(f"/api/v1/convert?amount={amount}")
+
+    assert response.status_code == 400
+
+
+def test_convert_batch(client, stored):
+    response = client.post(
+        "/api/v1/convert",
+        json={
+            "conversions": [[100, "USD", "2024-01-06"], [1, "EUR", "2024-01-01"]],
+        },
+    )
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["conversions"][0][3:] == ["2024-01-05", 36.2, pytest.approx(3620.0)]
+    assert body["conversions"][1] == [1.0, "EUR", "2024-01-01", None, None, None]
+
+
+@pytest.mark.parametrize(
+    "conversion",
+    [
+        [100, "USD", "NaT"],
+        [100, "USD", "2024"],
+        [100, "USD", "2024-01"],
+        [100, "USD", 20240106],
+        [float("nan"), "USD", "2024-01-06"],
+        ["1e999", "USD", "2024-01-06"],
+    ],
+)
+def test_convert_batch_rejects_invalid_conversions(client, stored, conversion):
+    response = client.post(
+        "/api/v1/convert",
+        json={"conversions": [[100, "USD", "2024-01-06"], conversion]},
+    )
+
+    assert response.status_code == 400
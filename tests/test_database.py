@@ -0,0 +1,70 @@
+import logging
+
+from sqlalchemy import text
+
+from dollar_data.database import (
+    REJECTED_TABLE,
+    Base,
+    _rebuild_legacy_dollar_table,
+    create_db_engine,
+)
+from dollar_data.models import Dollar
+from dollar_data.upsert import REFRESH_STEPS
+
+LEGACY_ROWS = [
+    (1, "2024-01-02 00:00:00", "USD", 36.1),
+    (2, "2024-01-03", "USD", 36.2),
+    (3, "not a date", "USD", 36.3),
+    # Appended later, replaces the first row
+    (4, "2024-01-02", "USD", 36.4),
+    (5, "2023-12-29T00:00:00", "EUR", 39.5),
+]
+
+
+def test_rebuild_legacy_dollar_table(caplog):
+    legacy_engine = create_db_engine("sqlite://")
+    with legacy_engine.begin() as connection:
+        connection.execute(
+            text(
+                'CREATE TABLE "HistoricalDollar" '
+                "(id INTEGER PRIMARY KEY, date TEXT, currency TEXT, buybid REAL)"
+            )
+        )
+        connection.execute(
+            text(
+                'INSERT INTO "HistoricalDollar" VALUES (:id, :date, :currency, :buybid)'
+            ),
+            [
+                dict(zip(("id", "date", "currency", "buybid"), row))
+                for row in LEGACY_ROWS
+            ],
+        )
+        # The tables of the model that did not exist, migrate_db creates them first
+        Base.metadata.create_all(bind=connection)
+        with caplog.at_level(logging.WARNING, logger="dollar_data.database"):
+            _rebuild_legacy_dollar_table(connection, Dollar.__table__)
+
+        rows = connection.execute(
+            text(
+                'SELECT date, currency, buybid, day, period FROM "HistoricalDollar" ORDER BY date'
+            )
+        ).all()
+        rejected = connection.execute(
+            text(f'SELECT id, date FROM "{REJECTED_TABLE}"')
+        ).all()
+        pending = connection.execute(
+            text('SELECT step, currency, since FROM "PendingRefresh"')
+        ).all()
+
+    assert [tuple(row) for row in rows] == [
+        ("2023-12-29", "EUR", 39.5, 29, "2023-12"),
+        ("2024-01-02", "USD", 36.4, 2, "2024-01"),
+        ("2024-01-03", "USD", 36.2, 3, "2024-01"),
+    ]
+    assert [tuple(row) for row in rejected] == [(3, "not a date")]
+    assert sorted(tuple(row) for row in pending) == sorted(
+        (step, currency, since)
+        for step in REFRESH_STEPS
+        for currency, since in (("EUR", "2023-12-29"), ("USD", "2024-01-02"))
+    )
+    assert "1 rows of HistoricalDollar have no valid date" in caplog.text
@@ -0,0 +1,66 @@
+from http.server import BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from dollar_data.downloads import DownloadCache
+
+WORKBOOK = b"workbook"
+ETAG = '"v1"'
+
+
+@pytest.fixture
+def workbook_server(serve):
+    """Serves a workbook with an ETag.
+
+    Returns its ``url`` and the headers of every request, in ``received``. The workbook is
+    answered with ``304 Not Modified`` to the requests with its ETag, or to every request once
+    ``not_modified`` is set.
+    """
+    server = SimpleNamespace(received=[], not_modified=False)
+
+    class Workbook(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.received.append(dict(self.headers))
+            if server.not_modified or self.headers["If-None-Match"] == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(WORKBOOK)))
+            self.end_headers()
+            self.wfile.write(WORKBOOK)
+
+        def log_message(self, format, *args):
+            pass
+
+    server.url = f"{serve(Workbook)}/2_1_2a24_smc.xls"
+    return server
+
+
+def test_fetch_revalidates_the_cached_workbook(workbook_server, tmp_path):
+    cache = DownloadCache(tmp_path)
+
+    first = cache.fetch(workbook_server.url)
+    cache.mark_processed(first)
+    second = cache.fetch(workbook_server.url)
+
+    received = workbook_server.received
+    assert "If-None-Match" not in received[0]
+    assert received[1]["If-None-Match"] == ETAG
+    assert first.changed and not second.changed
+    assert second.path == first.path
+    with open(second.path, "rb") as f:
+        assert f.read() == WORKBOOK
+
+
+def test_fetch_rejects_not_modified_without_a_cached_workbook(
+    workbook_server, tmp_path
+):
+    workbook_server.not_modified = True
+
+    with pytest.raises(requests.HTTPError, match="304"):
+        DownloadCache(tmp_path).fetch(workbook_server.url)
+    assert "If-None-Match" not in workbook_server.received[0]
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from dollar_data.export import export_rates, iter_ipc_stream, read_currency
+from dollar_data.upsert import upsert_rates
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def exported(database, rates):
+    dates = pd.bdate_range("2024-01-01", periods=300)
+    upsert_rates(rates(dates, {"USD": 36.0}, step=0.01), database)
+    upsert_rates(rates(dates[:100], {"EUR": 39.0}, step=0.01), database)
+    export_rates()
+
+
+def test_read_currency_gives_the_batch_of_the_currency(exported):
+    with read_currency("EUR") as batch:
+        assert batch.num_rows == 100
+        assert batch.column("buybid")[0].as_py() == pytest.approx(39.0)
+    with read_currency("JPY") as batch:
+        assert batch is None
+
+
+def test_iter_ipc_stream_is_chunked(exported):
+    with read_currency("USD") as batch:
+        chunks = list(iter_ipc_stream(batch, chunk_size=1024))
+        expected = batch.to_pydict()
+
+    assert max(len(chunk) for chunk in chunks) == 1024
+    assert pa.ipc.open_stream(b"".join(chunks)).read_all().to_pydict() == expected
+
+
+def test_export_snapshot_of_a_currency(client, exported):
+    response = client.get("/api/v1/export/rates.arrow?currency=usd")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.get_data()).read_all()
+    assert table.num_rows == 300
+    assert set(table.column("currency").to_pylist()) == {"USD"}
+
+    assert client.get("/api/v1/export/rates.arrow?currency=JPY").status_code == 404
@@ -0,0 +1,37 @@
+import json
+import os
+import stat
+
+import pytest
+
+from dollar_data.files import replace, write_json
+
+
+def test_write_json_replaces_the_file(tmp_path):
+    path = tmp_path / "feeds" / "index.json"
+
+    write_json(str(path), {"version": 1})
+    write_json(str(path), {"version": 2}, separators=(",", ":"))
+
+    assert path.read_text() == '{"version":2}'
+    assert os.listdir(path.parent) == ["index.json"]
+    # Readable by the other users, e.g. the web server, like any file written with open()
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+
+
+def test_replace_keeps_the_previous_file_when_the_write_fails(tmp_path):
+    path = tmp_path / "manifest.json"
+    write_json(str(path), {"version": 1})
+
+    def write(tmp):
+        with open(tmp, "w") as f:
+            f.write("{")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        replace(str(path), write)
+
+    assert json.loads(path.read_text()) == {"version": 1}
+    assert os.listdir(tmp_path) == ["manifest.json"]
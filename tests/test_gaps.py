@@ -0,0 +1,164 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from dollar_data import gaps, refresh
+from dollar_data.gaps import (
+    MAX_ATTEMPTS,
+    GapReport,
+    detect_gaps,
+    easter,
+    heal_gaps,
+    holidays,
+    record_gaps,
+    workbook_quarter,
+)
+from dollar_data.models import DataGap
+from dollar_data.refresh import pending
+from dollar_data.upsert import upsert_rates
+
+MISSING = datetime.date(2024, 1, 10)
+
+
+def business_days(start: str, end: str, skip=()) -> list:
+    return [day for day in pd.bdate_range(start, end).date if day not in skip]
+
+
+def report(*days) -> GapReport:
+    return GapReport(
+        gaps={"USD": np.array(days, dtype="datetime64[D]")} if days else {}
+    )
+
+
+def gap_rows() -> dict:
+    with gaps.engine.connect() as connection:
+        rows = connection.execute(
+            select(DataGap.date, DataGap.attempts, DataGap.resolved_at)
+        ).all()
+    return {
+        day: (attempts, resolved_at is not None) for day, attempts, resolved_at in rows
+    }
+
+
+def test_easter():
+    assert easter([2000, 2024, 2025]).tolist() == [
+        datetime.date(2000, 4, 23),
+        datetime.date(2024, 3, 31),
+        datetime.date(2025, 4, 20),
+    ]
+
+
+def test_holidays_include_carnival_and_holy_week():
+    days = set(holidays(2024, 2024).tolist())
+
+    assert {
+        datetime.date(2024, 1, 1),
+        datetime.date(2024, 2, 12),
+        datetime.date(2024, 2, 13),
+        datetime.date(2024, 3, 28),
+        datetime.date(2024, 3, 29),
+        datetime.date(2024, 12, 25),
+    } <= days
+    assert datetime.date(2024, 3, 31) not in days
+
+
+def test_workbook_quarter():
+    assert workbook_quarter("https://www.bcv.org.ve/x/2_1_2c24_smc.xls") == (2024, 3)
+    assert workbook_quarter("https://www.bcv.org.ve/x/2_1_2A09_SMC.xls") == (2009, 1)
+    assert workbook_quarter("https://www.bcv.org.ve/x/other.xls") is None
+
+
+def test_detect_gaps(database, rates):
+    # 2024-01-01 is a holiday and the 6th and 7th a weekend, neither is a gap
+    upsert_rates(
+        rates(business_days("2024-01-02", "2024-01-12", skip={MISSING}), step=0),
+        database,
+    )
+    upsert_rates(
+        rates(business_days("2024-01-02", "2024-01-05"), {"EUR": 36.0}), database
+    )
+
+    found = detect_gaps(today=datetime.date(2024, 1, 16))
+
+    assert found.pairs() == {("USD", MISSING)}
+    # Business days after the last rate, up to the day of the check
+    assert found.staleness == {"EUR": 7, "USD": 2}
+
+
+def test_detect_gaps_without_rates(database):
+    assert detect_gaps() == GapReport()
+
+
+def test_record_gaps_gives_up_after_max_attempts(database):
+    assert record_gaps(report(MISSING)) == {("USD", MISSING)}
+    for _ in range(MAX_ATTEMPTS - 1):
+        assert record_gaps(report(MISSING), attempted={("USD", MISSING)})
+
+    assert record_gaps(report(MISSING), attempted={("USD", MISSING)}) == set()
+    assert gap_rows() == {MISSING: (MAX_ATTEMPTS, False)}
+
+
+def test_record_gaps_resolves_and_reopens(database):
+    record_gaps(report(MISSING))
+    record_gaps(report(MISSING), attempted={("USD", MISSING)})
+
+    assert record_gaps(report()) == set()
+    assert gap_rows() == {MISSING: (1, True)}
+
+    # A reopened gap keeps its attempts
+    assert record_gaps(report(MISSING)) == {("USD", MISSING)}
+    assert gap_rows() == {MISSING: (1, False)}
+
+
+def test_heal_gaps_records_the_gaps_when_a_refresh_fails(database, monkeypatch, rates):
+    upsert_rates(
+        rates(business_days("2024-01-02", "2024-01-12", skip={MISSING}), step=0),
+        database,
+    )
+    refresh.run_pending()
+    fetched = []
+
+    def refetch_workbooks(days, url, cache):
+        fetched.extend(days)
+        upsert_rates(rates([MISSING]), database)
+        return {"USD": pd.Timestamp(MISSING)}
+
+    def fail(since):
+        raise RuntimeError("export failed")
+
+    monkeypatch.setattr(gaps, "refetch_workbooks", refetch_workbooks)
+    monkeypatch.setitem(refresh.STEPS, "export", ("export", fail))
+
+    healed = heal_gaps()
+
+    assert fetched == [MISSING]
+    assert healed.gaps == {}
+    assert gap_rows() == {MISSING: (0, True)}
+    # The failed step is left to the next run, the others are done
+    assert pending("export")[0] == {"USD": pd.Timestamp(MISSING)}
+    assert pending("aggregates")[0] == {}
+
+
+@pytest.mark.parametrize("attempts", [1, MAX_ATTEMPTS])
+def test_heal_gaps_counts_the_attempts(database, monkeypatch, rates, attempts):
+    upsert_rates(
+        rates(business_days("2024-01-02", "2024-01-12", skip={MISSING}), step=0),
+        database,
+    )
+    refresh.run_pending()
+    fetched = []
+
+    def refetch_workbooks(days, url, cache):
+        fetched.append(days)
+        return {}
+
+    monkeypatch.setattr(gaps, "refetch_workbooks", refetch_workbooks)
+    for _ in range(attempts + 1):
+        heal_gaps()
+
+    # The gap is not fetched again once it used all its attempts
+    assert len(fetched) == min(attempts + 1, MAX_ATTEMPTS)
+    assert gap_rows() == {MISSING: (min(attempts + 1, MAX_ATTEMPTS), False)}
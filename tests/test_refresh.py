@@ -0,0 +1,143 @@
+import datetime
+import threading
+import time
+
+import pandas as pd
+import pytest
+from sqlalchemy import func, select
+
+from dollar_data import jobs, refresh
+from dollar_data.analytics import refresh_aggregates
+from dollar_data.database import db_session
+from dollar_data.downloads import Download, DownloadCache
+from dollar_data.models import PendingRefresh, RateAggregate
+from dollar_data.refresh import pending, run_pending
+from dollar_data.upsert import REFRESH_STEPS, upsert_rates
+
+
+def count_aggregates() -> int:
+    return db_session.execute(select(func.count()).select_from(RateAggregate)).scalar()
+
+
+@pytest.fixture
+def week(rates):
+    """Builds the USD and EUR rates of the five business days from ``start``."""
+    return lambda start: rates(
+        pd.bdate_range(start, periods=5), {"USD": 36.0, "EUR": 36.5}
+    )
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    """Replaces every step with one that records its calls, returns the calls by step."""
+    calls = {step: [] for step in refresh.STEPS}
+    for step, (stage_name, _) in refresh.STEPS.items():
+        monkeypatch.setitem(refresh.STEPS, step, (stage_name, calls[step].append))
+    return calls
+
+
+def test_writes_leave_the_oldest_date_pending(database, week):
+    upsert_rates(week("2024-03-04"), database)
+    upsert_rates(week("2024-02-05"), database)
+    upsert_rates(week("2024-03-11"), database)
+
+    for step in REFRESH_STEPS:
+        since, _ = pending(step)
+        assert since == {
+            "USD": pd.Timestamp("2024-02-05"),
+            "EUR": pd.Timestamp("2024-02-05"),
+        }
+    assert pending("alerts") == ({}, {})
+
+
+def test_skipped_writes_leave_nothing_pending(database, week, steps):
+    upsert_rates(week("2024-03-04"), database)
+    assert run_pending() == []
+
+    upsert_rates(week("2024-03-04"), database)
+
+    assert db_session.execute(select(PendingRefresh)).all() == []
+
+
+def test_run_pending_keeps_the_failed_steps(database, week, steps, monkeypatch):
+    def fail(since):
+        raise OSError("disk full")
+
+    monkeypatch.setitem(refresh.STEPS, "publish", ("publish", fail))
+    upsert_rates(week("2024-03-04"), database, refresh=("aggregates", "publish"))
+
+    assert run_pending() == ["publish"]
+    assert len(steps["aggregates"]) == 1
+    assert pending("aggregates") == ({}, {})
+    assert set(pending("publish")[0]) == {"USD", "EUR"}
+
+
+def test_run_pending_keeps_the_refreshes_recorded_meanwhile(
+    database, week, monkeypatch
+):
+    def write_meanwhile(since):
+        upsert_rates(week("2024-01-08"), database, refresh=("aggregates",))
+
+    monkeypatch.setitem(refresh.STEPS, "aggregates", ("aggregate", write_meanwhile))
+    upsert_rates(week("2024-03-04"), database, refresh=("aggregates",))
+
+    assert run_pending() == []
+    since, _ = pending("aggregates")
+    assert since["USD"] == pd.Timestamp("2024-01-08")
+
+
+def test_run_pending_runs_one_at_a_time(database, week, monkeypatch):
+    running, overlaps, started = [], [], threading.Event()
+
+    def slow(since):
+        overlaps.append(bool(running))
+        running.append(since)
+        started.set()
+        time.sleep(0.3)
+        running.pop()
+
+    monkeypatch.setitem(refresh.STEPS, "aggregates", ("aggregate", slow))
+    upsert_rates(week("2024-03-04"), database, refresh=("aggregates",))
+    first = threading.Thread(target=run_pending)
+    first.start()
+    started.wait()
+
+    # Another thread of the same process does not take the lease while the first one runs
+    assert run_pending(wait=0) == ["aggregates"]
+    upsert_rates(week("2024-03-11"), database, refresh=("aggregates",))
+    assert run_pending(wait=5) == []
+    first.join()
+
+    assert overlaps == [False, False]
+    assert pending("aggregates") == ({}, {})
+
+
+def test_update_database_refreshes_what_a_failed_run_left(
+    database, steps, tmp_path, monkeypatch, workbook
+):
+    path = tmp_path / "workbook.xls"
+    workbook(path, datetime.date(2024, 3, 4), days=5, currencies=3)
+    cache = DownloadCache(tmp_path / "cache")
+
+    def fetch_latest_workbook(cache):
+        changed = "workbook" not in cache.manifest["processed"]
+        return Download("http://bcv/workbook.xls", path, "workbook", changed)
+
+    def fail(since):
+        raise OSError("database is locked")
+
+    monkeypatch.setattr(jobs, "DownloadCache", lambda: cache)
+    monkeypatch.setattr(jobs, "fetch_latest_workbook", fetch_latest_workbook)
+    monkeypatch.setitem(refresh.STEPS, "aggregates", ("aggregate", fail))
+
+    with pytest.raises(RuntimeError, match="aggregates"):
+        jobs.update_database()
+    assert count_aggregates() == 0
+
+    # The retry finds the workbook unchanged, the refresh it left is still run
+    monkeypatch.setitem(refresh.STEPS, "aggregates", ("aggregate", refresh_aggregates))
+    jobs.update_database()
+
+    assert count_aggregates() > 0
+    assert pending("aggregates") == ({}, {})
+    assert len(steps["export"]) == len(steps["alerts"]) == 1
@@ -0,0 +1,49 @@
+import resource
+
+import pytest
+
+from dollar_data.web import stream
+from dollar_data.web.stream import raise_open_files_limit
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Replaces the limits of open files of the process, returns the ones set."""
+    current = {}
+    requested = []
+
+    def setrlimit(kind, limits):
+        requested.append(limits)
+        if limits[0] > current["allowed"]:
+            raise ValueError("not allowed to raise maximum limit")
+
+    monkeypatch.setattr(resource, "getrlimit", lambda kind: current["limits"])
+    monkeypatch.setattr(resource, "setrlimit", setrlimit)
+
+    def set_limits(soft, hard, allowed=stream.MAX_OPEN_FILES):
+        current.update(limits=(soft, hard), allowed=allowed)
+        return requested
+
+    return set_limits
+
+
+def test_raise_open_files_limit_to_the_hard_limit(limits):
+    requested = limits(1024, 4096)
+
+    assert raise_open_files_limit() == 4096
+    assert requested == [(4096, 4096)]
+
+
+def test_raise_open_files_limit_without_a_hard_limit(limits):
+    requested = limits(1024, resource.RLIM_INFINITY)
+
+    assert raise_open_files_limit() == stream.MAX_OPEN_FILES
+    assert requested == [(stream.MAX_OPEN_FILES, resource.RLIM_INFINITY)]
+
+
+def test_raise_open_files_limit_keeps_the_soft_limit_when_refused(limits, caplog):
+    requested = limits(1024, 4096, allowed=2048)
+
+    assert raise_open_files_limit() == 1024
+    assert requested == [(4096, 4096)]
+    assert "Could not raise the limit of open files" in caplog.text
@@ -0,0 +1,91 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from dollar_data.upsert import (
+    UpsertResult,
+    _change_parameters,
+    _upsert_generic,
+    _upsert_sqlite,
+    to_records,
+    upsert_rates,
+)
+
+
+@pytest.fixture
+def sample(rates):
+    """Builds the USD and EUR bids and asks of the business days from 2024-01-01."""
+    return lambda days=5: rates(
+        pd.bdate_range("2024-01-01", periods=days),
+        {"USD": 36.0, "EUR": 36.05},
+        step=0.01,
+        spread=0.1,
+    )
+
+
+def write(df: pd.DataFrame, engine, writer) -> UpsertResult:
+    # What upsert_rates does, with the path of the other backends on SQLite too
+    changes = _change_parameters("rates", {"USD": "2024-01-01"})
+    changed, inserted = writer(engine, to_records(df), changes)
+    return UpsertResult(inserted, changed - inserted, len(df) - changed)
+
+
+def test_upsert_rates_is_idempotent(database, sample):
+    df = sample()
+
+    assert upsert_rates(df, database) == UpsertResult(inserted=10)
+    assert upsert_rates(df, database) == UpsertResult(skipped=10)
+
+    with database.connect() as connection:
+        count = connection.execute(
+            text('SELECT count(*) FROM "HistoricalDollar"')
+        ).scalar()
+    assert count == 10
+
+
+def test_upsert_rates_counts_changed_rates_as_updated(database, sample):
+    upsert_rates(sample(), database)
+    df = sample()
+    df.loc[[0, 7], "Buy(BS. S BID)"] += 1
+
+    assert upsert_rates(df, database) == UpsertResult(updated=2, skipped=8)
+
+    with database.connect() as connection:
+        buybid = connection.execute(
+            text(
+                'SELECT buybid FROM "HistoricalDollar" '
+                "WHERE currency = 'USD' AND date = '2024-01-01'"
+            )
+        ).scalar()
+    assert buybid == pytest.approx(37.0)
+
+
+def test_upsert_rates_bumps_the_version_only_on_changes(database, sample):
+    def version():
+        with database.connect() as connection:
+            return connection.execute(
+                text('SELECT version FROM "DataVersion" WHERE id = 1')
+            ).scalar()
+
+    upsert_rates(sample(), database)
+    written = version()
+    upsert_rates(sample(), database)
+
+    assert version() == written
+
+
+def test_upsert_rates_rejects_missing_columns(database, sample):
+    with pytest.raises(KeyError):
+        upsert_rates(sample().drop(columns="Currency"), database)
+
+
+@pytest.mark.parametrize("writer", [_upsert_sqlite, _upsert_generic])
+def test_sqlite_and_generic_paths_count_alike(database, sample, writer):
+    changed = sample()
+    changed.loc[[1, 2, 3], "Sell(BS. S ASK)"] = None
+    grown = pd.concat([changed, sample(days=6).tail(1)])
+
+    assert write(sample(), database, writer) == UpsertResult(inserted=10)
+    assert write(sample(), database, writer) == UpsertResult(skipped=10)
+    assert write(changed, database, writer) == UpsertResult(updated=3, skipped=7)
+    assert write(grown, database, writer) == UpsertResult(inserted=1, skipped=10)